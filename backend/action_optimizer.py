@@ -0,0 +1,253 @@
+from carbon_calculator import calculate_total_footprint, load_factor_index
+from scenario_engine import compile_action_set
+
+# Parameter range used for electricity reductions in the default catalog
+ELECTRICITY_PERCENT_LEVELS = range(5, 55, 5)
+
+# Default effort of a transport or diet change in the default catalog
+CHANGE_EFFORT = 2
+
+# Tolerance used when comparing reductions of equivalent portfolios
+_EPSILON = 1e-9
+
+
+def build_action_catalog(index=None):
+    """
+    Builds the default catalog of parameterized actions from the
+    emission factor index: every electricity reduction level in
+    ELECTRICITY_PERCENT_LEVELS and a switch to every known transport
+    mode and diet type.
+
+    Each action carries an "effort" (default 1 when absent). Electricity
+    reductions cost one effort point per 10%.
+    """
+    if index is None:
+        index = load_factor_index()
+
+    catalog = [
+        {"type": "reduce_electricity", "percent": percent, "effort": percent / 10}
+        for percent in ELECTRICITY_PERCENT_LEVELS
+    ]
+
+    for category, sub_category in sorted(index):
+        if category == "transport":
+            catalog.append({
+                "type": "change_transport",
+                "new_mode": sub_category,
+                "effort": CHANGE_EFFORT
+            })
+
+        elif category == "food":
+            catalog.append({
+                "type": "change_diet",
+                "new_diet": sub_category,
+                "effort": CHANGE_EFFORT
+            })
+
+    return catalog
+
+
+def _action_group(action):
+    """
+    Actions in the same group are mutually exclusive.
+
+    Transport and diet changes override each other, so each forms a single
+    group. Electricity reductions compound; levels of the same lever share
+    the "group" key (default: all reduce_electricity levels are one lever).
+    """
+    if action.get("type") == "reduce_electricity":
+        return ("reduce_electricity", action.get("group", "reduce_electricity"))
+
+    return (action.get("type"),)
+
+
+def _pareto_prune(states, track_effort, track_count):
+    """
+    Removes dominated states.
+
+    states: list of (effort, count, reduction, actions)
+    A state is dominated when another state has no more effort, no more
+    actions and at least the same reduction. Dimensions that are neither
+    optimized nor constrained are ignored so they do not block pruning.
+    """
+    def key(state):
+        return (
+            state[0] if track_effort else 0,
+            state[1] if track_count else 0,
+            -state[2]
+        )
+
+    states.sort(key=key)
+
+    kept = []
+    # best[c]: highest reduction kept so far using c actions
+    best = {}
+
+    for state in states:
+        count = state[1] if track_count else 0
+        reduction = state[2]
+
+        if any(value >= reduction - _EPSILON
+               for c, value in best.items() if c <= count):
+            continue
+
+        kept.append(state)
+        best[count] = reduction
+
+    return kept
+
+
+def _feasible(effort, count, max_effort, max_actions):
+    if max_effort is not None and effort > max_effort + _EPSILON:
+        return False
+    if max_actions is not None and count > max_actions:
+        return False
+    return True
+
+
+def optimize_action_portfolio(
+    user_input,
+    catalog=None,
+    cost="actions",
+    max_actions=None,
+    max_effort=None,
+    allowed_types=None
+):
+    """
+    Finds the Pareto frontier of CO2 reduction versus cost over
+    combinations of catalog actions.
+
+    cost: "actions" (number of actions) or "effort" (sum of action efforts)
+    max_actions / max_effort: user constraints on the portfolio
+    allowed_types: optional collection of action types the user accepts
+
+    The footprint is separable by category, so each category's frontier
+    is built independently (dynamic programming over exclusive groups,
+    pruning dominated and infeasible partial portfolios) and the category
+    frontiers are then merged pairwise, again pruning after each merge.
+    No combination is enumerated exhaustively.
+
+    Returns:
+    {
+        "before": original_total,
+        "frontier": [
+            {
+                "actions": [action, ...],
+                "num_actions": int,
+                "effort": float,
+                "reduction": float,
+                "after": float
+            },
+            ...
+        ]
+    }
+    sorted by increasing cost.
+    """
+    if cost not in ("actions", "effort"):
+        raise ValueError(f"Unsupported cost: {cost}")
+
+    index = load_factor_index()
+
+    if catalog is None:
+        catalog = build_action_catalog(index)
+
+    if allowed_types is not None:
+        catalog = [action for action in catalog if action.get("type") in allowed_types]
+
+    baseline = calculate_total_footprint(user_input)
+
+    track_effort = cost == "effort" or max_effort is not None
+    track_count = cost == "actions" or max_actions is not None
+
+    # Group actions and resolve their factors once
+    groups = {}
+
+    for action in catalog:
+        effect = compile_action_set([action], index)
+        effort = float(action.get("effort", 1))
+        groups.setdefault(_action_group(action), []).append((action, effort, effect))
+
+    empty = [(0.0, 0, 0.0, ())]
+
+    # Electricity: reductions compound across groups, so the DP tracks the
+    # remaining consumption multiplier of each partial portfolio
+    electricity_states = [(0.0, 0, 1.0, ())]
+
+    for group_key, options in groups.items():
+        if group_key[0] != "reduce_electricity":
+            continue
+
+        candidates = list(electricity_states)
+
+        for effort, count, multiplier, actions in electricity_states:
+            for action, action_effort, effect in options:
+                new_effort = effort + action_effort
+                new_count = count + 1
+
+                if _feasible(new_effort, new_count, max_effort, max_actions):
+                    candidates.append(
+                        (new_effort, new_count, multiplier * effect[0], actions + (action,))
+                    )
+
+        scored = [
+            (effort, count, baseline["electricity"] * (1 - multiplier), (multiplier, actions))
+            for effort, count, multiplier, actions in candidates
+        ]
+
+        electricity_states = [
+            (effort, count, payload[0], payload[1])
+            for effort, count, _, payload in _pareto_prune(scored, track_effort, track_count)
+        ]
+
+    frontiers = [[
+        (effort, count, baseline["electricity"] * (1 - multiplier), actions)
+        for effort, count, multiplier, actions in electricity_states
+    ]]
+
+    # Transport and diet: at most one change each
+    override_categories = (
+        ("change_transport", "transport", user_input["transport_km"], 1),
+        ("change_diet", "food", user_input["meals_per_month"], 2)
+    )
+
+    for action_type, category, quantity, effect_slot in override_categories:
+        states = list(empty)
+
+        for action, effort, effect in groups.get((action_type,), []):
+            reduction = baseline[category] - quantity * effect[effect_slot]
+
+            if reduction > _EPSILON and _feasible(effort, 1, max_effort, max_actions):
+                states.append((effort, 1, reduction, (action,)))
+
+        frontiers.append(_pareto_prune(states, track_effort, track_count))
+
+    # Merge category frontiers
+    combined = empty
+
+    for frontier in frontiers:
+        merged = [
+            (a[0] + b[0], a[1] + b[1], a[2] + b[2], a[3] + b[3])
+            for a in combined
+            for b in frontier
+            if _feasible(a[0] + b[0], a[1] + b[1], max_effort, max_actions)
+        ]
+        combined = _pareto_prune(merged, track_effort, track_count)
+
+    # Project onto the requested cost dimension
+    combined = _pareto_prune(combined, cost == "effort", cost == "actions")
+
+    before = baseline["total"]
+
+    return {
+        "before": before,
+        "frontier": [
+            {
+                "actions": list(actions),
+                "num_actions": count,
+                "effort": effort,
+                "reduction": reduction,
+                "after": before - reduction
+            }
+            for effort, count, reduction, actions in combined
+        ]
+    }
@@ -0,0 +1,128 @@
+"""
+Compares sync and async database modes for /calculate and the history
+endpoint by driving the app in-process with concurrent requests.
+
+Each mode runs in its own subprocess because DB_ASYNC is read at import
+time. Without --database-url a fresh SQLite file is used per mode
+(pysqlite for sync, aiosqlite for async).
+
+    python backend/benchmarks/db_modes.py --requests 500 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FOOTPRINT = {
+    "name": "Bench",
+    "electricity_kwh": 300,
+    "transport_mode": "petrol",
+    "transport_km": 500,
+    "diet_type": "mixed",
+    "meals_per_month": 90,
+    "waste_kg": 20
+}
+
+
+async def _drive(client, method, url, total, concurrency, **kwargs):
+    latencies = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    return {
+        "requests": total,
+        "seconds": elapsed,
+        "throughput": total / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+async def _run_mode(total, concurrency):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench-{os.getpid()}@example.com"
+        await client.post("/register", json={"name": "Bench", "email": email, "password": "benchmark"})
+
+        results = {
+            "calculate": await _drive(
+                client, "POST", "/calculate", total, concurrency,
+                json={**FOOTPRINT, "email": email}
+            ),
+            "history": await _drive(
+                client, "GET", f"/users/{email}/footprints", total, concurrency
+            )
+        }
+
+    return results
+
+
+def _child(total, concurrency):
+    sys.path.insert(0, BACKEND_DIR)
+    results = asyncio.run(_run_mode(total, concurrency))
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async database modes")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.requests, args.concurrency)
+        return
+
+    report = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("sync", "async"):
+            env = dict(os.environ, DB_ASYNC="1" if mode == "async" else "0")
+            env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, mode)}.db"
+
+            output = subprocess.run(
+                [sys.executable, __file__, "--child",
+                 "--requests", str(args.requests),
+                 "--concurrency", str(args.concurrency)],
+                env=env, check=True, capture_output=True, text=True
+            ).stdout
+
+            report[mode] = json.loads(output.strip().splitlines()[-1])
+
+    for endpoint in ("calculate", "history"):
+        for mode in ("sync", "async"):
+            result = report[mode][endpoint]
+            print(
+                f"{endpoint:>9} {mode:>5}: {result['throughput']:8.1f} req/s  "
+                f"p50 {result['p50_ms']:6.1f} ms  p95 {result['p95_ms']:6.1f} ms"
+            )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
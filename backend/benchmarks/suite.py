@@ -0,0 +1,557 @@
+"""
+Benchmarks the calculator, scenario engine, ML and API hot paths on
+synthetic data and optionally compares the results with a baseline.
+
+Every benchmark is seeded, so runs on the same machine are comparable.
+Models are trained on synthetic surveys into a temporary directory and
+the API runs in-process on a temporary SQLite database, so the suite
+never touches the real models or database.
+
+    python backend/benchmarks/suite.py --output bench.json
+    python backend/benchmarks/suite.py --baseline bench.json --threshold 0.25
+
+With --baseline the exit status is 1 when any benchmark's median time
+exceeds the baseline's by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(1, os.path.join(BACKEND_DIR, "ml"))
+
+import numpy as np
+import pandas as pd
+
+GROUPS = ("calculator", "scenario", "uncertainty", "ml", "training", "api")
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_TRAIN_SIZES = (500, 2000)
+DEFAULT_THRESHOLD = 0.25
+
+SEED = 42
+
+USER_INPUT = {
+    "electricity_kwh": 300,
+    "transport_mode": "petrol",
+    "transport_km": 500,
+    "diet_type": "mixed",
+    "meals_per_month": 90,
+    "waste_kg": 20
+}
+
+ACTIONS = [
+    {"type": "reduce_electricity", "percent": 20},
+    {"type": "change_transport", "new_mode": "public_transport"},
+    {"type": "change_diet", "new_diet": "veg"}
+]
+
+SURVEY_CHOICES = {
+    "gender": ["Male", "Female"],
+    "education_level": ["School", "Undergraduate", "Postgraduate"],
+    "occupation": ["Student", "Office professional", "Remote worker"],
+    "living_situation": ["Hostel", "Shared apartment", "Living with family", "Living alone"],
+    "primary_transport_mode": [
+        "Public transport", "Two-wheeler", "Personal petrol vehicle", "Walking / cycling"
+    ]
+}
+
+
+# ---------- SYNTHETIC DATA ----------
+
+def synthetic_inputs(n, seed=SEED):
+    """
+    Calculator inputs as a dictionary of arrays.
+    """
+    rng = np.random.default_rng(seed)
+
+    return {
+        "electricity_kwh": rng.uniform(50, 800, n),
+        "transport_mode": rng.choice(["petrol", "diesel", "public_transport"], n),
+        "transport_km": rng.uniform(0, 2000, n),
+        "diet_type": rng.choice(["veg", "mixed", "non_veg"], n),
+        "meals_per_month": rng.integers(30, 120, n),
+        "waste_kg": rng.uniform(1, 60, n)
+    }
+
+
+def synthetic_surveys(n, seed=SEED):
+    """
+    Survey answers in the layout of data/dummy_data.csv.
+    """
+    from preprocess import (
+        CLIMATE_MAPPING, FOOD_ORDER_MAPPING, HABIT_COLUMNS, HABIT_MAPPING,
+        LIKERT_MAPPING, PAST_ATTEMPT_MAPPING, TARGET_COLUMNS, WASTE_SEG_MAPPING
+    )
+
+    rng = np.random.default_rng(seed)
+
+    def choice(options):
+        return rng.choice(list(options), n)
+
+    surveys = {
+        "age": rng.integers(18, 70, n),
+        "gender": choice(SURVEY_CHOICES["gender"]),
+        "education_level": choice(SURVEY_CHOICES["education_level"]),
+        "occupation": choice(SURVEY_CHOICES["occupation"]),
+        "living_situation": choice(SURVEY_CHOICES["living_situation"]),
+        "electricity_kwh": rng.integers(50, 600, n),
+        "weekly_transport_km": rng.integers(0, 300, n),
+        "primary_transport_mode": choice(SURVEY_CHOICES["primary_transport_mode"]),
+        "non_veg_meals_per_week": rng.integers(0, 14, n),
+        "food_order_frequency": choice(FOOD_ORDER_MAPPING),
+        "waste_kg_per_week": rng.integers(1, 10, n),
+        **{col: choice(HABIT_MAPPING) for col in HABIT_COLUMNS},
+        "waste_segregation": choice(WASTE_SEG_MAPPING),
+        "climate_concern": choice(CLIMATE_MAPPING),
+        "past_attempt": choice(PAST_ATTEMPT_MAPPING),
+        **{col: choice(LIKERT_MAPPING) for col in TARGET_COLUMNS}
+    }
+
+    return pd.DataFrame(surveys)
+
+
+def synthetic_factor_catalog(path, regions=200, years=25, seed=SEED):
+    """
+    Writes a regional factor CSV (regions x years x every global factor)
+    and returns its path.
+    """
+    from carbon_calculator import load_factor_index
+
+    rng = np.random.default_rng(seed)
+    index = load_factor_index()
+
+    rows = [
+        {
+            "region": f"R{region:04d}",
+            "year": 2000 + year,
+            "category": category,
+            "sub_category": sub_category,
+            "co2_per_unit": value * rng.uniform(0.5, 1.5)
+        }
+        for region in range(regions)
+        for year in range(years)
+        for (category, sub_category), value in index.items()
+    ]
+
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+    return path
+
+
+# ---------- TIMING ----------
+
+def measure(fn, repeat=5, number=1, items=1, warmup=True):
+    """
+    Times fn() repeat times, each running it number times in a row.
+    Reports per-call times; items is the number of rows per call, for
+    throughput.
+    """
+    if warmup:
+        fn()
+
+    samples = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+
+    median = statistics.median(samples)
+
+    return {
+        "median_ms": median * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "repeat": repeat,
+        "number": number,
+        "items_per_second": items / median if median else None
+    }
+
+
+# ---------- BENCHMARKS ----------
+
+def bench_calculator(sizes):
+    from carbon_calculator import calculate_total_footprint, calculate_footprint_batch
+
+    results = {
+        "calculator.total_footprint": measure(
+            lambda: calculate_total_footprint(USER_INPUT), number=1000
+        )
+    }
+
+    for n in sizes:
+        inputs = synthetic_inputs(n)
+        rows = pd.DataFrame(inputs).to_dict("records")[:1000]
+
+        results[f"calculator.batch[{n}]"] = measure(
+            lambda: calculate_footprint_batch(inputs), items=n
+        )
+        results[f"calculator.scalar_loop[{len(rows)}]"] = measure(
+            lambda: [calculate_total_footprint(row) for row in rows], items=len(rows)
+        )
+
+    return results
+
+
+def bench_catalog(workdir):
+    from datetime import date
+
+    from carbon_calculator import DATA_PATH, calculate_total_footprint
+    from factor_catalog import CATALOG_PATH, FactorCatalog, build_catalog
+
+    sources = [DATA_PATH, synthetic_factor_catalog(os.path.join(workdir, "regional_factors.csv"))]
+
+    results = {
+        "catalog.build[40008]": measure(lambda: build_catalog(sources, CATALOG_PATH), repeat=3),
+        "catalog.open": measure(lambda: FactorCatalog(CATALOG_PATH), number=100)
+    }
+
+    rng = np.random.default_rng(SEED)
+    requests = [
+        (f"R{region:04d}", date(2000 + year, 6, 1))
+        for region, year in zip(rng.integers(0, 200, 1000), rng.integers(0, 25, 1000))
+    ]
+
+    results["calculator.total_footprint[region]"] = measure(
+        lambda: [calculate_total_footprint(USER_INPUT, region, on) for region, on in requests],
+        items=len(requests)
+    )
+
+    return results
+
+
+def bench_scenario(sizes):
+    from scenario_engine import simulate_scenario, evaluate_action_sets
+    from action_optimizer import optimize_action_portfolio
+
+    results = {
+        "scenario.simulate": measure(
+            lambda: simulate_scenario(USER_INPUT, ACTIONS), number=500
+        ),
+        "scenario.optimize_portfolio": measure(
+            lambda: optimize_action_portfolio(USER_INPUT, max_actions=3), number=20
+        )
+    }
+
+    action_sets = [[action] for action in ACTIONS] + [ACTIONS]
+
+    for n in sizes:
+        inputs = synthetic_inputs(n)
+
+        results[f"scenario.evaluate_action_sets[{n}]"] = measure(
+            lambda: evaluate_action_sets(inputs, action_sets), items=n
+        )
+
+    return results
+
+
+def bench_uncertainty(sizes):
+    from carbon_calculator import load_factor_index
+    from uncertainty import footprint_uncertainty, footprint_uncertainty_batch
+
+    # The shipped factors have no ranges; +/-20% exercises every draw
+    ranges = {key: (value * 0.8, value, value * 1.2) for key, value in load_factor_index().items()}
+
+    results = {
+        "uncertainty.single[100000]": measure(
+            lambda: footprint_uncertainty(USER_INPUT, ACTIONS, samples=100000, seed=SEED, ranges=ranges),
+            repeat=5
+        )
+    }
+
+    for n in sizes:
+        inputs = synthetic_inputs(n)
+
+        results[f"uncertainty.batch[{n}x1000]"] = measure(
+            lambda: footprint_uncertainty_batch(inputs, samples=1000, seed=SEED, ranges=ranges),
+            repeat=3,
+            items=n
+        )
+
+    return results
+
+
+def train_synthetic_models(model_dir, rows, export_mode="float64"):
+    """
+    Trains the willingness models on synthetic surveys into model_dir.
+    Returns the CSV path used.
+    """
+    from train_models import train_models
+
+    csv_path = os.path.join(model_dir, f"surveys_{rows}.csv")
+    synthetic_surveys(rows).to_csv(csv_path, index=False)
+
+    train_models(csv_path, export_mode=export_mode, model_dir=model_dir)
+
+    return csv_path
+
+
+def bench_training(train_sizes, workdir):
+    from preprocess import load_and_preprocess, load_and_preprocess_cached
+    from train_models import train_models
+
+    results = {}
+
+    for n in train_sizes:
+        csv_path = os.path.join(workdir, f"surveys_{n}.csv")
+        synthetic_surveys(n).to_csv(csv_path, index=False)
+
+        cache_dir = os.path.join(workdir, f"surveys_{n}.cache")
+
+        results[f"preprocess.load_and_preprocess[{n}]"] = measure(
+            lambda: load_and_preprocess(csv_path), items=n
+        )
+        results[f"preprocess.cached[{n}]"] = measure(
+            lambda: load_and_preprocess_cached(csv_path, cache_dir), items=n
+        )
+
+        model_dir = os.path.join(workdir, f"models_{n}")
+        os.makedirs(model_dir, exist_ok=True)
+
+        results[f"train.train_models[{n}]"] = measure(
+            lambda: train_models(csv_path, model_dir=model_dir), repeat=1, items=n, warmup=False
+        )
+
+    return results
+
+
+def bench_ml(sizes):
+    import ml.predict as predict
+    from recommendation_engine import recommend_actions, rank_actions_batch
+
+    records = synthetic_surveys(max(sizes)).to_dict("records")
+    columns = predict.get_feature_columns()
+
+    single = pd.DataFrame(predict.encode_surveys(records[:1]), columns=columns)
+
+    results = {
+        "ml.predict_adoption_probabilities": measure(
+            lambda: predict.predict_adoption_probabilities(single), number=20
+        ),
+        "ml.recommend_actions": measure(
+            lambda: recommend_actions(USER_INPUT, single), number=20
+        ),
+        "ml.encode_survey": measure(
+            lambda: predict.encode_surveys(records[:1]), number=1000
+        )
+    }
+
+    for n in sizes:
+        features = predict.encode_surveys(records[:n])
+        inputs = synthetic_inputs(n)
+
+        results[f"ml.predict_batch[{n}]"] = measure(
+            lambda: predict.predict_adoption_probabilities_batch(features), items=n
+        )
+        results[f"ml.rank_actions_batch[{n}]"] = measure(
+            lambda: rank_actions_batch(inputs, features), items=n
+        )
+
+    return results
+
+
+def bench_api(requests):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    footprint = {"name": "Bench", "email": "bench0@example.com", **USER_INPUT}
+
+    results = {}
+
+    with TestClient(main.app) as client:
+        for i in range(10):
+            client.post("/register", json={
+                "name": "Bench",
+                "email": f"bench{i}@example.com",
+                "password": "benchmark"
+            })
+
+        def post_calculate():
+            client.post("/calculate", json=footprint).raise_for_status()
+
+        def get(url, **kwargs):
+            def call():
+                response = client.get(url, **kwargs)
+                if response.status_code not in (200, 304):
+                    response.raise_for_status()
+            return call
+
+        results["api.calculate"] = measure(post_calculate, number=requests)
+
+        batch = {"footprints": [
+            {**footprint, "email": f"bench{i % 10}@example.com"} for i in range(100)
+        ]}
+        results["api.calculate_batch[100]"] = measure(
+            lambda: client.post("/calculate/batch", json=batch).raise_for_status(),
+            number=max(1, requests // 20), items=100
+        )
+
+        base = "/users/bench0@example.com"
+        etag = client.get(f"{base}/analytics").headers.get("etag")
+
+        results["api.analytics"] = measure(get(f"{base}/analytics"), number=requests)
+        results["api.analytics_not_modified"] = measure(
+            get(f"{base}/analytics", headers={"If-None-Match": etag or ""}), number=requests
+        )
+        results["api.history"] = measure(get(f"{base}/footprints?limit=100"), number=requests)
+        results["api.trends"] = measure(get(f"{base}/analytics/trends?bucket=day"), number=requests)
+        results["api.percentiles"] = measure(get(f"{base}/percentiles"), number=requests)
+        results["api.recommendations"] = measure(get(f"{base}/recommendations"), number=requests)
+
+    return results
+
+
+# ---------- BASELINE COMPARISON ----------
+
+def compare(results, baseline, threshold):
+    """
+    Returns (rows, regressions). A benchmark regresses when its median
+    time exceeds the baseline median by more than threshold (a fraction).
+    """
+    rows = []
+    regressions = []
+
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+
+        if previous is None:
+            rows.append((name, current["median_ms"], None, None, "new"))
+            continue
+
+        ratio = current["median_ms"] / previous["median_ms"] if previous["median_ms"] else float("inf")
+        status = "REGRESSION" if ratio > 1 + threshold else "ok"
+
+        if status == "REGRESSION":
+            regressions.append(name)
+
+        rows.append((name, current["median_ms"], previous["median_ms"], ratio, status))
+
+    return rows, regressions
+
+
+def _print_results(results):
+    for name, result in sorted(results.items()):
+        rate = result["items_per_second"]
+        throughput = f"{rate:,.0f}/s" if rate else ""
+        print(f"{name:<45} {result['median_ms']:>12.4f} ms  {throughput:>14}")
+
+
+def _print_comparison(rows, threshold):
+    print(f"\nComparison with baseline (threshold +{threshold:.0%}):")
+
+    for name, current, previous, ratio, status in rows:
+        if previous is None:
+            print(f"{name:<45} {current:>12.4f} ms  {'':>12}  {status}")
+        else:
+            print(f"{name:<45} {current:>12.4f} ms  {ratio:>11.2f}x  {status}")
+
+
+def run_suite(groups=GROUPS, sizes=DEFAULT_SIZES, train_sizes=DEFAULT_TRAIN_SIZES, api_requests=200):
+    """
+    Runs the selected benchmark groups. Returns the results document.
+    """
+    workdir = tempfile.mkdtemp(prefix="carbonlens-bench-")
+
+    # These are read at import time, so they are set before anything loads.
+    # Always the scratch directory: the API group writes users and
+    # footprints and the catalog group overwrites the catalog, so settings
+    # inherited from the shell must not point them at real data.
+    model_dir = os.path.join(workdir, "models")
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["FACTOR_CATALOG_PATH"] = os.path.join(workdir, "factors.catalog")
+    os.environ["MODEL_DIR"] = model_dir
+
+    results = {}
+
+    if "calculator" in groups:
+        results.update(bench_calculator(sizes))
+        results.update(bench_catalog(workdir))
+
+    if "scenario" in groups:
+        results.update(bench_scenario(sizes))
+
+    if "uncertainty" in groups:
+        results.update(bench_uncertainty(sizes))
+
+    if "training" in groups:
+        results.update(bench_training(train_sizes, workdir))
+
+    if "ml" in groups:
+        if not os.path.exists(os.path.join(model_dir, "feature_encoder.json")):
+            os.makedirs(model_dir, exist_ok=True)
+            train_synthetic_models(model_dir, max(train_sizes))
+
+        results.update(bench_ml(sizes))
+
+    if "api" in groups:
+        results.update(bench_api(api_requests))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "groups": list(groups),
+            "sizes": list(sizes),
+            "train_sizes": list(train_sizes),
+            "seed": SEED
+        },
+        "results": results
+    }
+
+
+def _sizes(value):
+    return tuple(int(size) for size in value.split(","))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CarbonLens hot paths")
+    parser.add_argument("--groups", default=",".join(GROUPS), help=f"comma-separated subset of {GROUPS}")
+    parser.add_argument("--sizes", type=_sizes, default=DEFAULT_SIZES, help="batch sizes, e.g. 1000,10000")
+    parser.add_argument("--train-sizes", type=_sizes, default=DEFAULT_TRAIN_SIZES, help="survey rows for training")
+    parser.add_argument("--api-requests", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, e.g. 0.25")
+    args = parser.parse_args()
+
+    groups = [group for group in args.groups.split(",") if group]
+    unknown = set(groups) - set(GROUPS)
+
+    if unknown:
+        parser.error(f"unknown groups: {sorted(unknown)}")
+
+    document = run_suite(groups, args.sizes, args.train_sizes, args.api_requests)
+
+    print()
+    _print_results(document["results"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+        rows, regressions = compare(document["results"], baseline, args.threshold)
+        _print_comparison(rows, args.threshold)
+
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed")
+            sys.exit(1)
@@ -0,0 +1,231 @@
+import argparse
+import logging
+
+import pandas as pd
+from sqlalchemy import delete, func, insert, select
+
+from database import SessionLocal
+from models import Footprint, UserRecommendation, UserSurvey
+from carbon_calculator import BATCH_INPUT_COLUMNS
+from ml.predict import get_feature_columns, predict_adoption_probabilities_batch
+from recommendation_engine import rank_actions, rank_actions_batch
+from recommendation_refresh import adoption_probabilities, validate_survey
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+
+# Users read per transaction by the database source. SQLite cannot commit
+# while a read cursor is open, so each window is read, then committed.
+DB_WINDOW = 50000
+
+
+def iter_user_chunks(csv_path, chunk_size=CHUNK_SIZE):
+    """
+    Streams user rows from a CSV in chunks.
+
+    Each row holds a user_id, the scenario engine inputs
+    (BATCH_INPUT_COLUMNS) and the preprocessed model features.
+    """
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        yield chunk
+
+
+def score_chunk(chunk, feature_columns):
+    """
+    Ranks actions for every user in a chunk.
+    Returns (user_ids, rankings).
+    """
+    # One-hot columns absent from the chunk are all zeros
+    features = chunk.reindex(columns=feature_columns, fill_value=0)
+
+    rankings = rank_actions_batch(chunk[list(BATCH_INPUT_COLUMNS)], features)
+
+    return chunk["user_id"].tolist(), rankings
+
+
+def latest_inputs_query(after_user_id=None):
+    """
+    Each user's latest footprint with stored inputs, with their survey
+    answers if any, in user id order, optionally after a user id.
+    """
+    ranked = (
+        select(
+            Footprint.user_id,
+            Footprint.id.label("footprint_id"),
+            *[getattr(Footprint, key) for key in BATCH_INPUT_COLUMNS],
+            func.row_number().over(
+                partition_by=Footprint.user_id,
+                order_by=(Footprint.created_at.desc(), Footprint.id.desc())
+            ).label("position")
+        )
+        .where(Footprint.electricity_kwh.is_not(None))
+        .subquery()
+    )
+
+    query = (
+        select(
+            ranked.c.user_id,
+            ranked.c.footprint_id,
+            *[ranked.c[key] for key in BATCH_INPUT_COLUMNS],
+            UserSurvey.answers
+        )
+        .outerjoin(UserSurvey, UserSurvey.user_id == ranked.c.user_id)
+        .where(ranked.c.position == 1)
+        .order_by(ranked.c.user_id)
+    )
+
+    if after_user_id is not None:
+        query = query.where(ranked.c.user_id > after_user_id)
+
+    return query
+
+
+def _encodable(user_id, survey):
+    if survey is None:
+        return None
+
+    try:
+        validate_survey(survey)
+    except ValueError:
+        logger.warning("Ignoring survey of user %s", user_id, exc_info=True)
+        return None
+
+    return survey
+
+
+def score_db_chunk(rows):
+    """
+    Ranks actions for rows of latest_inputs_query. Users without a valid
+    survey are ranked with the default adoption probability.
+    Returns (user_ids, rankings, footprint_ids).
+    """
+    inputs = {key: [getattr(row, key) for row in rows] for key in BATCH_INPUT_COLUMNS}
+
+    probabilities = adoption_probabilities(
+        [_encodable(row.user_id, row.answers) for row in rows],
+        predict_adoption_probabilities_batch
+    )
+
+    return (
+        [row.user_id for row in rows],
+        rank_actions(inputs, probabilities),
+        [row.footprint_id for row in rows]
+    )
+
+
+def write_recommendations(db, user_ids, rankings, footprint_ids=None, commit=True):
+    """
+    Replaces the stored recommendations of a chunk of users with
+    one bulk delete and one multi-row insert.
+
+    footprint_ids: optional version stamp per user, the footprint each
+    ranking was computed for.
+    commit=False leaves the write in the caller's transaction.
+    """
+    if footprint_ids is None:
+        footprint_ids = [None] * len(user_ids)
+
+    db.execute(
+        delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_ids))
+    )
+
+    db.execute(insert(UserRecommendation), [
+        {"user_id": user_id, "recommendations": ranking, "footprint_id": footprint_id}
+        for user_id, ranking, footprint_id in zip(user_ids, rankings, footprint_ids)
+    ])
+
+    if commit:
+        db.commit()
+
+
+def run_bulk_scoring(csv_path, chunk_size=CHUNK_SIZE):
+    """
+    Scores the whole user base chunk by chunk and stores the rankings.
+    Returns the number of users scored.
+    """
+    feature_columns = get_feature_columns()
+    scored = 0
+
+    db = SessionLocal()
+    try:
+        for chunk in iter_user_chunks(csv_path, chunk_size):
+            user_ids, rankings = score_chunk(chunk, feature_columns)
+            write_recommendations(db, user_ids, rankings)
+
+            scored += len(user_ids)
+            print(f"Scored {scored} users")
+    finally:
+        db.close()
+
+    return scored
+
+
+def run_bulk_scoring_db(chunk_size=CHUNK_SIZE, window=DB_WINDOW, session_factory=SessionLocal):
+    """
+    Scores every user from the database: their latest footprint's stored
+    inputs and their stored survey.
+
+    Rows are streamed through a server-side cursor (yield_per) on one
+    session and written on another, one transaction per window of users.
+    Rankings are stamped with the footprint they were computed for, so the
+    API serves them until the user's next footprint.
+    Returns the number of users scored.
+    """
+    reader = session_factory()
+    writer = session_factory()
+    scored = 0
+    last_user_id = None
+
+    try:
+        while True:
+            result = reader.execute(
+                latest_inputs_query(last_user_id)
+                .limit(window)
+                .execution_options(yield_per=chunk_size)
+            )
+
+            window_scored = 0
+
+            for rows in result.partitions():
+                user_ids, rankings, footprint_ids = score_db_chunk(rows)
+                write_recommendations(writer, user_ids, rankings, footprint_ids, commit=False)
+
+                window_scored += len(user_ids)
+                last_user_id = user_ids[-1]
+
+            # Ends the read transaction before committing the window
+            reader.rollback()
+
+            if not window_scored:
+                break
+
+            writer.commit()
+
+            scored += window_scored
+            print(f"Scored {scored} users")
+
+    except Exception:
+        writer.rollback()
+        raise
+
+    finally:
+        reader.close()
+        writer.close()
+
+    return scored
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh stored recommendations for all users")
+    parser.add_argument(
+        "csv_path", nargs="?",
+        help="CSV of preprocessed features; omit to score from the database"
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.csv_path:
+        run_bulk_scoring(args.csv_path, args.chunk_size)
+    else:
+        run_bulk_scoring_db(args.chunk_size)
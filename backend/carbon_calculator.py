@@ -1,7 +1,184 @@
+import hashlib
+import logging
+import math
 import os
+import threading
+import time
+
+import numpy as np
 import pandas as pd
 
-_EMISSION_FACTORS = None
+from factor_catalog import get_catalog
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Get absolute path to project root
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BASE_DIR, "data", "emission_factors.csv")
+
+# Minimum number of seconds between checks of the CSV for changes on disk
+RELOAD_CHECK_INTERVAL = 2.0
+
+_REQUIRED_COLUMNS = ("category", "sub_category", "co2_per_unit")
+
+# Optional uncertainty range around co2_per_unit (see build_factor_ranges)
+_RANGE_COLUMNS = ("co2_low", "co2_high")
+
+# (file signature, DataFrame, index, ranges, version) - swapped as a single object so readers
+# never see a DataFrame and an index built from different files
+_FACTOR_STATE = None
+_LAST_CHECK = 0.0
+_RELOAD_LOCK = threading.Lock()
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def build_factor_index(factors):
+    """
+    Compiles an emission factors DataFrame into a dictionary keyed by
+    (category, sub_category) so lookups are O(1).
+
+    All validation happens here, once per build:
+    required columns, missing keys, duplicate keys and non-numeric or
+    negative factors raise ValueError.
+    """
+    missing = [col for col in _REQUIRED_COLUMNS if col not in factors.columns]
+
+    if missing:
+        raise ValueError(f"Emission factors are missing columns: {missing}")
+
+    index = {}
+
+    for category, sub_category, value in zip(
+        factors["category"],
+        factors["sub_category"],
+        factors["co2_per_unit"]
+    ):
+        if pd.isna(category) or pd.isna(sub_category):
+            raise ValueError("Emission factor row is missing its category or sub-category")
+
+        key = (category, sub_category)
+
+        if key in index:
+            raise ValueError(f"Duplicate emission factor for {category} - {sub_category}")
+
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"Invalid emission factor for {category} - {sub_category}: {value!r}"
+            )
+
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(
+                f"Invalid emission factor for {category} - {sub_category}: {value!r}"
+            )
+
+        index[key] = value
+
+    return index
+
+
+def build_factor_ranges(factors, index):
+    """
+    Compiles the optional co2_low / co2_high columns into
+    {(category, sub_category): (low, mode, high)}, with co2_per_unit as
+    the mode.
+
+    Either column may be absent or blank for a factor; the missing bound
+    defaults to the point value, so factors without a range have no
+    uncertainty. Bounds that are negative, non-numeric or do not enclose
+    the point value raise ValueError.
+    """
+    bounds = {}
+
+    for column in _RANGE_COLUMNS:
+        if column in factors.columns:
+            bounds[column] = factors[column]
+        else:
+            bounds[column] = [None] * len(factors)
+
+    ranges = {}
+
+    for category, sub_category, low, high in zip(
+        factors["category"],
+        factors["sub_category"],
+        bounds["co2_low"],
+        bounds["co2_high"]
+    ):
+        key = (category, sub_category)
+        mode = index[key]
+
+        try:
+            low = mode if low is None or pd.isna(low) else float(low)
+            high = mode if high is None or pd.isna(high) else float(high)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid uncertainty range for {category} - {sub_category}")
+
+        if not (math.isfinite(low) and math.isfinite(high)) or not 0 <= low <= mode <= high:
+            raise ValueError(
+                f"Invalid uncertainty range for {category} - {sub_category}: "
+                f"{low!r} to {high!r} around {mode!r}"
+            )
+
+        ranges[key] = (low, mode, high)
+
+    return ranges
+
+
+def _refresh_factors(force=False):
+    """
+    Returns the current factor state, rebuilding it if the CSV changed on
+    disk since the last build.
+
+    The file is stat'ed at most once every RELOAD_CHECK_INTERVAL seconds.
+    A rebuild that fails validation keeps the previous factors in service.
+    To publish new factors, replace the CSV atomically (write + rename).
+    """
+    global _FACTOR_STATE, _LAST_CHECK
+
+    state = _FACTOR_STATE
+    now = time.monotonic()
+
+    if state is not None and not force and now - _LAST_CHECK < RELOAD_CHECK_INTERVAL:
+        return state
+
+    with _RELOAD_LOCK:
+        state = _FACTOR_STATE
+        _LAST_CHECK = now
+
+        try:
+            signature = _file_signature(DATA_PATH)
+        except OSError:
+            if state is None:
+                raise
+            logger.warning("Emission factors file is unavailable, keeping current factors")
+            return state
+
+        if state is not None and state[0] == signature and not force:
+            return state
+
+        try:
+            factors = pd.read_csv(DATA_PATH)
+            index = build_factor_index(factors)
+            ranges = build_factor_ranges(factors, index)
+        except (ValueError, pd.errors.ParserError):
+            if state is None:
+                raise
+            logger.exception("Rejected emission factors update, keeping current factors")
+            # Remember the rejected signature so it is not re-parsed until it changes
+            _FACTOR_STATE = (signature,) + state[1:]
+            return _FACTOR_STATE
+
+        version = "csv-" + hashlib.sha256(repr(sorted(ranges.items())).encode("utf-8")).hexdigest()[:16]
+
+        _FACTOR_STATE = (signature, factors, index, ranges, version)
+
+        return _FACTOR_STATE
 
 
 def load_emission_factors():
@@ -9,72 +186,112 @@ def load_emission_factors():
     Loads emission factors from the CSV file and caches them.
     Returns a pandas DataFrame.
     """
-    global _EMISSION_FACTORS
+    return _refresh_factors()[1]
+
+
+def load_factor_index(region=None, on=None):
+    """
+    Returns the compiled emission factor index:
+    {(category, sub_category): co2_per_unit}
 
-    if _EMISSION_FACTORS is None:
-        # Get absolute path to project root
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        DATA_PATH = os.path.join(BASE_DIR, "data", "emission_factors.csv")
+    Without a region or date this is the global CSV. Otherwise the
+    factors come from the compiled catalog (see factor_catalog): the
+    region's factors for the year of on (default: this year), falling
+    back to the global ones.
+    """
+    if region is None and on is None:
+        return _refresh_factors()[2]
+
+    return get_catalog().index(region, on)
 
-        _EMISSION_FACTORS = pd.read_csv(DATA_PATH)
 
-    return _EMISSION_FACTORS
+def load_factor_ranges(region=None, on=None):
+    """
+    Returns the compiled uncertainty ranges:
+    {(category, sub_category): (low, mode, high)}
 
+    region / on select catalog factors, as for load_factor_index.
+    """
+    if region is None and on is None:
+        return _refresh_factors()[3]
 
-def _get_emission_factor(category, sub_category):
+    return get_catalog().ranges(region, on)
+
+
+def factor_set_version(region=None, on=None):
+    """
+    Identifies the factor set load_factor_index(region, on) returns:
+    "csv-<content hash>" for the global CSV, "catalog-<version>" for the
+    catalog. Stored with footprints so stale ones can be recomputed.
+    """
+    if region is None and on is None:
+        return _refresh_factors()[4]
+
+    return f"catalog-{get_catalog().version}"
+
+
+def reload_emission_factors():
+    """
+    Forces a rebuild of the emission factor index from disk.
+    """
+    return _refresh_factors(force=True)[2]
+
+
+def _get_emission_factor(category, sub_category, index=None):
     """
     Helper function to fetch the emission factor for a given category
     and sub-category from the emission factors table.
     """
-    factors = load_emission_factors()
+    if index is None:
+        index = load_factor_index()
 
-    row = factors[
-        (factors["category"] == category) &
-        (factors["sub_category"] == sub_category)
-    ]
-
-    if row.empty:
+    try:
+        return index[(category, sub_category)]
+    except KeyError:
         raise ValueError(f"No emission factor found for {category} - {sub_category}")
 
-    return float(row["co2_per_unit"].values[0])
-
 
-def calculate_electricity_emissions(kwh):
+def calculate_electricity_emissions(kwh, index=None):
     """
     Calculates CO2 emissions from electricity usage.
     """
-    factor = _get_emission_factor("electricity", "grid")
+    factor = _get_emission_factor("electricity", "grid", index)
     return kwh * factor
 
 
-def calculate_transport_emissions(mode, km):
+def calculate_transport_emissions(mode, km, index=None):
     """
     Calculates CO2 emissions from transport usage.
     """
-    factor = _get_emission_factor("transport", mode)
+    factor = _get_emission_factor("transport", mode, index)
     return km * factor
 
 
-def calculate_food_emissions(diet_type, meals):
+def calculate_food_emissions(diet_type, meals, index=None):
     """
     Calculates CO2 emissions from food consumption.
     """
-    factor = _get_emission_factor("food", diet_type)
+    factor = _get_emission_factor("food", diet_type, index)
     return meals * factor
 
 
-def calculate_waste_emissions(kg):
+def calculate_waste_emissions(kg, index=None):
     """
     Calculates CO2 emissions from waste generation.
     """
-    factor = _get_emission_factor("waste", "mixed")
+    factor = _get_emission_factor("waste", "mixed", index)
     return kg * factor
 
 
-def calculate_total_footprint(user_input):
+@timed("calculate_total_footprint")
+def calculate_total_footprint(user_input, region=None, on=None):
     """
     Calculates category-wise and total household carbon footprint.
 
+    region / on: optional grid region and activity date selecting
+    catalog factors (see load_factor_index); the global factors are
+    used without them.
+
     user_input format:
     {
         "electricity_kwh": number,
@@ -86,24 +303,132 @@ def calculate_total_footprint(user_input):
     }
     """
 
+    # Resolve the index once so all categories use the same factor set
+    index = load_factor_index(region, on)
+
     electricity_emissions = calculate_electricity_emissions(
-        user_input["electricity_kwh"]
+        user_input["electricity_kwh"],
+        index
     )
 
     transport_emissions = calculate_transport_emissions(
         user_input["transport_mode"],
-        user_input["transport_km"]
+        user_input["transport_km"],
+        index
     )
 
     food_emissions = calculate_food_emissions(
         user_input["diet_type"],
-        user_input["meals_per_month"]
+        user_input["meals_per_month"],
+        index
     )
 
     waste_emissions = calculate_waste_emissions(
-        user_input["waste_kg"]
+        user_input["waste_kg"],
+        index
+    )
+
+    total_emissions = (
+        electricity_emissions +
+        transport_emissions +
+        food_emissions +
+        waste_emissions
+    )
+
+    return {
+        "electricity": electricity_emissions,
+        "transport": transport_emissions,
+        "food": food_emissions,
+        "waste": waste_emissions,
+        "total": total_emissions
+    }
+
+
+# Input columns expected by calculate_footprint_batch
+BATCH_INPUT_COLUMNS = (
+    "electricity_kwh",
+    "transport_mode",
+    "transport_km",
+    "diet_type",
+    "meals_per_month",
+    "waste_kg"
+)
+
+
+def _lookup_factor_array(category, sub_categories, index):
+    """
+    Maps an array of sub-categories to their emission factors.
+    Each distinct sub-category is looked up in the index only once.
+    """
+    values, inverse = np.unique(
+        np.asarray(sub_categories, dtype=object).astype(str),
+        return_inverse=True
+    )
+
+    factors = np.array(
+        [_get_emission_factor(category, value, index) for value in values],
+        dtype=float
     )
 
+    return factors[inverse]
+
+
+@timed("calculate_footprint_batch")
+def calculate_footprint_batch(inputs, region=None, on=None):
+    """
+    Vectorized version of calculate_total_footprint.
+
+    inputs: a pandas DataFrame, or a dictionary of equal-length arrays,
+    with the same keys as calculate_total_footprint's user_input.
+    region / on: one factor set for every row, as for
+    calculate_total_footprint.
+
+    Returns a dictionary of NumPy arrays, one value per input row:
+    {
+        "electricity": array,
+        "transport": array,
+        "food": array,
+        "waste": array,
+        "total": array
+    }
+    """
+
+    missing = [col for col in BATCH_INPUT_COLUMNS if col not in inputs]
+
+    if missing:
+        raise ValueError(f"Batch input is missing columns: {missing}")
+
+    index = load_factor_index(region, on)
+
+    electricity_kwh = np.asarray(inputs["electricity_kwh"], dtype=float)
+    transport_km = np.asarray(inputs["transport_km"], dtype=float)
+    meals_per_month = np.asarray(inputs["meals_per_month"], dtype=float)
+    waste_kg = np.asarray(inputs["waste_kg"], dtype=float)
+
+    sizes = {
+        len(electricity_kwh),
+        len(transport_km),
+        len(meals_per_month),
+        len(waste_kg),
+        len(inputs["transport_mode"]),
+        len(inputs["diet_type"])
+    }
+
+    if len(sizes) > 1:
+        raise ValueError("Batch input columns must all have the same length")
+
+    electricity_emissions = electricity_kwh * _get_emission_factor("electricity", "grid", index)
+
+    transport_emissions = transport_km * _lookup_factor_array(
+        "transport", inputs["transport_mode"], index
+    )
+
+    food_emissions = meals_per_month * _lookup_factor_array(
+        "food", inputs["diet_type"], index
+    )
+
+    waste_emissions = waste_kg * _get_emission_factor("waste", "mixed", index)
+
     total_emissions = (
         electricity_emissions +
         transport_emissions +
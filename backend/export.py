@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import os
+import secrets
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import FOOTPRINT_INPUT_COLUMNS, Footprint, User
+
+# Rows fetched per server-side cursor partition and sent per response chunk
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+# Credential for the tenant-wide export, sent as X-Admin-Token. The
+# export is disabled while it is unset.
+EXPORT_ADMIN_TOKEN = os.getenv("EXPORT_ADMIN_TOKEN", "")
+
+FORMATS = ("csv", "ndjson")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson"
+}
+
+# Exported fields, in column order
+EXPORT_COLUMNS = (
+    "id",
+    "email",
+    "created_at",
+    "electricity",
+    "transport",
+    "food",
+    "waste",
+    "total"
+) + FOOTPRINT_INPUT_COLUMNS
+
+
+def tenant_export_allowed(token):
+    """
+    True when token matches EXPORT_ADMIN_TOKEN, which must be set.
+    """
+    if not EXPORT_ADMIN_TOKEN or token is None:
+        return False
+
+    return secrets.compare_digest(token.encode(), EXPORT_ADMIN_TOKEN.encode())
+
+
+def export_query(user_ids=None, start=None, end=None):
+    """
+    SELECT for the exported footprints, in id order.
+
+    user_ids: only these users' footprints, default all
+    start / end: bound created_at (start inclusive, end exclusive)
+    """
+    query = (
+        select(
+            Footprint.id,
+            User.email,
+            Footprint.created_at,
+            Footprint.electricity,
+            Footprint.transport,
+            Footprint.food,
+            Footprint.waste,
+            Footprint.total,
+            *[getattr(Footprint, key) for key in FOOTPRINT_INPUT_COLUMNS]
+        )
+        .join(User, User.id == Footprint.user_id)
+    )
+
+    if user_ids is not None:
+        query = query.where(Footprint.user_id.in_(user_ids))
+
+    if start is not None:
+        query = query.where(Footprint.created_at >= start)
+
+    if end is not None:
+        query = query.where(Footprint.created_at < end)
+
+    return query.order_by(Footprint.id)
+
+
+# Positions of the date and datetime columns, written in ISO format
+_DATE_POSITIONS = tuple(EXPORT_COLUMNS.index(key) for key in ("created_at", "activity_date"))
+
+
+def _plain_rows(rows):
+    """
+    Rows as lists of CSV / JSON-ready values.
+    """
+    plain = []
+
+    for row in rows:
+        row = list(row)
+
+        for position in _DATE_POSITIONS:
+            value = row[position]
+            if value is not None:
+                row[position] = value.isoformat()
+
+        plain.append(row)
+
+    return plain
+
+
+def _csv_chunk(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+
+    # Nulls are written as empty fields
+    writer.writerows(_plain_rows(rows))
+
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(rows):
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n"
+        for row in _plain_rows(rows)
+    )
+
+
+def stream_footprints(
+    fmt,
+    user_ids=None,
+    start=None,
+    end=None,
+    chunk_size=EXPORT_CHUNK_SIZE,
+    session_factory=SessionLocal
+):
+    """
+    Yields the export as text chunks of up to chunk_size rows.
+
+    Rows come through a server-side cursor (yield_per), so only one chunk
+    is held in memory however many footprints match. The export reads on
+    its own session and one transaction, so it is a consistent snapshot
+    on databases with MVCC. A CSV export starts with a header line, even
+    when no rows match.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if fmt == "csv":
+        yield _csv_chunk([], header=True)
+
+    db = session_factory()
+    try:
+        # Core execution: plain rows, without the ORM's per-row overhead
+        result = db.connection().execute(
+            export_query(user_ids, start, end)
+            .execution_options(yield_per=chunk_size)
+        )
+
+        for rows in result.partitions():
+            yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
+
+    finally:
+        db.close()
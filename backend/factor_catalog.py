@@ -0,0 +1,498 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+# Default build sources: the global factors plus any regional CSVs
+DEFAULT_SOURCES = (
+    os.path.join(DATA_DIR, "emission_factors.csv"),
+    os.path.join(DATA_DIR, "factors")
+)
+
+CATALOG_PATH = os.getenv(
+    "FACTOR_CATALOG_PATH", os.path.join(DATA_DIR, "emission_factors.catalog")
+)
+
+# Rows without a region apply everywhere; rows without a year apply to
+# every year
+DEFAULT_REGION = "GLOBAL"
+DEFAULT_YEAR = 0
+
+# Minimum number of seconds between checks of the catalog for changes
+RELOAD_CHECK_INTERVAL = 2.0
+
+# Resolved (region, year) factor sets kept per worker
+RESOLVED_CACHE_SIZE = 1024
+
+# ---------- FILE FORMAT ----------
+#
+# MAGIC, then the header length as a little-endian uint64, then a JSON
+# header padded to 8 bytes, then one contiguous little-endian array per
+# column at the offsets listed in the header:
+#
+#   key    uint64   interned (region, category, sub_category) ids
+#   year   int32
+#   value  float64  co2_per_unit
+#   low    float64  uncertainty range, equal to value when absent
+#   high   float64
+#
+# Rows are sorted by (key, year). The region id is in the top bits of the
+# key, so each region's rows are contiguous.
+
+MAGIC = b"CLFCAT01"
+FORMAT_VERSION = 1
+
+_ID_BITS = 21
+_ID_MASK = (1 << _ID_BITS) - 1
+
+COLUMNS = (
+    ("key", "<u8"),
+    ("year", "<i4"),
+    ("value", "<f8"),
+    ("low", "<f8"),
+    ("high", "<f8")
+)
+
+
+class CatalogUnavailable(Exception):
+    """
+    Raised when the compiled catalog is missing or cannot be opened, and
+    no previously opened catalog can be served instead.
+    """
+
+
+def _compose_keys(region_ids, category_ids, sub_category_ids):
+    return (
+        (region_ids.astype(np.uint64) << np.uint64(2 * _ID_BITS)) |
+        (category_ids.astype(np.uint64) << np.uint64(_ID_BITS)) |
+        sub_category_ids.astype(np.uint64)
+    )
+
+
+def _align(offset):
+    return (offset + 7) // 8 * 8
+
+
+# ---------- BUILD ----------
+
+def _source_files(sources):
+    files = []
+
+    for source in sources:
+        if os.path.isdir(source):
+            files.extend(sorted(glob.glob(os.path.join(source, "*.csv"))))
+        elif os.path.exists(source):
+            files.append(source)
+        else:
+            raise ValueError(f"Emission factor source not found: {source}")
+
+    return files
+
+
+def _read_sources(files):
+    """
+    Reads and validates the source CSVs into one DataFrame with region,
+    year, category, sub_category, value, low and high columns.
+    """
+    import pandas as pd
+
+    frames = []
+
+    for path in files:
+        frame = pd.read_csv(path)
+
+        missing = [col for col in ("category", "sub_category", "co2_per_unit") if col not in frame.columns]
+
+        if missing:
+            raise ValueError(f"{path} is missing columns: {missing}")
+
+        if frame[["category", "sub_category"]].isna().any(axis=None):
+            raise ValueError(f"{path} has a row without its category or sub-category")
+
+        regions = frame["region"] if "region" in frame.columns else pd.Series(DEFAULT_REGION, index=frame.index)
+        years = frame["year"] if "year" in frame.columns else pd.Series(DEFAULT_YEAR, index=frame.index)
+
+        value = pd.to_numeric(frame["co2_per_unit"], errors="coerce")
+
+        def bound(column):
+            if column not in frame.columns:
+                return value
+            return pd.to_numeric(frame[column], errors="coerce").fillna(value)
+
+        frames.append(pd.DataFrame({
+            "region": regions.fillna(DEFAULT_REGION).astype(str).str.strip().str.upper(),
+            "year": pd.to_numeric(years.fillna(DEFAULT_YEAR), errors="coerce"),
+            "category": frame["category"].astype(str),
+            "sub_category": frame["sub_category"].astype(str),
+            "value": value,
+            "low": bound("co2_low"),
+            "high": bound("co2_high"),
+            "source": os.path.basename(path)
+        }))
+
+    if not frames:
+        raise ValueError("No emission factor sources to build")
+
+    rows = pd.concat(frames, ignore_index=True)
+
+    bad_year = rows["year"].isna() | (rows["year"] % 1 != 0)
+    bad_value = ~np.isfinite(rows["value"]) | (rows["value"] < 0)
+    bad_range = (
+        ~np.isfinite(rows["low"]) | ~np.isfinite(rows["high"]) |
+        (rows["low"] < 0) | (rows["low"] > rows["value"]) | (rows["high"] < rows["value"])
+    )
+
+    for mask, problem in (
+        (bad_year, "invalid year"),
+        (bad_value, "invalid emission factor"),
+        (bad_range, "invalid uncertainty range")
+    ):
+        if mask.any():
+            row = rows[mask].iloc[0]
+            raise ValueError(
+                f"{row['source']}: {problem} for {row['region']} {row['category']} - {row['sub_category']}"
+            )
+
+    duplicated = rows.duplicated(["region", "year", "category", "sub_category"])
+
+    if duplicated.any():
+        row = rows[duplicated].iloc[0]
+        raise ValueError(
+            f"Duplicate emission factor for {row['region']} {int(row['year'])} "
+            f"{row['category']} - {row['sub_category']}"
+        )
+
+    return rows
+
+
+def build_catalog(sources=DEFAULT_SOURCES, output=CATALOG_PATH):
+    """
+    Compiles emission factor CSVs into the binary catalog at output.
+
+    Each CSV has category, sub_category and co2_per_unit columns and
+    optionally region, year, co2_low and co2_high. Region and year
+    default to DEFAULT_REGION and DEFAULT_YEAR.
+
+    The catalog is written to a temporary file and renamed into place,
+    so running workers switch to it atomically. Returns the header.
+    """
+    files = _source_files(sources)
+    rows = _read_sources(files)
+
+    # Interned strings: every region, category and sub-category once
+    strings = sorted(set(rows["region"]) | set(rows["category"]) | set(rows["sub_category"]))
+
+    if len(strings) > _ID_MASK:
+        raise ValueError("Too many distinct names for the catalog key layout")
+
+    ids = {name: i for i, name in enumerate(strings)}
+
+    keys = _compose_keys(
+        rows["region"].map(ids).to_numpy(),
+        rows["category"].map(ids).to_numpy(),
+        rows["sub_category"].map(ids).to_numpy()
+    )
+    years = rows["year"].to_numpy(dtype=np.int32)
+
+    order = np.lexsort((years, keys))
+
+    arrays = {
+        "key": keys[order],
+        "year": years[order],
+        "value": rows["value"].to_numpy(dtype=float)[order],
+        "low": rows["low"].to_numpy(dtype=float)[order],
+        "high": rows["high"].to_numpy(dtype=float)[order]
+    }
+
+    # Content hash, so rebuilding unchanged sources keeps the version
+    digest = hashlib.sha256(json.dumps(strings).encode("utf-8"))
+    for name, dtype in COLUMNS:
+        digest.update(arrays[name].astype(dtype).tobytes())
+
+    header = {
+        "format": FORMAT_VERSION,
+        "version": digest.hexdigest()[:16],
+        "records": len(order),
+        "strings": strings,
+        "regions": sorted(set(rows["region"])),
+        "sources": [os.path.basename(path) for path in files],
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "columns": {}
+    }
+
+    # Column offsets depend on the header length, which depends on the
+    # offsets; reserve room for them first
+    header["columns"] = {name: [0, dtype] for name, dtype in COLUMNS}
+    placeholder = len(json.dumps(header).encode("utf-8")) + 32 * len(COLUMNS)
+
+    offset = _align(len(MAGIC) + 8 + placeholder)
+
+    for name, dtype in COLUMNS:
+        header["columns"][name] = [offset, dtype]
+        offset = _align(offset + len(order) * np.dtype(dtype).itemsize)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    if len(header_bytes) > placeholder:
+        raise RuntimeError("Catalog header outgrew its reserved space")
+
+    header_bytes = header_bytes.ljust(placeholder)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temp_path = f"{output}.tmp"
+
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+
+        for name, dtype in COLUMNS:
+            f.seek(header["columns"][name][0])
+            f.write(arrays[name].astype(dtype).tobytes())
+
+    os.replace(temp_path, output)
+
+    return header
+
+
+# ---------- READ ----------
+
+def _as_year(on):
+    if on is None:
+        return date.today().year
+    if isinstance(on, (date, datetime)):
+        return on.year
+    return int(on)
+
+
+def _as_region(region):
+    return DEFAULT_REGION if region is None else str(region).strip().upper()
+
+
+class FactorCatalog:
+    """
+    Read-only view of a compiled catalog.
+
+    Columns are memory-mapped, so every worker process shares the same
+    page cache instead of holding its own copy. Only the interned string
+    table is decoded into Python.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an emission factor catalog")
+
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+
+        if header["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog format: {header['format']}")
+
+        self.path = path
+        self.version = header["version"]
+        self.records = header["records"]
+        self.regions = tuple(header["regions"])
+        self.built_at = header["built_at"]
+
+        self._strings = header["strings"]
+        self._ids = {name: i for i, name in enumerate(self._strings)}
+
+        columns = {}
+
+        for name, (offset, dtype) in header["columns"].items():
+            if self.records:
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(self.records,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+
+        self._keys = columns["key"]
+        self._years = columns["year"]
+        self._values = columns["value"]
+        self._lows = columns["low"]
+        self._highs = columns["high"]
+
+        # (region, year) -> resolved factors / point-value index
+        self._resolved = {}
+        self._indexes = {}
+
+    def _resolve_region(self, region_id, year):
+        """
+        {(category, sub_category): (low, value, high)} for one region,
+        using each factor's latest year not after year.
+        """
+        first = np.uint64(region_id << 2 * _ID_BITS)
+        last = np.uint64((region_id + 1) << 2 * _ID_BITS)
+
+        start = int(np.searchsorted(self._keys, first, "left"))
+        stop = int(np.searchsorted(self._keys, last, "left"))
+
+        keys = np.asarray(self._keys[start:stop])
+        eligible = np.flatnonzero(np.asarray(self._years[start:stop]) <= year)
+
+        if not len(eligible):
+            return {}
+
+        # Years ascend within a key, so the last eligible row of each key
+        # is its latest applicable year
+        eligible_keys = keys[eligible]
+        latest = start + eligible[np.append(eligible_keys[1:] != eligible_keys[:-1], True)]
+
+        factors = {}
+
+        for key, low, value, high in zip(
+            self._keys[latest].tolist(),
+            self._lows[latest].tolist(),
+            self._values[latest].tolist(),
+            self._highs[latest].tolist()
+        ):
+            category = self._strings[(key >> _ID_BITS) & _ID_MASK]
+            sub_category = self._strings[key & _ID_MASK]
+            factors[(category, sub_category)] = (low, value, high)
+
+        return factors
+
+    def resolve(self, region=None, on=None):
+        """
+        Factor set for a region and date: each factor's latest year not
+        after the date's year, from the region where it has one and from
+        DEFAULT_REGION otherwise.
+
+        Returns {(category, sub_category): (low, value, high)}.
+        Raises ValueError for regions the catalog does not know.
+        """
+        region = _as_region(region)
+        year = _as_year(on)
+
+        cache_key = (region, year)
+        factors = self._resolved.get(cache_key)
+
+        if factors is not None:
+            return factors
+
+        if region not in self.regions:
+            raise ValueError(f"Unknown emission factor region: {region}")
+
+        factors = {}
+
+        if DEFAULT_REGION in self._ids:
+            factors.update(self._resolve_region(self._ids[DEFAULT_REGION], year))
+
+        if region != DEFAULT_REGION:
+            factors.update(self._resolve_region(self._ids[region], year))
+
+        if len(self._resolved) >= RESOLVED_CACHE_SIZE:
+            self._resolved.clear()
+            self._indexes.clear()
+
+        self._resolved[cache_key] = factors
+
+        return factors
+
+    def index(self, region=None, on=None):
+        """
+        {(category, sub_category): co2_per_unit}, as load_factor_index.
+        """
+        # Normalized like resolve(), so "in" and "IN" share one index
+        cache_key = (_as_region(region), _as_year(on))
+        index = self._indexes.get(cache_key)
+
+        if index is None:
+            index = {key: value for key, (_, value, _) in self.resolve(region, on).items()}
+            self._indexes[cache_key] = index
+
+        return index
+
+    def ranges(self, region=None, on=None):
+        """
+        {(category, sub_category): (low, mode, high)}, as load_factor_ranges.
+        """
+        return self.resolve(region, on)
+
+
+_CATALOG_STATE = None
+_LAST_CHECK = 0.0
+_CATALOG_LOCK = threading.Lock()
+
+
+def get_catalog(path=None):
+    """
+    Returns the catalog at path (CATALOG_PATH by default), reopening it
+    when the file is replaced on disk.
+
+    The file is stat'ed at most once every RELOAD_CHECK_INTERVAL seconds.
+    A catalog that fails to open keeps the previous one in service.
+    """
+    global _CATALOG_STATE, _LAST_CHECK
+
+    path = path or CATALOG_PATH
+    state = _CATALOG_STATE
+    now = time.monotonic()
+
+    if state is not None and state[0] == path and now - _LAST_CHECK < RELOAD_CHECK_INTERVAL:
+        return state[2]
+
+    with _CATALOG_LOCK:
+        state = _CATALOG_STATE
+        _LAST_CHECK = now
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if state is not None and state[0] == path:
+                logger.warning("Emission factor catalog is unavailable, keeping current catalog")
+                return state[2]
+            raise CatalogUnavailable(
+                f"Emission factor catalog not found at {path}; build it with "
+                "python backend/factor_catalog.py"
+            )
+
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        if state is not None and state[0] == path and state[1] == signature:
+            return state[2]
+
+        try:
+            catalog = FactorCatalog(path)
+        except (ValueError, KeyError, OSError) as error:
+            if state is None or state[0] != path:
+                raise CatalogUnavailable(f"Cannot open emission factor catalog {path}: {error}") from error
+            logger.exception("Rejected emission factor catalog update, keeping current catalog")
+            _CATALOG_STATE = (path, signature, state[2])
+            return state[2]
+
+        _CATALOG_STATE = (path, signature, catalog)
+
+        return catalog
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile emission factor CSVs into the binary catalog")
+    parser.add_argument("sources", nargs="*", default=list(DEFAULT_SOURCES), help="CSV files or directories of CSVs")
+    parser.add_argument("--output", "-o", default=CATALOG_PATH)
+    args = parser.parse_args()
+
+    sources = args.sources
+    if sources == list(DEFAULT_SOURCES):
+        # The regional directory is optional
+        sources = [source for source in sources if os.path.exists(source)]
+
+    header = build_catalog(sources, args.output)
+
+    print(
+        f"Built {args.output}: {header['records']} factors, "
+        f"{len(header['regions'])} regions, version {header['version']}"
+    )
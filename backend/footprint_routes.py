@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from database import get_db
 from models import Footprint
 from schemas import FootprintCreate
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, footprint_history_page
 
 router = APIRouter()
 
@@ -21,10 +25,22 @@ def save_footprint(data: FootprintCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/user/{user_id}/footprints")
-def get_history(user_id: int, db: Session = Depends(get_db)):
-
-    results = db.query(Footprint).filter(
-        Footprint.user_id == user_id
-    ).all()
-
-    return results
\ No newline at end of file
+def get_history(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+
+    try:
+        results, next_cursor = footprint_history_page(db, user_id, limit, after, start, end)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return results
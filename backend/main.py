@@ -1,20 +1,74 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from enum import Enum
-from carbon_calculator import calculate_total_footprint
-from database import engine, get_db
+import numpy as np
+from carbon_calculator import (
+    BATCH_INPUT_COLUMNS, calculate_total_footprint, calculate_footprint_batch, factor_set_version
+)
+from database import engine, get_session, run_db
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-from models import User, Footprint, Base
-from typing import List
-from datetime import datetime
+from models import User, Footprint, UserRecommendation, Base
+from rollups import record_footprints, get_rollup, rebuild_rollups
+from user_cache import resolve_user_id, resolve_user_ids, user_cache
+import metrics
+from metrics import MetricsMiddleware, CallbackGauge, time_stage
+from write_behind import (
+    WRITE_BEHIND_DURABILITY, WriteQueueFull, WriteQueueClosed,
+    get_write_queue, close_write_queue
+)
+from response_cache import (
+    response_cache,
+    latest_footprint_id,
+    latest_footprint_revision,
+    footprint_version,
+    make_etag,
+    etag_matches
+)
+from recommendation_refresh import get_refresher, close_refresher, validate_survey
+from ml.dispatcher import close_dispatcher, dispatcher_metrics
+from scenario_engine import describe_action
+from sketches import CATEGORIES as SKETCH_CATEGORIES, population_sketch
+from trends import DEFAULT_WINDOW, MAX_WINDOW, footprint_trends
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, footprint_history_page
+from upgrade_schema import check_schema
+from factor_catalog import CatalogUnavailable
+from export import MEDIA_TYPES as EXPORT_MEDIA_TYPES, stream_footprints, tenant_export_allowed
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime
 from pydantic import EmailStr, Field
 
 
 Base.metadata.create_all(bind=engine)
 
+# create_all does not add columns to existing tables; see upgrade_schema.py
+check_schema(engine)
+
 app = FastAPI(title="CarbonLens API")
 
+# None unless WRITE_BEHIND is enabled
+write_queue = get_write_queue()
+
+# None unless RECOMMENDATIONS_ML is enabled
+refresher = get_refresher()
+
+
+@app.on_event("startup")
+def start_background_workers():
+    population_sketch.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    # Queued footprints are flushed first so the sketches count them
+    close_write_queue()
+    population_sketch.close()
+    close_refresher()
+    close_dispatcher()
+
 # ---------- CORS (IMPORTANT FOR FRONTEND) ----------
 
 app.add_middleware(
@@ -23,8 +77,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Outermost, so latency includes the other middleware
+if metrics.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # ---------- ENUMS ----------
 
 class TransportMode(str, Enum):
@@ -39,6 +98,11 @@ class DietType(str, Enum):
     non_veg = "non_veg"
 
 
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
 # ---------- AUTH MODELS ----------
 
 class RegisterRequest(BaseModel):
@@ -71,6 +135,32 @@ class FootprintRequest(BaseModel):
     meals_per_month: float = Field(..., ge=0)
     waste_kg: float = Field(..., ge=0)
 
+    # Grid region and activity date selecting the emission factors from
+    # the factor catalog; the global factors are used when both are unset
+    region: Optional[str] = None
+    activity_date: Optional[date] = None
+
+    # Raw lifestyle survey answers for the adoption models. Stored and
+    # reused for later footprints sent without one.
+    survey: Optional[Dict[str, Any]] = None
+
+    @field_validator("survey")
+    @classmethod
+    def check_survey(cls, survey):
+        # Rejected here, so a bad survey cannot fail a background refresh
+        if survey is not None:
+            validate_survey(survey)
+        return survey
+
+
+# ---------- BATCH FOOTPRINT REQUEST ----------
+
+MAX_BATCH_SIZE = 10000
+
+
+class BatchFootprintRequest(BaseModel):
+    footprints: List[FootprintRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
 
 # ---------- FOOTPRINT RESPONSE ----------
 
@@ -108,11 +198,51 @@ class UserAnalytics(BaseModel):
     trend: str
 
 
+class TrendBucket(BaseModel):
+    bucket_start: date
+    records: int
+    average: Dict[str, float]
+    sum: Dict[str, float]
+    rolling_average: Dict[str, float]
+
+
+class TrendAnalytics(BaseModel):
+    bucket: str
+    window: int
+    records: int
+    buckets: List[TrendBucket]
+    slope_per_day: Dict[str, Optional[float]]
+    trend: str
+
+
+class CategoryPercentile(BaseModel):
+    value: float
+    percentile: float
+    max_error: float
+
+
+class UserPercentiles(BaseModel):
+    population: int
+    percentiles: Dict[str, CategoryPercentile]
+
+
 # ---------- RECOMMENDATION MODEL ----------
 
+class RankedAction(BaseModel):
+    action: Dict[str, Any]
+    description: str
+    reduction: float
+    adoption_probability: float
+    final_score: float
+
+
 class RecommendationResponse(BaseModel):
     dominant_category: str
     recommendations: List[str]
+    # "ml" when ranked for the latest footprint, "fallback" while the
+    # ranking is being refreshed
+    source: str
+    ranked_actions: List[RankedAction] = []
 
 
 # ---------- RECOMMENDATION LOGIC ----------
@@ -167,8 +297,7 @@ def generate_recommendations(footprint: Footprint):
 
 # ---------- AUTH ENDPOINTS ----------
 
-@app.post("/register", response_model=AuthResponse)
-def register(request: RegisterRequest, db: Session = Depends(get_db)):
+def _register(db: Session, request: RegisterRequest):
 
     existing_user = db.query(User).filter(User.email == request.email).first()
 
@@ -188,8 +317,12 @@ def register(request: RegisterRequest, db: Session = Depends(get_db)):
     return user
 
 
-@app.post("/login", response_model=AuthResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+@app.post("/register", response_model=AuthResponse)
+async def register(request: RegisterRequest, db=Depends(get_session)):
+    return await run_db(db, _register, request)
+
+
+def _login(db: Session, request: LoginRequest):
 
     user = db.query(User).filter(User.email == request.email).first()
 
@@ -199,91 +332,428 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     return user
 
 
+@app.post("/login", response_model=AuthResponse)
+async def login(request: LoginRequest, db=Depends(get_session)):
+    return await run_db(db, _login, request)
+
+
 # ---------- CARBON CALCULATION ----------
 
-@app.post("/calculate", response_model=FootprintResponse)
-def calculate(request: FootprintRequest, db: Session = Depends(get_db)):
+def _factor_date(request: FootprintRequest):
+    """
+    Date the emission factors are resolved for. Regional factors default
+    to today; the resolved date is stored so a later recompute uses the
+    same year.
+    """
+    if request.activity_date is None and request.region is not None:
+        return date.today()
+
+    return request.activity_date
 
-    data = request.dict()
+
+# Footprints are computed in the threadpool before the database work
+# runs through run_db, so with DB_ASYNC the calculation (and any factor
+# reload it triggers) does not run on the event loop.
+
+def _compute_footprint(request: FootprintRequest):
+
+    data = request.dict(exclude={"survey", "region", "activity_date"})
 
     data["transport_mode"] = data["transport_mode"].value
     data["diet_type"] = data["diet_type"].value
 
-    user = db.query(User).filter(User.email == request.email).first()
+    on = _factor_date(request)
+
+    try:
+        version = factor_set_version(request.region, on)
+        result = calculate_total_footprint(data, request.region, on)
+    except CatalogUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    # Stored with the footprint so it can be recomputed later
+    record = {
+        **{key: data[key] for key in BATCH_INPUT_COLUMNS},
+        "region": request.region,
+        "activity_date": on,
+        "factor_version": version
+    }
+
+    return result, record
+
 
-    if not user:
+def _resolve_request_user(db: Session, request: FootprintRequest):
+
+    user_id = resolve_user_id(db, request.email)
+
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    result = calculate_total_footprint(data)
+    return user_id
+
+
+def _refresh_recommendations(user_id: int, footprint_id: int, record, survey):
+
+    if refresher is not None:
+        inputs = {key: record[key] for key in BATCH_INPUT_COLUMNS}
+        refresher.submit(user_id, footprint_id, inputs, survey)
+
+
+def _calculate(db: Session, request: FootprintRequest, result, record):
+
+    user_id = _resolve_request_user(db, request)
 
     footprint = Footprint(
-        user_id=user.id,
+        user_id=user_id,
         electricity=result["electricity"],
         transport=result["transport"],
         food=result["food"],
         waste=result["waste"],
         total=result["total"],
+        **record
     )
 
     db.add(footprint)
-    db.commit()
+    record_footprints(db, {user_id: [result["total"]]})
+
+    with time_stage("commit"):
+        db.commit()
+
+    response_cache.invalidate_user(user_id)
+    population_sketch.add_rows([result])
+
+    _refresh_recommendations(user_id, footprint.id, record, request.survey)
+
+    return result
+
+
+def _queue_calculation(db: Session, request: FootprintRequest, result, record):
+
+    user_id = _resolve_request_user(db, request)
+
+    def on_commit(footprint_id):
+        _refresh_recommendations(user_id, footprint_id, record, request.survey)
+
+    try:
+        pending = write_queue.submit(user_id, result, record, on_commit)
+    except (WriteQueueFull, WriteQueueClosed) as error:
+        raise HTTPException(status_code=503, detail=str(error))
+
+    return result, pending
+
+
+@app.post("/calculate", response_model=FootprintResponse)
+async def calculate(request: FootprintRequest, db=Depends(get_session)):
+
+    result, record = await run_in_threadpool(_compute_footprint, request)
+
+    if write_queue is None:
+        return await run_db(db, _calculate, request, result, record)
+
+    # Write-behind: the footprint is inserted by the queue's worker
+    result, pending = await run_db(db, _queue_calculation, request, result, record)
+
+    if WRITE_BEHIND_DURABILITY == "committed":
+        try:
+            await run_in_threadpool(pending.wait)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Footprint could not be saved")
 
     return result
 
 
+def _compute_batch(request: BatchFootprintRequest):
+    """
+    Returns (result columns, footprint rows without their user ids).
+    """
+    items = request.footprints
+
+    inputs = {
+        "electricity_kwh": [item.electricity_kwh for item in items],
+        "transport_mode": [item.transport_mode.value for item in items],
+        "transport_km": [item.transport_km for item in items],
+        "diet_type": [item.diet_type.value for item in items],
+        "meals_per_month": [item.meals_per_month for item in items],
+        "waste_kg": [item.waste_kg for item in items]
+    }
+
+    # One vectorized pass per factor set, usually just one
+    factor_keys = [(item.region, _factor_date(item)) for item in items]
+
+    groups = {}
+    for i, key in enumerate(factor_keys):
+        groups.setdefault(key, []).append(i)
+
+    versions = {}
+
+    try:
+        for region, on in groups:
+            versions[(region, on)] = factor_set_version(region, on)
+
+        if len(groups) == 1:
+            (region, on), = groups
+            results = calculate_footprint_batch(inputs, region, on)
+        else:
+            results = {}
+            for (region, on), positions in groups.items():
+                group = calculate_footprint_batch(
+                    {key: [values[i] for i in positions] for key, values in inputs.items()},
+                    region,
+                    on
+                )
+                for key, values in group.items():
+                    results.setdefault(key, np.empty(len(items)))[positions] = values
+    except CatalogUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+    columns = {key: values.tolist() for key, values in results.items()}
+
+    rows = [
+        {
+            "electricity": columns["electricity"][i],
+            "transport": columns["transport"][i],
+            "food": columns["food"][i],
+            "waste": columns["waste"][i],
+            "total": columns["total"][i],
+            **{key: values[i] for key, values in inputs.items()},
+            "region": factor_keys[i][0],
+            "activity_date": factor_keys[i][1],
+            "factor_version": versions[factor_keys[i]]
+        }
+        for i, item in enumerate(items)
+    ]
+
+    return columns, rows
+
+
+def _calculate_batch(db: Session, request: BatchFootprintRequest, columns, rows):
+
+    items = request.footprints
+
+    emails = {item.email for item in items}
+
+    user_ids = resolve_user_ids(db, emails)
+
+    missing = sorted(emails - user_ids.keys())
+
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
+
+    for row, item in zip(rows, items):
+        row["user_id"] = user_ids[item.email]
+
+    totals_by_user = {}
+    for row in rows:
+        totals_by_user.setdefault(row["user_id"], []).append(row["total"])
+
+    # Single multi-row insert and one commit for the whole batch
+    footprint_ids = db.scalars(
+        insert(Footprint).returning(Footprint.id, sort_by_parameter_order=True),
+        rows
+    ).all()
+    record_footprints(db, totals_by_user)
+
+    with time_stage("commit"):
+        db.commit()
+
+    for user_id in totals_by_user:
+        response_cache.invalidate_user(user_id)
+
+    population_sketch.add(columns)
+
+    # Only each user's last footprint in the batch needs a ranking
+    last_index = {row["user_id"]: i for i, row in enumerate(rows)}
+
+    for user_id, i in last_index.items():
+        _refresh_recommendations(
+            user_id,
+            footprint_ids[i],
+            rows[i],
+            items[i].survey
+        )
+
+    return [
+        {key: columns[key][i] for key in columns}
+        for i in range(len(items))
+    ]
+
+
+@app.post("/calculate/batch", response_model=List[FootprintResponse])
+async def calculate_batch(request: BatchFootprintRequest, db=Depends(get_session)):
+    columns, rows = await run_in_threadpool(_compute_batch, request)
+    return await run_db(db, _calculate_batch, request, columns, rows)
+
+
 # ---------- HISTORY ----------
 
-@app.get("/users/{email}/footprints", response_model=List[FootprintHistoryItem])
-def get_user_footprints(email: str, db: Session = Depends(get_db)):
+def _get_user_footprints(db: Session, email: str, limit: int, after, start, end):
 
-    user = db.query(User).filter(User.email == email).first()
+    user_id = resolve_user_id(db, email)
 
-    if not user:
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    footprints = (
-        db.query(Footprint)
-        .filter(Footprint.user_id == user.id)
-        .order_by(Footprint.created_at.desc())
-        .all()
+    try:
+        return footprint_history_page(db, user_id, limit, after, start, end)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@app.get("/users/{email}/footprints", response_model=List[FootprintHistoryItem])
+async def get_user_footprints(
+    email: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=Depends(get_session)
+):
+    footprints, next_cursor = await run_db(
+        db, _get_user_footprints, email, limit, after, start, end
     )
 
+    # Pass the cursor back as ?after= to fetch the next (older) page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
     return footprints
 
 
-# ---------- ANALYTICS ----------
+# ---------- EXPORT ----------
 
-@app.get("/users/{email}/analytics", response_model=UserAnalytics)
-def get_user_analytics(email: str, db: Session = Depends(get_db)):
+def _export_user_ids(db: Session, emails: List[str]):
 
-    user = db.query(User).filter(User.email == email).first()
+    user_ids = resolve_user_ids(db, emails)
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    missing = [email for email in emails if email not in user_ids]
+
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
 
-    footprints = (
-        db.query(Footprint)
-        .filter(Footprint.user_id == user.id)
-        .order_by(Footprint.created_at.asc())
-        .all()
+    return list(user_ids.values())
+
+
+def _export_response(fmt: ExportFormat, user_ids, start, end):
+    # The rows are read on the export's own session while the response is
+    # sent; the request session is closed before streaming starts
+    return StreamingResponse(
+        stream_footprints(fmt.value, user_ids, start, end),
+        media_type=EXPORT_MEDIA_TYPES[fmt.value],
+        headers={"Content-Disposition": f'attachment; filename="footprints.{fmt.value}"'}
     )
 
-    if not footprints:
+
+@app.get("/users/{email}/footprints/export")
+async def export_user_footprints(
+    email: str,
+    format: ExportFormat = ExportFormat.csv,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db=Depends(get_session)
+):
+    user_ids = await run_db(db, _export_user_ids, [email])
+
+    return _export_response(format, user_ids, start, end)
+
+
+@app.get("/footprints/export")
+async def export_footprints(
+    format: ExportFormat = ExportFormat.csv,
+    email: Optional[List[str]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    x_admin_token: Optional[str] = Header(None),
+    db=Depends(get_session)
+):
+    # Dumps every user's data, so only for holders of EXPORT_ADMIN_TOKEN
+    if not tenant_export_allowed(x_admin_token):
+        raise HTTPException(status_code=403, detail="Tenant export requires an admin token")
+
+    # Every user's footprints unless filtered by ?email=
+    user_ids = await run_db(db, _export_user_ids, email) if email else None
+
+    return _export_response(format, user_ids, start, end)
+
+
+# ---------- CONDITIONAL RESPONSES ----------
+
+def _cached_user_response(
+    db: Session, email: str, if_none_match, endpoint: str, build, get_version=footprint_version
+):
+    """
+    Returns (etag, payload) for a per-user endpoint whose response only
+    changes when a footprint is stored. payload is None when the client's
+    copy is current; otherwise it comes from the response cache or from
+    build(db, user_id).
+
+    get_version(db, user_id) defaults to footprint_version.
+    """
+    user_id = resolve_user_id(db, email)
+
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    version = get_version(db, user_id)
+
+    if version is None:
         raise HTTPException(status_code=404, detail="No footprint records found")
 
-    totals = [f.total for f in footprints]
+    etag = make_etag(version)
+
+    if etag_matches(if_none_match, etag):
+        return etag, None
+
+    payload = response_cache.get(endpoint, user_id, version)
+
+    if payload is None:
+        payload = build(db, user_id)
+        response_cache.put(endpoint, user_id, version, payload)
+
+    return etag, payload
+
+
+def _conditional_response(response: Response, etag: str, payload):
+
+    # Browsers revalidate on every load and get a 304 while nothing changed
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if payload is None:
+        return Response(status_code=304, headers=headers)
 
-    total_records = len(totals)
-    average = sum(totals) / total_records
-    highest = max(totals)
-    lowest = min(totals)
-    latest = totals[-1]
+    response.headers.update(headers)
+
+    return payload
+
+
+# ---------- ANALYTICS ----------
+
+def _analytics_payload(db: Session, user_id: int):
+
+    # Aggregates are maintained by /calculate, so this is one primary-key read
+    rollup = get_rollup(db, user_id)
+
+    # Footprints stored before rollups existed are backfilled on first read
+    if not rollup and rebuild_rollups(db, [user_id]):
+        rollup = get_rollup(db, user_id)
+
+    if not rollup:
+        raise HTTPException(status_code=404, detail="No footprint records found")
+
+    total_records = rollup.record_count
+    average = rollup.total_sum / total_records
+    highest = rollup.max_total
+    lowest = rollup.min_total
+    latest = rollup.last_total
 
     trend = "insufficient data"
     if total_records >= 2:
-        if totals[-1] > totals[-2]:
+        if rollup.last_total > rollup.previous_total:
             trend = "increasing"
-        elif totals[-1] < totals[-2]:
+        elif rollup.last_total < rollup.previous_total:
             trend = "decreasing"
         else:
             trend = "stable"
@@ -298,34 +768,255 @@ def get_user_analytics(email: str, db: Session = Depends(get_db)):
     }
 
 
-# ---------- RECOMMENDATIONS ----------
+def _get_user_analytics(db: Session, email: str, if_none_match: Optional[str]):
+    return _cached_user_response(db, email, if_none_match, "analytics", _analytics_payload)
 
-@app.get("/users/{email}/recommendations", response_model=RecommendationResponse)
-def get_recommendations(email: str, db: Session = Depends(get_db)):
 
-    user = db.query(User).filter(User.email == email).first()
+@app.get("/users/{email}/analytics", response_model=UserAnalytics)
+async def get_user_analytics(
+    email: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_session)
+):
+    etag, payload = await run_db(db, _get_user_analytics, email, if_none_match)
+    return _conditional_response(response, etag, payload)
+
 
-    if not user:
+def _get_user_trends(db: Session, email: str, bucket: str, start, end, window: int):
+
+    user_id = resolve_user_id(db, email)
+
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    try:
+        return footprint_trends(db, user_id, bucket, start, end, window)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+
+
+@app.get("/users/{email}/analytics/trends", response_model=TrendAnalytics)
+async def get_user_trends(
+    email: str,
+    bucket: str = "month",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    window: int = Query(DEFAULT_WINDOW, ge=1, le=MAX_WINDOW),
+    db=Depends(get_session)
+):
+    return await run_db(db, _get_user_trends, email, bucket, start, end, window)
+
+
+# ---------- PERCENTILES ----------
+
+def _get_user_percentiles(db: Session, email: str):
+
+    user_id = resolve_user_id(db, email)
+
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    latest_footprint = (
-        db.query(Footprint)
-        .filter(Footprint.user_id == user.id)
-        .order_by(Footprint.created_at.desc())
-        .first()
+    footprint_id = latest_footprint_id(db, user_id)
+
+    if footprint_id is None:
+        raise HTTPException(status_code=404, detail="No footprint records found")
+
+    latest_footprint = db.get(Footprint, footprint_id)
+
+    population_sketch.ensure_loaded(db)
+
+    percentiles = {}
+
+    for category in SKETCH_CATEGORIES:
+        value = getattr(latest_footprint, category)
+        rank = population_sketch.percentile(category, value)
+
+        if rank is None:
+            raise HTTPException(status_code=404, detail="No population data yet")
+
+        percentiles[category] = {
+            "value": value,
+            "percentile": round(rank[0], 2),
+            "max_error": round(rank[1], 2)
+        }
+
+    return {
+        "population": population_sketch.count(),
+        "percentiles": percentiles
+    }
+
+
+@app.get("/users/{email}/percentiles", response_model=UserPercentiles)
+async def get_user_percentiles(email: str, db=Depends(get_session)):
+    return await run_db(db, _get_user_percentiles, email)
+
+
+# ---------- RECOMMENDATIONS ----------
+
+FALLBACK_SUFFIX = "-fallback"
+
+
+def _stored_ranking(db: Session, user_id: int):
+
+    return db.execute(
+        select(UserRecommendation.footprint_id, UserRecommendation.recommendations)
+        .where(UserRecommendation.user_id == user_id)
+    ).first()
+
+
+def _recommendations_version(db: Session, user_id: int):
+    """
+    The footprint version while the stored ranking was computed for the
+    latest footprint, otherwise the version with a fallback suffix, so
+    clients holding the fallback response get the ranking once the
+    refresh lands.
+    """
+    latest = latest_footprint_revision(db, user_id)
+
+    if latest is None:
+        return None
+
+    footprint_id, revision = latest
+    version = f"{footprint_id}.{revision}"
+
+    # Primary-key read of the stamp only, not the stored ranking
+    stored = db.scalar(
+        select(UserRecommendation.footprint_id)
+        .where(UserRecommendation.user_id == user_id)
     )
 
+    if stored == footprint_id:
+        return version
+
+    return f"{version}{FALLBACK_SUFFIX}"
+
+
+def _recommendations_payload(db: Session, user_id: int):
+
+    footprint_id = latest_footprint_id(db, user_id)
+
+    latest_footprint = db.get(Footprint, footprint_id) if footprint_id is not None else None
+
     if not latest_footprint:
         raise HTTPException(status_code=404, detail="No footprint records found")
 
     dominant_category, recommendations = generate_recommendations(latest_footprint)
 
+    stored = _stored_ranking(db, user_id)
+
+    # Fast path until the refresher has ranked the latest footprint
+    if stored is None or stored.footprint_id != footprint_id:
+        return {
+            "dominant_category": dominant_category,
+            "recommendations": recommendations,
+            "source": "fallback",
+            "ranked_actions": []
+        }
+
+    ranked_actions = [
+        {"description": describe_action(item["action"]), **item}
+        for item in stored.recommendations
+    ]
+
     return {
         "dominant_category": dominant_category,
-        "recommendations": recommendations
+        "recommendations": [
+            f"{item['description']} (saves about {item['reduction']:.1f} kg CO2)"
+            for item in ranked_actions
+        ],
+        "source": "ml",
+        "ranked_actions": ranked_actions
     }
 
 
+def _get_recommendations(db: Session, email: str, if_none_match: Optional[str]):
+    return _cached_user_response(
+        db, email, if_none_match, "recommendations",
+        _recommendations_payload, _recommendations_version
+    )
+
+
+@app.get("/users/{email}/recommendations", response_model=RecommendationResponse)
+async def get_recommendations(
+    email: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db=Depends(get_session)
+):
+    etag, payload = await run_db(db, _get_recommendations, email, if_none_match)
+    return _conditional_response(response, etag, payload)
+
+
+# ---------- METRICS ----------
+
+CallbackGauge(
+    "carbonlens_user_cache_lookups_total",
+    "Email to user id cache lookups by result",
+    lambda: {("hit",): user_cache.hits, ("miss",): user_cache.misses},
+    ("result",),
+    kind="counter"
+)
+
+CallbackGauge(
+    "carbonlens_response_cache_lookups_total",
+    "Analytics and recommendation response cache lookups by result",
+    lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses},
+    ("result",),
+    kind="counter"
+)
+
+if write_queue is not None:
+    CallbackGauge(
+        "carbonlens_write_queue_depth",
+        "Footprints waiting for the write-behind flush",
+        lambda: {(): write_queue.metrics()["queue_depth"]}
+    )
+
+if refresher is not None:
+    CallbackGauge(
+        "carbonlens_recommendation_refresh_queue_depth",
+        "Footprints waiting for their recommendations to be ranked",
+        lambda: {(): refresher.metrics()["queue_depth"]}
+    )
+
+
+def _dispatcher_sample(key):
+    # No samples until recommend_actions loads the models and the dispatcher
+    stats = dispatcher_metrics()
+    return {(): stats[key]} if stats is not None else {}
+
+
+CallbackGauge(
+    "carbonlens_inference_queue_depth",
+    "Adoption model requests waiting for the inference dispatcher",
+    lambda: _dispatcher_sample("queue_depth")
+)
+
+CallbackGauge(
+    "carbonlens_inference_batches_total",
+    "Inference dispatcher batches by row count, rounded up to a power of two",
+    lambda: {
+        (str(rows),): count
+        for rows, count in (dispatcher_metrics() or {}).get("batch_rows_histogram", {}).items()
+    },
+    ("rows",),
+    kind="counter"
+)
+
+CallbackGauge(
+    "carbonlens_inference_rows_total",
+    "Rows scored by the inference dispatcher",
+    lambda: _dispatcher_sample("rows"),
+    kind="counter"
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # ---------- ROOT ----------
 
 @app.get("/")
@@ -0,0 +1,334 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Stage timing and database hooks cost about a microsecond per call;
+# set METRICS_ENABLED=false to remove them entirely
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+# Returned by the timing helpers when metrics are disabled
+_NOT_TIMED = nullcontext()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ""
+
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets and optional labels.
+
+    Each thread records into its own shard without locking, and shards
+    are summed at scrape time, so observe() stays cheap enough for hot
+    paths.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+        # Per thread: labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+        _registry.append(self)
+
+    def _new_shard(self):
+        shard = self._local.series = {}
+
+        with self._lock:
+            self._shards.append(shard)
+
+        return shard
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+
+        try:
+            shard = self._local.series
+        except AttributeError:
+            shard = self._new_shard()
+
+        series = shard.get(labels)
+
+        if series is None:
+            series = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels):
+        """
+        Context manager timing a block; a no-op when metrics are disabled.
+        """
+        if not METRICS_ENABLED:
+            return _NOT_TIMED
+
+        return self._time(labels)
+
+    @contextmanager
+    def _time(self, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def _collect(self):
+        merged = {}
+
+        with self._lock:
+            shards = list(self._shards)
+
+        for shard in shards:
+            for labels, (counts, total, count) in list(shard.items()):
+                entry = merged.setdefault(labels, [[0] * len(counts), 0.0, 0])
+
+                for i, bucket_count in enumerate(counts):
+                    entry[0][i] += bucket_count
+
+                entry[1] += total
+                entry[2] += count
+
+        return merged
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram"
+        ]
+
+        for labels, (counts, total, count) in sorted(self._collect().items()):
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+
+        return lines
+
+
+class CallbackGauge:
+    """
+    Gauge (or counter) whose samples are read from callback() at scrape
+    time. callback returns {labels tuple: value}.
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+        _registry.append(self)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+
+        return lines
+
+
+def render():
+    """
+    All registered metrics in the Prometheus text exposition format.
+    """
+    lines = []
+
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+# ---------- METRICS ----------
+
+REQUEST_SECONDS = Histogram(
+    "carbonlens_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status")
+)
+
+REQUEST_DB_QUERIES = Histogram(
+    "carbonlens_http_request_db_queries",
+    "Database queries issued per HTTP request",
+    ("method", "route"),
+    QUERY_COUNT_BUCKETS
+)
+
+REQUEST_DB_SECONDS = Histogram(
+    "carbonlens_http_request_db_seconds",
+    "Time spent in database queries per HTTP request",
+    ("method", "route")
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "carbonlens_db_query_duration_seconds",
+    "Latency of individual database queries"
+)
+
+STAGE_SECONDS = Histogram(
+    "carbonlens_stage_duration_seconds",
+    "Latency of instrumented processing stages",
+    ("stage",)
+)
+
+MODEL_INFERENCE_SECONDS = Histogram(
+    "carbonlens_model_inference_seconds",
+    "Latency of one adoption model's predict call",
+    ("model",)
+)
+
+
+# ---------- STAGE TIMING ----------
+
+def time_stage(stage):
+    """
+    Context manager timing a block as the given stage; a no-op when
+    metrics are disabled.
+    """
+    return STAGE_SECONDS.time(stage)
+
+
+def timed(stage):
+    """
+    Decorator timing every call of the function as the given stage.
+    Returns the function unchanged when metrics are disabled.
+    """
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+        return wrapper
+
+    return decorator
+
+
+# ---------- DATABASE QUERIES ----------
+
+# [queries, seconds] for the request being served, if any. A mutable list
+# so updates made in threadpool copies of the context are seen by the
+# middleware.
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    DB_QUERY_SECONDS.observe(elapsed)
+
+    stats = _request_db.get()
+
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+if METRICS_ENABLED:
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------- REQUESTS ----------
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, query count and database time per
+    request, labelled by route template so emails in paths do not become
+    separate series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db.reset(token)
+
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+
+            REQUEST_SECONDS.observe(elapsed, method, route, str(status[0]))
+            REQUEST_DB_QUERIES.observe(stats[0], method, route)
+            REQUEST_DB_SECONDS.observe(stats[1], method, route)
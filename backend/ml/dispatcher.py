@@ -0,0 +1,294 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Default batching window: a batch is dispatched after this many
+# milliseconds, or as soon as it holds this many rows
+DEFAULT_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+DEFAULT_MAX_BATCH_ROWS = int(os.getenv("INFERENCE_MAX_BATCH_ROWS", "64"))
+
+# Seconds a caller waits for its batch before predict() gives up
+DEFAULT_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", "30"))
+
+_STOP = object()
+
+
+class _PendingRequest:
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.rows = len(matrix)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InferenceDispatcher:
+    """
+    Gathers adoption-probability requests from concurrent callers and
+    runs each model once per batch instead of once per request.
+
+    Callers block in predict() until their batch has been processed.
+    A single daemon worker thread collects requests for up to max_wait_ms
+    (or until max_batch_rows rows are queued), stacks them into one
+    feature matrix, predicts and fans the results back out.
+    """
+
+    def __init__(
+        self,
+        predict_batch=None,
+        columns=None,
+        max_wait_ms=DEFAULT_MAX_WAIT_MS,
+        max_batch_rows=DEFAULT_MAX_BATCH_ROWS,
+        timeout_s=DEFAULT_TIMEOUT_S
+    ):
+        if predict_batch is None or columns is None:
+            # Imported here: loading ml.predict loads the trained models
+            from ml.predict import predict_adoption_probabilities_batch, get_feature_columns
+
+            predict_batch = predict_batch or predict_adoption_probabilities_batch
+            columns = columns if columns is not None else get_feature_columns()
+
+        self._predict_batch = predict_batch
+        self._columns = list(columns)
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_rows = max_batch_rows
+        self.timeout = timeout_s
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self._requests = 0
+        self._rows = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._last_batch = 0
+        self._max_queue_depth = 0
+        self._batch_size_histogram = {}
+
+    def _enqueue(self, request):
+        # Under the lock, so close() cannot slip its stop marker and the
+        # final drain in between the check and the put
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Inference dispatcher is closed")
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="inference-dispatcher",
+                    daemon=True
+                )
+                self._thread.start()
+
+            self._queue.put(request)
+
+    def predict(self, features):
+        """
+        features: preprocessed dataframe, one row per user, or a NumPy
+        matrix in the training column order (see predict.encode_surveys)
+
+        Returns {action: array of probabilities}, one value per row,
+        exactly as predict_adoption_probabilities_batch would. Raises
+        TimeoutError if the batch is not done within timeout_s.
+        """
+        if isinstance(features, np.ndarray):
+            matrix = np.atleast_2d(features).astype(float, copy=False)
+
+            # Rejected here: a bad matrix would fail the whole batch's vstack
+            if matrix.ndim != 2 or matrix.shape[1] != len(self._columns):
+                raise ValueError(
+                    f"Expected {len(self._columns)} feature columns, got shape {matrix.shape}"
+                )
+        else:
+            matrix = (
+                features
+                .reindex(columns=self._columns, fill_value=0)
+                .to_numpy(dtype=float)
+            )
+
+        request = _PendingRequest(matrix)
+
+        self._enqueue(request)
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+
+        # Bounded, so a dead worker fails callers instead of hanging them
+        if not request.done.wait(self.timeout):
+            raise TimeoutError(f"Inference batch not done after {self.timeout} s")
+
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def predict_adoption_probabilities(self, user_input_df):
+        """
+        Drop-in replacement for predict.predict_adoption_probabilities.
+        """
+        if isinstance(user_input_df, np.ndarray):
+            features = np.atleast_2d(user_input_df)[:1]
+        else:
+            features = user_input_df.iloc[:1]
+
+        predictions = self.predict(features)
+
+        return {action: float(values[0]) for action, values in predictions.items()}
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            first = self._queue.get()
+
+            if first is _STOP:
+                break
+
+            batch = [first]
+            rows = first.rows
+            deadline = time.monotonic() + self.max_wait
+
+            while rows < self.max_batch_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if request is _STOP:
+                    stopping = True
+                    break
+
+                batch.append(request)
+                rows += request.rows
+
+            self._dispatch(batch, rows)
+
+    def _dispatch(self, batch, rows):
+        try:
+            features = pd.DataFrame(
+                np.vstack([request.matrix for request in batch]),
+                columns=self._columns
+            )
+
+            predictions = self._predict_batch(features)
+
+            offset = 0
+            for request in batch:
+                end = offset + request.rows
+                request.result = {
+                    action: values[offset:end] for action, values in predictions.items()
+                }
+                offset = end
+
+        except Exception as error:
+            for request in batch:
+                request.error = error
+
+        finally:
+            self._record_batch(len(batch), rows)
+
+            for request in batch:
+                request.done.set()
+
+    def _record_batch(self, requests, rows):
+        # Histogram buckets are powers of two: a batch of 5 rows counts under 8
+        bucket = 1 << max(rows - 1, 0).bit_length()
+
+        with self._lock:
+            self._requests += requests
+            self._rows += rows
+            self._batches += 1
+            self._last_batch = rows
+            self._largest_batch = max(self._largest_batch, rows)
+            self._batch_size_histogram[bucket] = self._batch_size_histogram.get(bucket, 0) + 1
+
+    def metrics(self):
+        """
+        Returns queue-depth and batch-size metrics.
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "rows": self._rows,
+                "batches": self._batches,
+                "average_batch_rows": self._rows / self._batches if self._batches else 0.0,
+                "largest_batch_rows": self._largest_batch,
+                "last_batch_rows": self._last_batch,
+                "batch_rows_histogram": dict(sorted(self._batch_size_histogram.items()))
+            }
+
+    def close(self):
+        """
+        Stops the worker after the requests already queued are processed.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+        # Fail anything that raced in behind the stop marker
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if request is not _STOP:
+                request.error = RuntimeError("Inference dispatcher is closed")
+                request.done.set()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Returns the process-wide dispatcher, creating it on first use. Its
+    window is set by INFERENCE_MAX_WAIT_MS and INFERENCE_MAX_BATCH_ROWS.
+    """
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = InferenceDispatcher()
+
+    return _dispatcher
+
+
+def dispatcher_metrics():
+    """
+    Returns the process-wide dispatcher's metrics, or None if it has not
+    been used yet.
+    """
+    with _dispatcher_lock:
+        dispatcher = _dispatcher
+
+    return dispatcher.metrics() if dispatcher is not None else None
+
+
+def close_dispatcher():
+    with _dispatcher_lock:
+        dispatcher = _dispatcher
+
+    if dispatcher is not None:
+        dispatcher.close()
@@ -0,0 +1,155 @@
+import numpy as np
+
+# Storage modes for exported forests
+#   float64:   exact thresholds and leaf values
+#   float32:   half-size thresholds and leaf values
+#   quantized: float32 thresholds, leaf values stored as uint8 codes
+EXPORT_MODES = ("float64", "float32", "quantized")
+
+# Largest difference from sklearn's predictions accepted by verify_forest
+VERIFY_TOLERANCE = {
+    "float64": 1e-9,
+    "float32": 1e-3,
+    "quantized": 2e-2
+}
+
+
+def export_forest(model, mode="float64"):
+    """
+    Flattens a fitted RandomForestRegressor into contiguous NumPy arrays.
+
+    Nodes of every tree are concatenated, child indices are made global
+    and leaves point to themselves, so prediction can walk every tree in
+    lockstep without branching on leaves.
+
+    Returns a dictionary of arrays accepted by CompactForest.
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unsupported export mode: {mode}")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left < 0
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0])
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    value = np.concatenate(values)
+    float_type = np.float64 if mode == "float64" else np.float32
+
+    exported = {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": np.concatenate(thresholds).astype(float_type),
+        "left": np.concatenate(lefts).astype(np.int32),
+        "right": np.concatenate(rights).astype(np.int32),
+        "root": np.array(roots, dtype=np.int32),
+        "max_depth": np.array(max_depth, dtype=np.int32),
+        "feature_names": np.array(getattr(model, "feature_names_in_", []), dtype=str)
+    }
+
+    if mode == "quantized":
+        low, high = float(value.min()), float(value.max())
+        scale = (high - low) / 255 if high > low else 1.0
+
+        exported["value"] = np.round((value - low) / scale).astype(np.uint8)
+        exported["value_offset"] = np.array(low)
+        exported["value_scale"] = np.array(scale)
+    else:
+        exported["value"] = value.astype(float_type)
+
+    return exported
+
+
+def save_forest(model, path, mode="float64"):
+    """
+    Exports a fitted forest and writes it to an .npz file.
+    """
+    np.savez(path, **export_forest(model, mode))
+
+
+class CompactForest:
+    """
+    Array-backed random forest regressor for serving.
+
+    Only needs NumPy. Mirrors the parts of the sklearn API used by
+    predict.py: predict() and feature_names_in_.
+    """
+
+    def __init__(self, arrays):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.root = arrays["root"]
+        self.max_depth = int(arrays["max_depth"])
+        self.feature_names_in_ = np.asarray(arrays["feature_names"], dtype=object)
+
+        value = arrays["value"]
+
+        if "value_scale" in arrays:
+            value = float(arrays["value_offset"]) + value * float(arrays["value_scale"])
+
+        self.value = np.asarray(value, dtype=np.float64)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def predict(self, X):
+        """
+        X: DataFrame with the training columns, or an array in that order.
+        Returns the mean leaf value over all trees, one per row.
+        """
+        if hasattr(X, "reindex") and len(self.feature_names_in_):
+            X = X.reindex(columns=self.feature_names_in_, fill_value=0)
+
+        # sklearn trees compare float32 features against their thresholds
+        X = np.asarray(X, dtype=np.float32)
+
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.root, (len(X), len(self.root)))
+
+        for _ in range(self.max_depth):
+            feature = self.feature[node]
+            go_left = X[rows, feature] <= self.threshold[node]
+            next_node = np.where(go_left, self.left[node], self.right[node])
+
+            if np.array_equal(next_node, node):
+                break
+
+            node = next_node
+
+        return self.value[node].mean(axis=1)
+
+
+def verify_forest(model, compact, X, mode="float64"):
+    """
+    Checks the compact forest against sklearn's predictions on X.
+    Returns the largest absolute difference; raises ValueError if it
+    exceeds VERIFY_TOLERANCE for the export mode.
+    """
+    expected = model.predict(X)
+    actual = compact.predict(X)
+
+    error = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+
+    if error > VERIFY_TOLERANCE[mode]:
+        raise ValueError(
+            f"Compact forest differs from sklearn by {error:.6f} "
+            f"(tolerance {VERIFY_TOLERANCE[mode]})"
+        )
+
+    return error
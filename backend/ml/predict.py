@@ -1,32 +1,99 @@
-import joblib
+import os
+
+import numpy as np
 import pandas as pd
 
+from ml.forest_runtime import CompactForest
+from ml.preprocess import FeatureEncoder
+from metrics import MODEL_INFERENCE_SECONDS
 
-# Load trained models
-models = {
-    "electricity": joblib.load("backend/ml/willing_electricity_reduction_model.pkl"),
-    "transport": joblib.load("backend/ml/willing_transport_shift_model.pkl"),
-    "diet": joblib.load("backend/ml/willing_diet_reduction_model.pkl"),
-    "waste": joblib.load("backend/ml/willing_waste_reduction_model.pkl")
+# Directory holding the files written by train_models
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+MODEL_TARGETS = {
+    "electricity": "willing_electricity_reduction",
+    "transport": "willing_transport_shift",
+    "diet": "willing_diet_reduction",
+    "waste": "willing_waste_reduction"
 }
 
 
-def predict_adoption_probabilities(user_input_df):
+def _load_model(target):
     """
-    user_input_df: preprocessed dataframe with same columns as training features
+    Prefers the compact forest exported by train_models, which needs
+    only NumPy. Falls back to the pickled sklearn model.
+    """
+    forest_path = os.path.join(MODEL_DIR, f"{target}_forest.npz")
+
+    if os.path.exists(forest_path):
+        return CompactForest.load(forest_path)
+
+    import joblib
+
+    return joblib.load(os.path.join(MODEL_DIR, f"{target}_model.pkl"))
+
+
+# Load trained models
+models = {action: _load_model(target) for action, target in MODEL_TARGETS.items()}
+
+
+_feature_encoder = None
+
+
+def get_feature_encoder():
+    """
+    Returns the FeatureEncoder saved by train_models, loaded on first use.
+    """
+    global _feature_encoder
+
+    if _feature_encoder is None:
+        _feature_encoder = FeatureEncoder.load(os.path.join(MODEL_DIR, "feature_encoder.json"))
+
+    return _feature_encoder
+
+
+def encode_surveys(surveys):
+    """
+    surveys: list of raw survey dictionaries
+    Returns the feature matrix accepted by predict_adoption_probabilities_batch.
+    """
+    return get_feature_encoder().transform_batch(surveys)
+
+
+def get_feature_columns():
+    """
+    Returns the feature columns the models were trained on, in order.
+    """
+    return list(models["electricity"].feature_names_in_)
+
+
+def predict_adoption_probabilities_batch(features):
+    """
+    features: preprocessed dataframe (one row per user) with the same
+    columns as the training features, or a NumPy matrix in that column
+    order (see encode_surveys)
+
+    Runs each model once over all rows.
+    Returns {action: array of probabilities, one per row}
     """
 
     predictions = {}
 
     for action, model in models.items():
-        score = model.predict(user_input_df)[0]
+        with MODEL_INFERENCE_SECONDS.time(MODEL_TARGETS[action]):
+            scores = model.predict(features)
+
+        # normalize 1–5 score to probability and clamp between 0 and 1
+        predictions[action] = np.clip(scores / 5.0, 0, 1)
+
+    return predictions
 
-        # normalize 1–5 score to probability
-        probability = score / 5.0
 
-        # clamp values between 0 and 1
-        probability = max(0, min(1, probability))
+def predict_adoption_probabilities(user_input_df):
+    """
+    user_input_df: preprocessed dataframe with same columns as training features
+    """
 
-        predictions[action] = probability
+    predictions = predict_adoption_probabilities_batch(user_input_df.iloc[:1])
 
-    return predictions
\ No newline at end of file
+    return {action: float(values[0]) for action, values in predictions.items()}
@@ -1,3 +1,7 @@
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
 # Likert scale mapping
@@ -49,63 +53,422 @@ PAST_ATTEMPT_MAPPING = {
 }
 
 
-def load_and_preprocess(csv_path):
+# Habit frequency columns
+HABIT_COLUMNS = [
+    "reduce_electricity_habit",
+    "public_transport_habit",
+    "veg_preference_habit",
+    "plastic_reduction_habit"
+]
 
-    df = pd.read_csv(csv_path)
+# Mapping applied to each ordinal feature column
+FEATURE_MAPPINGS = {
+    **{col: HABIT_MAPPING for col in HABIT_COLUMNS},
+    "climate_concern": CLIMATE_MAPPING,
+    "food_order_frequency": FOOD_ORDER_MAPPING,
+    "waste_segregation": WASTE_SEG_MAPPING,
+    "past_attempt": PAST_ATTEMPT_MAPPING
+}
 
-    # Map habit frequency columns
-    habit_columns = [
-        "reduce_electricity_habit",
-        "public_transport_habit",
-        "veg_preference_habit",
-        "plastic_reduction_habit"
-    ]
+# Willingness targets
+TARGET_COLUMNS = [
+    "willing_electricity_reduction",
+    "willing_transport_shift",
+    "willing_diet_reduction",
+    "willing_waste_reduction"
+]
 
-    for col in habit_columns:
-        if col in df.columns:
-            df[col] = df[col].map(HABIT_MAPPING)
+# One-hot encoded categorical columns
+CATEGORICAL_COLUMNS = [
+    "gender",
+    "education_level",
+    "occupation",
+    "living_situation",
+    "primary_transport_mode"
+]
 
-    # Map climate concern
-    if "climate_concern" in df.columns:
-        df["climate_concern"] = df["climate_concern"].map(CLIMATE_MAPPING)
+# Rows read per chunk by the streaming preprocessor
+CHUNK_SIZE = 100000
 
-    # Map food ordering frequency
-    if "food_order_frequency" in df.columns:
-        df["food_order_frequency"] = df["food_order_frequency"].map(FOOD_ORDER_MAPPING)
+# Bump when the cache layout changes so old caches are rebuilt
+CACHE_VERSION = 1
 
-    # Map waste segregation
-    if "waste_segregation" in df.columns:
-        df["waste_segregation"] = df["waste_segregation"].map(WASTE_SEG_MAPPING)
 
-    # Map past attempts
-    if "past_attempt" in df.columns:
-        df["past_attempt"] = df["past_attempt"].map(PAST_ATTEMPT_MAPPING)
+def load_and_preprocess(csv_path, with_encoder=False):
+    """
+    Returns (X_encoded, y), or (X_encoded, y, encoder) when with_encoder
+    is set. The encoder reproduces X_encoded's layout for live surveys.
+    """
 
-    # Likert mapping for willingness targets
-    target_cols = [
-        "willing_electricity_reduction",
-        "willing_transport_shift",
-        "willing_diet_reduction",
-        "willing_waste_reduction"
-    ]
+    df = pd.read_csv(csv_path)
+
+    # Map habit frequency, climate concern, food ordering frequency,
+    # waste segregation and past attempt columns
+    for col, mapping in FEATURE_MAPPINGS.items():
+        if col in df.columns:
+            df[col] = df[col].map(mapping)
 
-    for col in target_cols:
+    # Likert mapping for willingness targets
+    for col in TARGET_COLUMNS:
         if col in df.columns:
             df[col] = df[col].map(LIKERT_MAPPING)
 
     # Separate features and targets
-    X = df.drop(columns=target_cols)
-    y = df[target_cols]
+    X = df.drop(columns=TARGET_COLUMNS)
+    y = df[TARGET_COLUMNS]
 
     # One-hot encode categorical columns
-    categorical_cols = [
-        "gender",
-        "education_level",
-        "occupation",
-        "living_situation",
-        "primary_transport_mode"
+    X_encoded = pd.get_dummies(X, columns=CATEGORICAL_COLUMNS, drop_first=True)
+
+    if with_encoder:
+        encoder = FeatureEncoder.fit(X, CATEGORICAL_COLUMNS)
+
+        if encoder.columns != list(X_encoded.columns):
+            raise ValueError("Feature encoder layout does not match the training features")
+
+        return X_encoded, y, encoder
+
+    return X_encoded, y
+
+
+class FeatureEncoder:
+    """
+    Turns raw survey answers into the model's feature vector without pandas.
+
+    Stores the ordinal mapping tables and the exact column order produced
+    by load_and_preprocess (pd.get_dummies with drop_first=True), so a
+    single survey dict becomes a NumPy row in a few microseconds.
+
+    Unknown ordinal answers become NaN, like Series.map. Unknown categories
+    encode as all zeros, the same as the dropped first category.
+    """
+
+    def __init__(self, columns, numeric, categorical):
+        self.columns = list(columns)
+
+        # [(column, mapping or None)] in output order
+        self.numeric = [(col, mapping) for col, mapping in numeric]
+
+        # {column: [levels kept after drop_first]}
+        self.categorical = {col: list(levels) for col, levels in categorical.items()}
+
+        position = {col: i for i, col in enumerate(self.columns)}
+
+        self._numeric_ops = [
+            (position[col], col, mapping) for col, mapping in self.numeric
+        ]
+
+        self._one_hot = {
+            col: {level: position[f"{col}_{level}"] for level in levels}
+            for col, levels in self.categorical.items()
+        }
+
+    @classmethod
+    def fit(cls, X, categorical_cols):
+        """
+        X: feature DataFrame before one-hot encoding (ordinal columns mapped)
+        """
+        numeric = [
+            (col, FEATURE_MAPPINGS.get(col))
+            for col in X.columns
+            if col not in categorical_cols
+        ]
+
+        # get_dummies sorts the categories and drops the first one
+        categorical = {
+            col: sorted(X[col].dropna().unique().tolist())[1:]
+            for col in categorical_cols
+        }
+
+        columns = [col for col, _ in numeric] + [
+            f"{col}_{level}"
+            for col, levels in categorical.items()
+            for level in levels
+        ]
+
+        return cls(columns, numeric, categorical)
+
+    @property
+    def n_features(self):
+        return len(self.columns)
+
+    def _fill(self, row, survey):
+        for i, col, mapping in self._numeric_ops:
+            value = survey.get(col)
+
+            if mapping is not None:
+                value = mapping.get(value)
+
+            row[i] = np.nan if value is None else value
+
+        for col, positions in self._one_hot.items():
+            i = positions.get(survey.get(col))
+
+            if i is not None:
+                row[i] = 1.0
+
+    def validate(self, survey):
+        """
+        Raises ValueError for answers transform cannot encode: unknown
+        questions, non-scalar answers, or non-numbers for numeric questions.
+        Unknown answers to ordinal and categorical questions are accepted.
+        """
+        known = {col for col, _ in self.numeric} | set(self.categorical)
+
+        unknown = sorted(set(survey) - known)
+        if unknown:
+            raise ValueError(f"Unknown survey questions: {unknown}")
+
+        for col, mapping in self.numeric:
+            value = survey.get(col)
+
+            if value is None:
+                continue
+
+            if mapping is None:
+                if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                    raise ValueError(f"Survey answer {col} must be a number")
+
+                # Numeric strings, as read from a survey CSV, are converted
+                try:
+                    float(value)
+                except ValueError:
+                    raise ValueError(f"Survey answer {col} must be a number") from None
+
+            elif not isinstance(value, (str, int, float)):
+                raise ValueError(f"Survey answer {col} must be a single value")
+
+        for col in self.categorical:
+            value = survey.get(col)
+
+            if value is not None and not isinstance(value, (str, int, float)):
+                raise ValueError(f"Survey answer {col} must be a single value")
+
+    def transform(self, survey):
+        """
+        survey: dictionary of raw survey answers
+        Returns a 1-D float array in the model's feature order.
+        """
+        row = np.zeros(self.n_features)
+        self._fill(row, survey)
+        return row
+
+    def transform_batch(self, surveys):
+        """
+        surveys: list of raw survey dictionaries
+        Returns a 2-D float array, one row per survey.
+        """
+        matrix = np.zeros((len(surveys), self.n_features))
+
+        for row, survey in zip(matrix, surveys):
+            self._fill(row, survey)
+
+        return matrix
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "columns": self.columns,
+                "numeric": self.numeric,
+                "categorical": self.categorical
+            }, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        return cls(data["columns"], data["numeric"], data["categorical"])
+
+
+def _map_categorical(series, mapping):
+    """
+    Vectorized Series.map for a categorical column: the mapping is looked
+    up once per category and broadcast through the category codes.
+    Values missing from the mapping become NaN.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+
+    # Code -1 (missing value) indexes the trailing NaN
+    table = np.array(
+        [mapping.get(category, np.nan) for category in series.cat.categories] + [np.nan],
+        dtype=float
+    )
+
+    return table[series.cat.codes.to_numpy()]
+
+
+def _encode_chunk(chunk, encoder):
+    """
+    Encodes one chunk of raw survey rows into the encoder's feature layout.
+    """
+    features = np.zeros((len(chunk), encoder.n_features), dtype=np.float32)
+
+    for i, col, mapping in encoder._numeric_ops:
+        if mapping is not None:
+            features[:, i] = _map_categorical(chunk[col], mapping)
+        else:
+            features[:, i] = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=float)
+
+    for col, positions in encoder._one_hot.items():
+        series = chunk[col]
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+
+        table = np.array(
+            [positions.get(category, -1) for category in series.cat.categories] + [-1]
+        )
+        columns = table[series.cat.codes.to_numpy()]
+        rows = np.nonzero(columns >= 0)[0]
+
+        features[rows, columns[rows]] = 1
+
+    targets = np.column_stack([
+        _map_categorical(chunk[col], LIKERT_MAPPING) for col in TARGET_COLUMNS
+    ])
+
+    return features, targets
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+
+    return {
+        "source": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "version": CACHE_VERSION
+    }
+
+
+def build_feature_cache(csv_path, cache_dir, chunk_size=CHUNK_SIZE):
+    """
+    Streams the survey CSV in chunks and writes the encoded features and
+    targets to .npy files in cache_dir.
+
+    Memory use is bounded by the chunk size: a first pass reads only the
+    categorical columns to fix the one-hot layout and the row count, and a
+    second pass encodes each chunk straight into a memory-mapped array.
+    String columns are read as categoricals so every mapping is applied
+    once per category rather than once per row.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+
+    categorical_cols = [col for col in CATEGORICAL_COLUMNS if col in header]
+    string_cols = categorical_cols + [
+        col for col in header
+        if col in FEATURE_MAPPINGS or col in TARGET_COLUMNS
     ]
 
-    X_encoded = pd.get_dummies(X, columns=categorical_cols, drop_first=True)
+    # Pass 1: categorical levels and row count
+    levels = {col: set() for col in categorical_cols}
+    n_rows = 0
+
+    for chunk in pd.read_csv(
+        csv_path,
+        usecols=categorical_cols or [header[0]],
+        dtype="category",
+        chunksize=chunk_size
+    ):
+        n_rows += len(chunk)
+        for col in categorical_cols:
+            levels[col].update(chunk[col].cat.categories)
+
+    # Same layout as load_and_preprocess: sorted categories, first dropped
+    encoder = FeatureEncoder(
+        columns=[
+            col for col in header
+            if col not in categorical_cols and col not in TARGET_COLUMNS
+        ] + [
+            f"{col}_{level}"
+            for col in categorical_cols
+            for level in sorted(levels[col])[1:]
+        ],
+        numeric=[
+            (col, FEATURE_MAPPINGS.get(col))
+            for col in header
+            if col not in categorical_cols and col not in TARGET_COLUMNS
+        ],
+        categorical={col: sorted(levels[col])[1:] for col in categorical_cols}
+    )
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    features_path = os.path.join(cache_dir, "features.npy")
+    targets_path = os.path.join(cache_dir, "targets.npy")
+    meta_path = os.path.join(cache_dir, "meta.json")
+
+    # Invalidate first so a half-written cache is never picked up
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=np.float32, shape=(n_rows, encoder.n_features)
+    )
+    targets = np.lib.format.open_memmap(
+        targets_path, mode="w+", dtype=np.float64, shape=(n_rows, len(TARGET_COLUMNS))
+    )
+
+    # Pass 2: encode chunk by chunk
+    start = 0
+
+    for chunk in pd.read_csv(
+        csv_path,
+        dtype={col: "category" for col in string_cols},
+        chunksize=chunk_size
+    ):
+        end = start + len(chunk)
+        features[start:end], targets[start:end] = _encode_chunk(chunk, encoder)
+        start = end
+
+    features.flush()
+    targets.flush()
+    del features, targets
+
+    encoder.save(os.path.join(cache_dir, "feature_encoder.json"))
+
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({**_source_signature(csv_path), "rows": n_rows}, f, indent=2)
+
+
+def load_and_preprocess_cached(csv_path, cache_dir=None, chunk_size=CHUNK_SIZE):
+    """
+    Streaming, cached counterpart of load_and_preprocess(with_encoder=True).
+
+    Reuses the on-disk feature cache unless the CSV changed since it was
+    built; otherwise rebuilds it with build_feature_cache. Features are
+    returned as a DataFrame over a read-only memory map.
+
+    cache_dir defaults to "<csv_path>.cache".
+    """
+    if cache_dir is None:
+        cache_dir = f"{csv_path}.cache"
+
+    meta_path = os.path.join(cache_dir, "meta.json")
+
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+
+    signature = _source_signature(csv_path)
+
+    if meta is None or any(meta.get(key) != value for key, value in signature.items()):
+        build_feature_cache(csv_path, cache_dir, chunk_size)
+
+    encoder = FeatureEncoder.load(os.path.join(cache_dir, "feature_encoder.json"))
+
+    X = pd.DataFrame(
+        np.load(os.path.join(cache_dir, "features.npy"), mmap_mode="r"),
+        columns=encoder.columns,
+        copy=False
+    )
+    y = pd.DataFrame(
+        np.load(os.path.join(cache_dir, "targets.npy"), mmap_mode="r"),
+        columns=TARGET_COLUMNS,
+        copy=False
+    )
 
-    return X_encoded, y
\ No newline at end of file
+    return X, y, encoder
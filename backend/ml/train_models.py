@@ -1,60 +1,198 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import joblib
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 
-from preprocess import load_and_preprocess
+from preprocess import load_and_preprocess, load_and_preprocess_cached
+from forest_runtime import EXPORT_MODES, CompactForest, save_forest, verify_forest
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
-def train_models(csv_path):
-    X, y = load_and_preprocess(csv_path)
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
 
-    models = {}
+def _peak_memory_mb():
+    """
+    Peak resident memory of the whole process since it started, so it is
+    only a per-target figure in a process that trained a single target.
+    """
+    if resource is None:
+        return None
+
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-    for target in y.columns:
 
-        model = RandomForestRegressor(
+def _train_target(target, X_train, X_test, y_train, y_test, n_jobs, export_mode, model_dir=MODEL_DIR):
+    """
+    Trains, evaluates and saves the model for one willingness target.
+    Returns a report dictionary.
+    """
+    start = time.perf_counter()
+
+    model = RandomForestRegressor(
         n_estimators=100,
-        random_state=42
-        )
+        random_state=42,
+        n_jobs=n_jobs
+    )
+
+    # train
+    model.fit(X_train, y_train)
+
+    # predict
+    predictions = model.predict(X_test)
+
+    # evaluation metrics
+    mae = mean_absolute_error(y_test, predictions)
+    r2 = r2_score(y_test, predictions)
+
+    feature_importance = sorted(
+        zip(X_train.columns, model.feature_importances_),
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+    # save model
+    joblib.dump(model, os.path.join(model_dir, f"{target}_model.pkl"))
+
+    # export compact forest and check it against sklearn
+    export_error = None
+
+    if export_mode is not None:
+        forest_path = os.path.join(model_dir, f"{target}_forest.npz")
+        save_forest(model, forest_path, export_mode)
+
+        export_error = verify_forest(model, CompactForest.load(forest_path), X_test, export_mode)
+
+    return {
+        "target": target,
+        "mae": mae,
+        "r2": r2,
+        "top_features": feature_importance[:5],
+        "export_error": export_error,
+        "wall_time": time.perf_counter() - start,
+        "peak_memory_mb": _peak_memory_mb()
+    }
 
-        # train
-        model.fit(X_train, y_train[target])
 
-        # predict
-        predictions = model.predict(X_test)
+def _print_report(report, export_mode):
+    print(f"\nModel: {report['target']}")
+    print(f"MAE: {report['mae']:.3f}")
+    print(f"R2 Score: {report['r2']:.3f}")
 
-        # evaluation metrics
-        mae = mean_absolute_error(y_test[target], predictions)
-        r2 = r2_score(y_test[target], predictions)
+    print("\nTop Influencing Features:")
 
-        print(f"\nModel: {target}")
-        print(f"MAE: {mae:.3f}")
-        print(f"R2 Score: {r2:.3f}")
+    for feature, score in report["top_features"]:
+        print(f"{feature}: {score:.3f}")
 
-        models[target] = model
+    if report["export_error"] is not None:
+        print(f"Compact forest ({export_mode}) max error: {report['export_error']:.2e}")
 
-        importances = model.feature_importances_
+    print(f"Wall time: {report['wall_time']:.2f}s")
 
-        feature_importance = sorted(
-            zip(X.columns, importances),
-            key=lambda x: x[1],
-            reverse=True
-        )
+    if report["peak_memory_mb"] is not None:
+        if report["peak_memory_scope"] == "target":
+            print(f"Peak memory (this target's process): {report['peak_memory_mb']:.0f} MB")
+        else:
+            print(f"Peak memory (whole process so far): {report['peak_memory_mb']:.0f} MB")
 
-        print("\nTop Influencing Features:")
 
-        for feature, score in feature_importance[:5]:
-            print(f"{feature}: {score:.3f}")
+def train_models(csv_path, export_mode="float64", use_cache=False, n_jobs=1, model_dir=MODEL_DIR):
+    """
+    Trains one model per willingness target and saves it in model_dir
+    (next to this file by default, where predict.py loads it from).
 
-        # save model
-        joblib.dump(model, f"backend/ml/{target}_model.pkl")
+    export_mode: also export each forest to the compact array format
+    served by forest_runtime (see EXPORT_MODES), or None to skip.
+    use_cache: preprocess in chunks and reuse the on-disk feature cache,
+    skipping the CSV parse when the source has not changed.
+    n_jobs: core budget (-1 for all cores). With more than one core the
+    targets train concurrently in separate processes and the remaining
+    budget is split across each forest's tree building.
 
-    print("\nTraining complete. Models saved.")
+    Returns one report per target, including wall time and peak memory.
+    peak_memory_scope is "target" when each target trained in its own
+    process, or "process" when the targets trained in this process and
+    the peak covers everything it did up to that target.
+    """
+    if use_cache:
+        X, y, encoder = load_and_preprocess_cached(csv_path)
+    else:
+        X, y, encoder = load_and_preprocess(csv_path, with_encoder=True)
+
+    # save the feature layout used for live surveys
+    encoder.save(os.path.join(model_dir, "feature_encoder.json"))
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42
+    )
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    targets = list(y.columns)
+    start = time.perf_counter()
+
+    if n_jobs == 1:
+        scope = "process"
+
+        reports = [
+            _train_target(
+                target, X_train, X_test, y_train[target], y_test[target], 1,
+                export_mode, model_dir
+            )
+            for target in targets
+        ]
+
+    else:
+        scope = "target"
+
+        workers = min(len(targets), n_jobs)
+        tree_jobs = max(1, n_jobs // workers)
+
+        # One fresh process per target so peak memory is reported per target
+        with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+            futures = [
+                pool.submit(
+                    _train_target,
+                    target, X_train, X_test, y_train[target], y_test[target],
+                    tree_jobs, export_mode, model_dir
+                )
+                for target in targets
+            ]
+
+            reports = [future.result() for future in futures]
+
+    for report in reports:
+        report["peak_memory_scope"] = scope
+        _print_report(report, export_mode)
+
+    print(f"\nTraining complete in {time.perf_counter() - start:.2f}s. Models saved.")
+
+    return reports
 
 if __name__ == "__main__":
-    train_models("data/dummy_data.csv")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train willingness models")
+    parser.add_argument("csv_path", nargs="?", default="data/dummy_data.csv")
+    parser.add_argument("--export-mode", choices=EXPORT_MODES, default="float64")
+    parser.add_argument("--no-export", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="use the chunked feature cache")
+    parser.add_argument("--jobs", type=int, default=1, help="core budget, -1 for all cores")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="where to save the models")
+    args = parser.parse_args()
+
+    train_models(
+        args.csv_path,
+        None if args.no_export else args.export_mode,
+        args.cache,
+        args.jobs,
+        args.model_dir
+    )
@@ -1,8 +1,20 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Date, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds. Bind datetimes in
+# the same text format so range and keyset comparisons against
+# server-generated timestamps order correctly on the local SQLite stand-in.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d",
+        regexp=r"(\d+)-(\d+)-(\d+) (\d+):(\d+):(\d+)"
+    ),
+    "sqlite"
+)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -33,6 +45,110 @@ class Footprint(Base):
     waste = Column(Float)
     total = Column(Float)
 
+    # Raw request inputs, kept so the footprint can be recomputed when
+    # emission factors change. Null for footprints stored before them.
+    electricity_kwh = Column(Float)
+    transport_mode = Column(String)
+    transport_km = Column(Float)
+    diet_type = Column(String)
+    meals_per_month = Column(Float)
+    waste_kg = Column(Float)
+    region = Column(String)
+    activity_date = Column(Date)
+
+    # Factor set the outputs were computed with (see factor_set_version)
+    factor_version = Column(String)
+
+    created_at = Column(Timestamp, server_default=func.now())
+
+    user = relationship("User", back_populates="footprints")
+
+    # Serves per-user history in (created_at, id) order and keyset pagination
+    __table_args__ = (
+        Index("ix_footprints_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
+
+# Footprint columns holding the request inputs and factor set
+FOOTPRINT_INPUT_COLUMNS = (
+    "electricity_kwh",
+    "transport_mode",
+    "transport_km",
+    "diet_type",
+    "meals_per_month",
+    "waste_kg",
+    "region",
+    "activity_date",
+    "factor_version"
+)
+
+
+class UserRecommendation(Base):
+    __tablename__ = "user_recommendations"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    # recommend_actions-style ranked list
+    recommendations = Column(JSON, nullable=False)
+
+    # Version stamp: the footprint the ranking was computed for.
+    # None for rankings written by the bulk scoring job.
+    footprint_id = Column(Integer)
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    user = relationship("User", back_populates="footprints")
\ No newline at end of file
+
+class UserSurvey(Base):
+    __tablename__ = "user_surveys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    # Latest raw survey answers, encoded for the adoption models on use
+    answers = Column(JSON, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class UserFootprintRollup(Base):
+    __tablename__ = "user_footprint_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    record_count = Column(Integer, nullable=False)
+    total_sum = Column(Float, nullable=False)
+    min_total = Column(Float, nullable=False)
+    max_total = Column(Float, nullable=False)
+    last_total = Column(Float, nullable=False)
+    previous_total = Column(Float)
+
+    # Bumped whenever the rollup is rebuilt from the footprints, e.g. after
+    # a recompute rewrote their totals; part of the response cache version
+    revision = Column(Integer, nullable=False, server_default="0")
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class FootprintSketchBucket(Base):
+    __tablename__ = "footprint_sketch_buckets"
+
+    # Histogram of every stored footprint, one row per category and bucket
+    category = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+
+    count = Column(Integer, nullable=False, default=0)
+
+
+class FootprintRecomputeJob(Base):
+    __tablename__ = "footprint_recompute_jobs"
+
+    name = Column(String, primary_key=True)
+
+    # Checkpoint: footprints up to this id have been processed
+    last_id = Column(Integer, nullable=False, default=0)
+
+    rows_updated = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True))
@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import literal, select, tuple_
+
+from models import Footprint
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(footprint):
+    """
+    Opaque cursor pointing just past the given footprint.
+    """
+    payload = json.dumps([footprint.created_at.isoformat(), footprint.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns (created_at, id). Raises ValueError for malformed cursors.
+    """
+    try:
+        created_at, footprint_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(footprint_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError("Invalid pagination cursor") from error
+
+
+def footprint_history_page(db, user_id, limit=DEFAULT_PAGE_SIZE, after=None, start=None, end=None):
+    """
+    Returns one page of a user's footprints, newest first, and the cursor
+    for the next page (None on the last page).
+
+    Pages are read with keyset pagination over the
+    (user_id, created_at, id) index, so each page costs the same however
+    long the history is. start / end optionally bound created_at
+    (start inclusive, end exclusive).
+    """
+    query = select(Footprint).where(Footprint.user_id == user_id)
+
+    if start is not None:
+        query = query.where(Footprint.created_at >= start)
+
+    if end is not None:
+        query = query.where(Footprint.created_at < end)
+
+    if after is not None:
+        created_at, footprint_id = decode_cursor(after)
+        # Row-value comparison so the database can seek the index directly;
+        # the timestamp is typed explicitly so it binds like the column
+        query = query.where(
+            tuple_(Footprint.created_at, Footprint.id)
+            < tuple_(literal(created_at, Footprint.created_at.type), footprint_id)
+        )
+
+    # One extra row tells whether another page exists
+    footprints = db.scalars(
+        query
+        .order_by(Footprint.created_at.desc(), Footprint.id.desc())
+        .limit(limit + 1)
+    ).all()
+
+    if len(footprints) > limit:
+        footprints = footprints[:limit]
+        return footprints, encode_cursor(footprints[-1])
+
+    return footprints, None
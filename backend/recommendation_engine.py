@@ -1,57 +1,99 @@
-from backend.scenario_engine import simulate_scenario
-from backend.ml.predict import predict_adoption_probabilities
+import numpy as np
 
+from scenario_engine import evaluate_action_sets
+from ml.dispatcher import get_dispatcher
+from ml.predict import predict_adoption_probabilities_batch
 
-def recommend_actions(user_input, user_input_df):
-    """
-    user_input: dictionary used by scenario engine
-    user_input_df: preprocessed dataframe used by ML model
-    """
 
-    # Possible actions to simulate
-    possible_actions = [
-        {"type": "reduce_electricity", "percent": 10},
-        {"type": "reduce_electricity", "percent": 20},
-        {"type": "change_transport", "new_mode": "public_transport"},
-        {"type": "change_diet", "new_diet": "veg"}
-    ]
+# Possible actions to simulate
+POSSIBLE_ACTIONS = [
+    {"type": "reduce_electricity", "percent": 10},
+    {"type": "reduce_electricity", "percent": 20},
+    {"type": "change_transport", "new_mode": "public_transport"},
+    {"type": "change_diet", "new_diet": "veg"}
+]
 
-    recommendations = []
+# Adoption probability used for each action type
+ACTION_PROBABILITY_KEYS = {
+    "reduce_electricity": "electricity",
+    "change_transport": "transport",
+    "change_diet": "diet"
+}
 
-    # Step 1: get ML adoption probabilities
-    adoption_probs = predict_adoption_probabilities(user_input_df)
 
-    for action in possible_actions:
+def _probability_key(action):
+    return ACTION_PROBABILITY_KEYS.get(action["type"], "waste")
 
-        # Step 2: simulate emission reduction
-        result = simulate_scenario(user_input, [action])
 
-        reduction = result["reduction"]
+def rank_actions(user_inputs, adoption_probs, possible_actions=POSSIBLE_ACTIONS):
+    """
+    Ranks possible actions for many users at once.
 
-        # Step 3: map action to probability category
-        if action["type"] == "reduce_electricity":
-            probability = adoption_probs["electricity"]
+    user_inputs: DataFrame or dictionary of arrays used by scenario engine
+    adoption_probs: {probability key: array}, one value per user, as returned
+    by predict_adoption_probabilities_batch
 
-        elif action["type"] == "change_transport":
-            probability = adoption_probs["transport"]
+    Returns one recommend_actions-style ranked list per user.
+    """
 
-        elif action["type"] == "change_diet":
-            probability = adoption_probs["diet"]
+    # Simulate emission reduction for every user and action in one pass
+    reductions = evaluate_action_sets(
+        user_inputs,
+        [[action] for action in possible_actions]
+    )["reduction"]
+
+    # Map each action to its probability category, shape (users, actions)
+    probabilities = np.column_stack([
+        np.asarray(adoption_probs[_probability_key(action)], dtype=float)
+        for action in possible_actions
+    ])
+
+    final_scores = reductions * probabilities
+
+    # Stable sort keeps the catalog order for ties, like list.sort
+    order = np.argsort(-final_scores, axis=1, kind="stable")
+
+    reductions = reductions.tolist()
+    probabilities = probabilities.tolist()
+    final_scores = final_scores.tolist()
+
+    return [
+        [
+            {
+                "action": possible_actions[j],
+                "reduction": reductions[i][j],
+                "adoption_probability": probabilities[i][j],
+                "final_score": final_scores[i][j]
+            }
+            for j in row
+        ]
+        for i, row in enumerate(order.tolist())
+    ]
 
-        else:
-            probability = adoption_probs["waste"]
 
-        # Step 4: compute final score
-        final_score = reduction * probability
+def rank_actions_batch(user_inputs, features, possible_actions=POSSIBLE_ACTIONS):
+    """
+    user_inputs: DataFrame or dictionary of arrays used by scenario engine
+    features: preprocessed dataframe used by ML model, one row per user
 
-        recommendations.append({
-            "action": action,
-            "reduction": reduction,
-            "adoption_probability": probability,
-            "final_score": final_score
-        })
+    Each adoption model runs once for the whole batch.
+    """
+    adoption_probs = predict_adoption_probabilities_batch(features)
+
+    return rank_actions(user_inputs, adoption_probs, possible_actions)
+
+
+def recommend_actions(user_input, user_input_df):
+    """
+    user_input: dictionary used by scenario engine
+    user_input_df: preprocessed dataframe used by ML model
+    """
 
-    # Step 5: rank recommendations
-    recommendations.sort(key=lambda x: x["final_score"], reverse=True)
+    # Step 1: get ML adoption probabilities, batched with concurrent callers
+    adoption_probs = get_dispatcher().predict_adoption_probabilities(user_input_df)
 
-    return recommendations
\ No newline at end of file
+    # Step 2-5: simulate reductions, score and rank
+    return rank_actions(
+        {key: [value] for key, value in user_input.items()},
+        {key: [value] for key, value in adoption_probs.items()}
+    )[0]
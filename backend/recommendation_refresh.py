@@ -0,0 +1,346 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import delete, insert, select
+
+from database import SessionLocal, _env_flag
+from ml.preprocess import FeatureEncoder
+from models import UserSurvey
+from response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- CONFIGURATION ----------
+
+# Precompute ML-ranked recommendations after each stored footprint
+RECOMMENDATIONS_ML = _env_flag("RECOMMENDATIONS_ML", "true")
+
+# Refreshes are ranked together once this many milliseconds have passed
+# or this many users are waiting
+REFRESH_MAX_WAIT_MS = float(os.getenv("REFRESH_MAX_WAIT_MS", "20"))
+REFRESH_MAX_USERS = int(os.getenv("REFRESH_MAX_USERS", "256"))
+
+# Adoption probability used for users who never submitted a survey, so
+# their actions are ranked by simulated reduction alone
+DEFAULT_ADOPTION_PROBABILITY = 0.5
+
+# Feature encoder saved by train_models, in the directory ml.predict
+# loads the models from
+SURVEY_ENCODER_PATH = os.path.join(
+    os.getenv("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml")),
+    "feature_encoder.json"
+)
+
+_STOP = object()
+
+
+# ---------- SURVEYS ----------
+
+_survey_encoder = None
+
+
+def validate_survey(survey):
+    """
+    Raises ValueError when the adoption models cannot encode survey.
+    Before any encoder is trained, only checks that answers are scalars.
+    """
+    global _survey_encoder
+
+    if _survey_encoder is None and os.path.exists(SURVEY_ENCODER_PATH):
+        _survey_encoder = FeatureEncoder.load(SURVEY_ENCODER_PATH)
+
+    if _survey_encoder is not None:
+        _survey_encoder.validate(survey)
+        return
+
+    for question, answer in survey.items():
+        if answer is not None and not isinstance(answer, (str, int, float)):
+            raise ValueError(f"Survey answer {question} must be a single value")
+
+
+def adoption_probabilities(surveys, predict_batch):
+    """
+    Adoption probabilities for a list of users.
+
+    surveys: one validated survey per user, or None for users without one,
+    who get DEFAULT_ADOPTION_PROBABILITY
+    predict_batch: runs the models on encoded surveys, like
+    predict_adoption_probabilities_batch
+
+    Returns {probability key: [probability per user]}.
+    """
+    from ml.predict import encode_surveys
+
+    probabilities = {
+        key: [DEFAULT_ADOPTION_PROBABILITY] * len(surveys)
+        for key in ("electricity", "transport", "diet", "waste")
+    }
+
+    with_survey = [i for i, survey in enumerate(surveys) if survey is not None]
+
+    if with_survey:
+        predictions = predict_batch(encode_surveys([surveys[i] for i in with_survey]))
+
+        for key, values in predictions.items():
+            for i, value in zip(with_survey, values.tolist()):
+                probabilities[key][i] = value
+
+    return probabilities
+
+
+class _RefreshJob:
+
+    def __init__(self, user_id, footprint_id, inputs, survey):
+        self.user_id = user_id
+        self.footprint_id = footprint_id
+        self.inputs = inputs
+        self.survey = survey
+
+
+class RecommendationRefresher:
+    """
+    Recomputes users' ML-ranked recommendations in the background.
+
+    /calculate submits the footprint it stored; a daemon worker thread
+    gathers submissions for up to max_wait_ms, keeps the newest footprint
+    per user, runs the adoption models and scenario simulations once for
+    the whole group and stores each ranking stamped with its footprint id.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_wait_ms=REFRESH_MAX_WAIT_MS,
+        max_users=REFRESH_MAX_USERS
+    ):
+        self._session_factory = session_factory
+        self.max_wait = max_wait_ms / 1000
+        self.max_users = max_users
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self._submitted = 0
+        self._refreshed = 0
+        self._batches = 0
+        self._failures = 0
+        self._invalid_surveys = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._closed:
+                return False
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="recommendation-refresher",
+                    daemon=True
+                )
+                self._thread.start()
+
+            return True
+
+    def submit(self, user_id, footprint_id, inputs, survey=None):
+        """
+        Schedules a refresh for a stored footprint.
+
+        inputs: the scenario engine inputs the footprint was computed from
+        survey: raw survey answers sent with it, if any; they are stored
+        and reused for later footprints without one
+        """
+        if not self._ensure_started():
+            return
+
+        self._queue.put(_RefreshJob(user_id, footprint_id, dict(inputs), survey))
+
+        with self._lock:
+            self._submitted += 1
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            first = self._queue.get()
+
+            if first is _STOP:
+                break
+
+            jobs = {first.user_id: first}
+            deadline = time.monotonic() + self.max_wait
+
+            while len(jobs) < self.max_users:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    job = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if job is _STOP:
+                    stopping = True
+                    break
+
+                # Only the newest footprint of a user matters; keep a survey
+                # sent with an older one
+                previous = jobs.get(job.user_id)
+
+                if previous is not None and job.survey is None:
+                    job.survey = previous.survey
+
+                jobs[job.user_id] = job
+
+            try:
+                self._refresh(list(jobs.values()))
+            except Exception:
+                logger.exception("Could not refresh recommendations for %d users", len(jobs))
+
+                with self._lock:
+                    self._failures += 1
+
+    def _refresh(self, jobs):
+        # Imported here so the API starts without trained models
+        from bulk_score import write_recommendations
+        from ml.predict import predict_adoption_probabilities_batch
+        from recommendation_engine import rank_actions
+
+        db = self._session_factory()
+        try:
+            user_ids = [job.user_id for job in jobs]
+
+            received = {
+                job.user_id: job.survey for job in jobs
+                if job.survey is not None and self._valid_survey(job.user_id, job.survey)
+            }
+
+            if received:
+                db.execute(delete(UserSurvey).where(UserSurvey.user_id.in_(list(received))))
+                db.execute(insert(UserSurvey), [
+                    {"user_id": user_id, "answers": answers}
+                    for user_id, answers in received.items()
+                ])
+
+            missing = [user_id for user_id in user_ids if user_id not in received]
+
+            surveys = dict(received)
+
+            if missing:
+                # Surveys stored before validation may not encode; those
+                # users fall back to the default probabilities
+                surveys.update(
+                    (user_id, answers)
+                    for user_id, answers in db.execute(
+                        select(UserSurvey.user_id, UserSurvey.answers)
+                        .where(UserSurvey.user_id.in_(missing))
+                    ).tuples()
+                    if self._valid_survey(user_id, answers)
+                )
+
+            # The refresh is already one batch: each model runs once for it
+            probabilities = adoption_probabilities(
+                [surveys.get(job.user_id) for job in jobs],
+                predict_adoption_probabilities_batch
+            )
+
+            inputs = {
+                key: [job.inputs[key] for job in jobs]
+                for key in jobs[0].inputs
+            }
+
+            rankings = rank_actions(inputs, probabilities)
+
+            write_recommendations(
+                db, user_ids, rankings, [job.footprint_id for job in jobs]
+            )
+
+        except Exception:
+            db.rollback()
+            raise
+
+        finally:
+            db.close()
+
+        # Served rankings are versioned by footprint id; drop the cached
+        # fallback responses
+        for user_id in user_ids:
+            response_cache.invalidate_user(user_id)
+
+        with self._lock:
+            self._refreshed += len(jobs)
+            self._batches += 1
+
+    def _valid_survey(self, user_id, survey):
+        # One bad survey must not fail the refresh of the whole batch
+        try:
+            validate_survey(survey)
+        except ValueError:
+            logger.warning("Ignoring survey of user %s", user_id, exc_info=True)
+
+            with self._lock:
+                self._invalid_surveys += 1
+
+            return False
+
+        return True
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "submitted": self._submitted,
+                "refreshed": self._refreshed,
+                "batches": self._batches,
+                "failures": self._failures,
+                "invalid_surveys": self._invalid_surveys
+            }
+
+    def close(self):
+        """
+        Stops the worker after the refreshes already queued are done.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_refresher():
+    """
+    Returns the process-wide refresher, or None when RECOMMENDATIONS_ML
+    is disabled.
+    """
+    global _refresher
+
+    if not RECOMMENDATIONS_ML:
+        return None
+
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = RecommendationRefresher()
+
+    return _refresher
+
+
+def close_refresher():
+    with _refresher_lock:
+        refresher = _refresher
+
+    if refresher is not None:
+        refresher.close()
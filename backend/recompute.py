@@ -0,0 +1,293 @@
+import argparse
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from carbon_calculator import BATCH_INPUT_COLUMNS, calculate_footprint_batch, factor_set_version
+from database import SessionLocal
+from factor_catalog import CatalogUnavailable
+from models import Footprint, FootprintRecomputeJob, UserRecommendation
+from recommendation_refresh import close_refresher, get_refresher
+from response_cache import response_cache
+from rollups import rebuild_rollups
+from sketches import rebuild_sketches
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per server-side cursor partition and written per
+# executemany UPDATE
+RECOMPUTE_CHUNK_SIZE = 5000
+
+# Rows per transaction. The checkpoint advances once per window, so at
+# most this many rows are redone after a crash. Also bounds the user ids
+# passed to rebuild_rollups in one IN list.
+RECOMPUTE_WINDOW = 20000
+
+DEFAULT_JOB = "footprints"
+
+OUTPUTS = ("electricity", "transport", "food", "waste", "total")
+
+
+def _current_versions():
+    """
+    (global CSV version, catalog version or None when no catalog is built)
+    """
+    try:
+        catalog_version = factor_set_version(on=datetime.now(timezone.utc).date())
+    except CatalogUnavailable:
+        catalog_version = None
+
+    return factor_set_version(), catalog_version
+
+
+def _stale_filter(csv_version, catalog_version):
+    """
+    Footprints with stored inputs whose factor version is not the
+    current one for their factor source.
+    """
+    uses_csv = and_(Footprint.region.is_(None), Footprint.activity_date.is_(None))
+
+    stale = [and_(uses_csv, Footprint.factor_version.is_distinct_from(csv_version))]
+
+    if catalog_version is not None:
+        stale.append(and_(~uses_csv, Footprint.factor_version.is_distinct_from(catalog_version)))
+
+    return and_(Footprint.electricity_kwh.is_not(None), or_(*stale))
+
+
+def _recompute_chunk(rows):
+    """
+    Recomputes one chunk with the vectorized calculator, one pass per
+    (region, activity_date). Returns (update parameters, failed rows).
+    """
+    groups = {}
+    for i, row in enumerate(rows):
+        on = row.activity_date
+
+        # Regional footprints stored without a date used that day's factors
+        if on is None and row.region is not None:
+            on = row.created_at.date()
+
+        groups.setdefault((row.region, on), []).append(i)
+
+    params = []
+    failed = 0
+
+    for (region, on), positions in groups.items():
+        inputs = {
+            key: [getattr(rows[i], key) for i in positions]
+            for key in BATCH_INPUT_COLUMNS
+        }
+
+        try:
+            version = factor_set_version(region, on)
+            results = calculate_footprint_batch(inputs, region, on)
+        except ValueError:
+            logger.warning(
+                "Cannot recompute %d footprints for region %s on %s",
+                len(positions), region, on, exc_info=True
+            )
+            failed += len(positions)
+            continue
+
+        columns = {name: np.asarray(results[name]).tolist() for name in OUTPUTS}
+
+        for j, i in enumerate(positions):
+            params.append({
+                "id": rows[i].id,
+                **{name: columns[name][j] for name in OUTPUTS},
+                "activity_date": on,
+                "factor_version": version
+            })
+
+    return params, failed
+
+
+def _resubmit_rankings(db, user_ids, refresher):
+    """
+    Submits the users' latest footprints to the recommendation refresher,
+    so their rankings are recomputed with the new factors.
+    """
+    ranked = (
+        select(
+            Footprint.id,
+            Footprint.user_id,
+            *[getattr(Footprint, key) for key in BATCH_INPUT_COLUMNS],
+            func.row_number().over(
+                partition_by=Footprint.user_id,
+                order_by=(Footprint.created_at.desc(), Footprint.id.desc())
+            ).label("position")
+        )
+        .where(Footprint.user_id.in_(user_ids))
+        .subquery()
+    )
+
+    for row in db.execute(
+        select(ranked).where(ranked.c.position == 1, ranked.c.electricity_kwh.is_not(None))
+    ):
+        refresher.submit(row.user_id, row.id, {key: getattr(row, key) for key in BATCH_INPUT_COLUMNS})
+
+
+def _get_job(db, name, restart):
+    job = db.get(FootprintRecomputeJob, name)
+
+    if job is None:
+        job = FootprintRecomputeJob(name=name, last_id=0, rows_updated=0, rows_failed=0)
+        db.add(job)
+
+    elif restart or job.finished_at is not None:
+        job.last_id = 0
+        job.rows_updated = 0
+        job.rows_failed = 0
+        job.started_at = datetime.now(timezone.utc)
+        job.finished_at = None
+
+    db.commit()
+
+    return job
+
+
+def recompute_footprints(
+    name=DEFAULT_JOB,
+    restart=False,
+    chunk_size=RECOMPUTE_CHUNK_SIZE,
+    window=RECOMPUTE_WINDOW,
+    update_sketches=True,
+    session_factory=SessionLocal,
+    refresher=None
+):
+    """
+    Recomputes footprints whose stored factor version is stale.
+
+    Rows are read in id order through a server-side cursor (yield_per)
+    on one session and updated with executemany UPDATEs on another. Each
+    window of rows is committed together with the job's checkpoint and
+    the affected users' rollups, so no transaction outlives a window and
+    only the rows being updated are locked. Concurrent inserts and reads
+    proceed as usual.
+
+    The window also drops the affected users' stored rankings, and the
+    rollup rebuild bumps their revision, so cached responses and ETags
+    of the old totals stop matching. refresher (a
+    RecommendationRefresher) is sent their latest footprints to rank
+    again; without one they get the fallback recommendations until
+    their next footprint.
+
+    An interrupted job resumes from its checkpoint; restart=True (or a
+    finished job) starts over. Footprints without stored inputs are
+    skipped. Returns the job row.
+    """
+    reader = session_factory()
+    writer = session_factory()
+
+    try:
+        job = _get_job(writer, name, restart)
+        stale = _stale_filter(*_current_versions())
+
+        updated_this_run = 0
+
+        while True:
+            result = reader.execute(
+                select(
+                    Footprint.id,
+                    Footprint.user_id,
+                    *[getattr(Footprint, key) for key in BATCH_INPUT_COLUMNS],
+                    Footprint.region,
+                    Footprint.activity_date,
+                    Footprint.created_at
+                )
+                .where(Footprint.id > job.last_id, stale)
+                .order_by(Footprint.id)
+                .limit(window)
+                .execution_options(yield_per=chunk_size)
+            )
+
+            last_id = None
+            user_ids = set()
+
+            for rows in result.partitions():
+                params, failed = _recompute_chunk(rows)
+
+                if params:
+                    writer.execute(update(Footprint), params)
+
+                job.rows_updated += len(params)
+                job.rows_failed += failed
+                updated_this_run += len(params)
+
+                user_ids.update(row.user_id for row in rows)
+                last_id = rows[-1].id
+
+            # Ends the read transaction before committing the window
+            reader.rollback()
+
+            if last_id is None:
+                break
+
+            job.last_id = last_id
+            user_ids = sorted(user_ids)
+
+            # Rankings were computed with the old factors
+            writer.execute(delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_ids)))
+
+            # Commits the updates, the checkpoint, the rollups and the
+            # dropped rankings together
+            rebuild_rollups(writer, user_ids)
+
+            for user_id in user_ids:
+                response_cache.invalidate_user(user_id)
+
+            if refresher is not None:
+                _resubmit_rankings(writer, user_ids, refresher)
+
+                # Ends the read transaction while the refresher writes
+                writer.rollback()
+
+            logger.info("Recomputed footprints up to id %d (%d updated)", last_id, job.rows_updated)
+
+        job.finished_at = datetime.now(timezone.utc)
+        writer.commit()
+
+        if update_sketches and updated_this_run:
+            rebuild_sketches(writer)
+
+        writer.refresh(job)
+        writer.expunge(job)
+
+        return job
+
+    except Exception:
+        writer.rollback()
+        raise
+
+    finally:
+        reader.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute footprints after emission factor changes")
+    parser.add_argument("--job", default=DEFAULT_JOB, help="checkpoint name")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    parser.add_argument("--chunk-size", type=int, default=RECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--window", type=int, default=RECOMPUTE_WINDOW)
+    parser.add_argument("--skip-sketches", action="store_true", help="do not rebuild percentile sketches")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # None when RECOMMENDATIONS_ML is disabled
+    refresher = get_refresher()
+
+    try:
+        job = recompute_footprints(
+            args.job, args.restart, args.chunk_size, args.window, not args.skip_sketches,
+            refresher=refresher
+        )
+    finally:
+        # Waits for the queued rankings
+        close_refresher()
+
+    print(f"Recomputed {job.rows_updated} footprints ({job.rows_failed} failed), up to id {job.last_id}")
@@ -0,0 +1,140 @@
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import Footprint, UserFootprintRollup
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+
+
+def latest_footprint_id(db, user_id):
+    """
+    Id of the user's latest footprint (by created_at, then id), or None.
+    A single seek on the (user_id, created_at, id) index.
+    """
+    return db.scalar(
+        select(Footprint.id)
+        .where(Footprint.user_id == user_id)
+        .order_by(Footprint.created_at.desc(), Footprint.id.desc())
+        .limit(1)
+    )
+
+
+def latest_footprint_revision(db, user_id):
+    """
+    (latest footprint id, rollup revision) or None without footprints.
+    The revision changes when stored footprints are rewritten (see
+    recompute.py); 0 until the user has a rollup. Still a single seek on
+    the footprint index.
+    """
+    row = db.execute(
+        select(Footprint.id, UserFootprintRollup.revision)
+        .outerjoin(UserFootprintRollup, UserFootprintRollup.user_id == Footprint.user_id)
+        .where(Footprint.user_id == user_id)
+        .order_by(Footprint.created_at.desc(), Footprint.id.desc())
+        .limit(1)
+    ).first()
+
+    if row is None:
+        return None
+
+    return row.id, row.revision or 0
+
+
+def footprint_version(db, user_id):
+    """
+    Version of the user's footprint data, or None without footprints.
+    """
+    latest = latest_footprint_revision(db, user_id)
+
+    if latest is None:
+        return None
+
+    footprint_id, revision = latest
+
+    return f"{footprint_id}.{revision}"
+
+
+def make_etag(version):
+    return f'"fp-{version}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    True when an If-None-Match header value matches etag.
+    """
+    if not if_none_match:
+        return False
+
+    candidates = [value.strip() for value in if_none_match.split(",")]
+
+    # Weak comparison, as required for If-None-Match
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+class ResponseCache:
+    """
+    Bounded, thread-safe LRU of per-user response payloads.
+
+    Each entry remembers the footprint version it was computed for, so
+    a stored or recomputed footprint makes older entries miss without any coordination
+    between workers.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+
+        # user_id -> {endpoint: (version, payload)}, least recent first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, endpoint, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id, {}).get(endpoint)
+
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+
+            return entry[1]
+
+    def put(self, endpoint, user_id, version, payload):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries.setdefault(user_id, {})[endpoint] = (version, payload)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+response_cache = ResponseCache()
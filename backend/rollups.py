@@ -0,0 +1,209 @@
+import argparse
+
+from sqlalchemy import Float, Integer, bindparam, case, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import Footprint, UserFootprintRollup
+
+# Rows written per insert by the repair job
+REBUILD_BATCH_SIZE = 10000
+
+_rollups = UserFootprintRollup.__table__
+
+# Applies a user's new totals on top of the stored rollup in a single
+# statement, so concurrent writers cannot lose each other's updates.
+# SET expressions read the old row, so previous_total gets the old last_total.
+_INCREMENT = (
+    update(_rollups)
+    .where(_rollups.c.user_id == bindparam("b_user_id", type_=Integer))
+    .values(
+        record_count=_rollups.c.record_count + bindparam("b_count", type_=Integer),
+        total_sum=_rollups.c.total_sum + bindparam("b_sum", type_=Float),
+        min_total=case(
+            (_rollups.c.min_total <= bindparam("b_min", type_=Float), _rollups.c.min_total),
+            else_=bindparam("b_min", type_=Float)
+        ),
+        max_total=case(
+            (_rollups.c.max_total >= bindparam("b_max", type_=Float), _rollups.c.max_total),
+            else_=bindparam("b_max", type_=Float)
+        ),
+        previous_total=case(
+            (bindparam("b_count", type_=Integer) > 1, bindparam("b_previous", type_=Float)),
+            else_=_rollups.c.last_total
+        ),
+        last_total=bindparam("b_last", type_=Float),
+        updated_at=func.now()
+    )
+)
+
+
+def _increment_params(user_id, totals):
+    return {
+        "b_user_id": user_id,
+        "b_count": len(totals),
+        "b_sum": sum(totals),
+        "b_min": min(totals),
+        "b_max": max(totals),
+        "b_previous": totals[-2] if len(totals) > 1 else None,
+        "b_last": totals[-1]
+    }
+
+
+def record_footprints(db, totals_by_user):
+    """
+    Folds newly stored footprint totals into the per-user rollups.
+
+    totals_by_user: {user_id: [total, ...]} in insertion order.
+
+    Runs inside the caller's transaction, after the footprint rows are
+    inserted, so the rollups commit together with them. Users without a
+    rollup row get one rebuilt from all their footprints, which also
+    counts those stored before rollups existed.
+    """
+    pending = {user_id: totals for user_id, totals in totals_by_user.items() if totals}
+
+    # Common case: one user who already has a rollup row
+    if len(pending) == 1:
+        (user_id, totals), = pending.items()
+
+        if db.execute(_INCREMENT, _increment_params(user_id, totals)).rowcount:
+            return
+
+    if not pending:
+        return
+
+    existing = set(db.scalars(
+        select(UserFootprintRollup.user_id)
+        .where(UserFootprintRollup.user_id.in_(list(pending)))
+    ))
+
+    if existing:
+        db.execute(_INCREMENT, [
+            _increment_params(user_id, pending[user_id]) for user_id in existing
+        ])
+
+    missing = [user_id for user_id in pending if user_id not in existing]
+
+    if missing:
+        # Locks and rewrites any row a concurrent request creates meanwhile
+        rebuild_rollups(db, missing, commit=False)
+
+
+def get_rollup(db, user_id):
+    return db.get(UserFootprintRollup, user_id)
+
+
+def _rewrite_rollups(db, user_ids):
+    # Lock the rollup rows first: a concurrent record_footprints increment
+    # waits until this transaction commits instead of landing between the
+    # aggregate and the rewrite, where it would be overwritten. A footprint
+    # committed before the lock is counted by the aggregate. (SQLite has no
+    # row locks, but its writer already holds the database write lock.)
+    lock = (
+        select(UserFootprintRollup.user_id, UserFootprintRollup.revision)
+        .order_by(UserFootprintRollup.user_id)
+        .with_for_update()
+    )
+
+    if user_ids is not None:
+        lock = lock.where(UserFootprintRollup.user_id.in_(user_ids))
+
+    # Rewritten rollups get the next revision, new ones start at 0
+    revisions = {user_id: revision + 1 for user_id, revision in db.execute(lock)}
+
+    ranked = select(
+        Footprint.user_id,
+        Footprint.total,
+        func.row_number().over(
+            partition_by=Footprint.user_id,
+            order_by=(Footprint.created_at.desc(), Footprint.id.desc())
+        ).label("position")
+    )
+
+    aggregates = select(
+        Footprint.user_id,
+        func.count(Footprint.id),
+        func.sum(Footprint.total),
+        func.min(Footprint.total),
+        func.max(Footprint.total)
+    ).group_by(Footprint.user_id)
+
+    if user_ids is not None:
+        ranked = ranked.where(Footprint.user_id.in_(user_ids))
+        aggregates = aggregates.where(Footprint.user_id.in_(user_ids))
+
+    ranked = ranked.subquery()
+
+    latest = {}
+    for user_id, position, total in db.execute(
+        select(ranked.c.user_id, ranked.c.position, ranked.c.total)
+        .where(ranked.c.position <= 2)
+    ):
+        latest[(user_id, position)] = total
+
+    rows = [
+        {
+            "user_id": user_id,
+            "record_count": count,
+            "total_sum": total_sum,
+            "min_total": min_total,
+            "max_total": max_total,
+            "last_total": latest[(user_id, 1)],
+            "previous_total": latest.get((user_id, 2)),
+            "revision": revisions.get(user_id, 0)
+        }
+        for user_id, count, total_sum, min_total, max_total in db.execute(aggregates)
+    ]
+
+    if user_ids is None:
+        db.execute(delete(UserFootprintRollup))
+    else:
+        db.execute(delete(UserFootprintRollup).where(UserFootprintRollup.user_id.in_(user_ids)))
+
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        db.execute(insert(UserFootprintRollup), rows[start:start + REBUILD_BATCH_SIZE])
+
+    return len(rows)
+
+
+def rebuild_rollups(db, user_ids=None, commit=True):
+    """
+    Recomputes rollups from the raw footprints, for all users or only
+    user_ids. Aggregates and the last two totals are computed in SQL.
+    Safe to run while footprints are being recorded. Rewritten rollups
+    get a new revision, which invalidates the users' cached responses.
+
+    commit=False leaves the rewrite in the caller's transaction.
+    Returns the number of rollups written.
+    """
+    for _ in range(3):
+        try:
+            with db.begin_nested():
+                written = _rewrite_rollups(db, user_ids)
+            break
+        except IntegrityError:
+            # A concurrent request created a rollup row for a user that had
+            # none; it is locked and rewritten on the next attempt
+            continue
+    else:
+        raise RuntimeError("Could not rebuild footprint rollups")
+
+    if commit:
+        db.commit()
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user footprint rollups")
+    parser.add_argument("--user-id", type=int, action="append", help="limit to these users")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        written = rebuild_rollups(db, args.user_id)
+    finally:
+        db.close()
+
+    print(f"Rebuilt {written} rollups")
@@ -1,4 +1,14 @@
-from carbon_calculator import calculate_total_footprint
+import numpy as np
+
+from carbon_calculator import (
+    calculate_total_footprint,
+    calculate_footprint_batch,
+    load_factor_index,
+    _get_emission_factor
+)
+from metrics import timed
+
+CATEGORIES = ("electricity", "transport", "food", "waste")
 
 
 def apply_action(user_input, action):
@@ -32,10 +42,32 @@ def apply_action(user_input, action):
     return modified_input
 
 
-def simulate_scenario(user_input, actions):
+def describe_action(action):
+    """
+    Short human-readable description of a single action.
+    """
+    action_type = action.get("type")
+
+    if action_type == "reduce_electricity":
+        return f"Reduce electricity use by {action.get('percent', 0)}%"
+
+    elif action_type == "change_transport":
+        return f"Switch to {action.get('new_mode').replace('_', ' ')}"
+
+    elif action_type == "change_diet":
+        return f"Switch to a {action.get('new_diet').replace('_', '-')} diet"
+
+    raise ValueError(f"Unsupported action type: {action_type}")
+
+
+@timed("simulate_scenario")
+def simulate_scenario(user_input, actions, baseline=None):
     """
     Simulates a scenario by applying multiple actions to the user input.
 
+    baseline: optional result of calculate_total_footprint(user_input),
+    passed in to avoid recomputing it when simulating many scenarios.
+
     Returns:
     {
         "before": original_total,
@@ -45,11 +77,12 @@ def simulate_scenario(user_input, actions):
     """
 
     # Calculate original footprint
-    original_result = calculate_total_footprint(user_input)
-    original_total = original_result["total"]
+    if baseline is None:
+        baseline = calculate_total_footprint(user_input)
+    original_total = baseline["total"]
 
-    # Apply all actions sequentially
-    modified_input = user_input.copy()
+    # Apply all actions sequentially (apply_action returns a copy)
+    modified_input = user_input
     for action in actions:
         modified_input = apply_action(modified_input, action)
 
@@ -64,3 +97,113 @@ def simulate_scenario(user_input, actions):
         "after": new_total,
         "reduction": reduction
     }
+
+
+def compile_action_set(actions, index=None):
+    """
+    Reduces a list of actions to its net effect on the footprint inputs:
+    (electricity multiplier, transport factor, diet factor).
+
+    The transport and diet factors are NaN when the set leaves them
+    unchanged. Actions are applied in order, exactly like apply_action,
+    so repeated electricity reductions compound and the last transport
+    or diet change wins.
+    """
+    if index is None:
+        index = load_factor_index()
+
+    electricity_multiplier = 1.0
+    transport_factor = np.nan
+    diet_factor = np.nan
+
+    for action in actions:
+        action_type = action.get("type")
+
+        if action_type == "reduce_electricity":
+            percent = action.get("percent", 0)
+            electricity_multiplier *= (100 - percent) / 100
+
+        elif action_type == "change_transport":
+            transport_factor = _get_emission_factor(
+                "transport", action.get("new_mode"), index
+            )
+
+        elif action_type == "change_diet":
+            diet_factor = _get_emission_factor(
+                "food", action.get("new_diet"), index
+            )
+
+        else:
+            raise ValueError(f"Unsupported action type: {action_type}")
+
+    return electricity_multiplier, transport_factor, diet_factor
+
+
+@timed("evaluate_action_sets")
+def evaluate_action_sets(user_inputs, action_sets):
+    """
+    Evaluates every action set for every user in one vectorized pass.
+
+    user_inputs: DataFrame or dictionary of arrays, as accepted by
+    calculate_footprint_batch (N users).
+    action_sets: list of M action lists, as accepted by simulate_scenario.
+
+    The baseline footprint is computed once per user. Each action set is
+    compiled once and applied to all users as per-category deltas.
+
+    Returns:
+    {
+        "baseline": {category: array (N,)},
+        "deltas": {category: array (N, M)},
+        "before": array (N,),
+        "after": array (N, M),
+        "reduction": array (N, M)
+    }
+    """
+
+    index = load_factor_index()
+
+    baseline = calculate_footprint_batch(user_inputs)
+
+    compiled = np.array(
+        [compile_action_set(actions, index) for actions in action_sets],
+        dtype=float
+    ).reshape(-1, 3)
+
+    electricity_multiplier = compiled[:, 0]
+    transport_factor = compiled[:, 1]
+    diet_factor = compiled[:, 2]
+
+    transport_km = np.asarray(user_inputs["transport_km"], dtype=float)[:, None]
+    meals_per_month = np.asarray(user_inputs["meals_per_month"], dtype=float)[:, None]
+
+    base_electricity = baseline["electricity"][:, None]
+    base_transport = baseline["transport"][:, None]
+    base_food = baseline["food"][:, None]
+
+    # Reductions relative to the baseline, shape (N, M)
+    deltas = {
+        "electricity": base_electricity * (1 - electricity_multiplier),
+        "transport": np.where(
+            np.isnan(transport_factor),
+            0.0,
+            base_transport - transport_km * transport_factor
+        ),
+        "food": np.where(
+            np.isnan(diet_factor),
+            0.0,
+            base_food - meals_per_month * diet_factor
+        ),
+        "waste": np.zeros((len(baseline["total"]), len(compiled)))
+    }
+
+    reduction = sum(deltas[category] for category in CATEGORIES)
+    before = baseline["total"]
+
+    return {
+        "baseline": baseline,
+        "deltas": deltas,
+        "before": before,
+        "after": before[:, None] - reduction,
+        "reduction": reduction
+    }
@@ -0,0 +1,356 @@
+import argparse
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+from sqlalchemy import Integer, String, bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import Footprint, FootprintSketchBucket
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("electricity", "transport", "food", "waste", "total")
+
+# Log-spaced buckets: each bucket spans values within a factor of
+# SKETCH_GAMMA, so a value's bucket is known to within 2% relative error.
+# Bucket 0 holds values below SKETCH_MIN_VALUE (including zero), the last
+# bucket values at or above SKETCH_MAX_VALUE.
+SKETCH_GAMMA = 1.02
+SKETCH_MIN_VALUE = 0.01
+SKETCH_MAX_VALUE = 1e7
+
+NUM_BUCKETS = math.ceil(math.log(SKETCH_MAX_VALUE / SKETCH_MIN_VALUE) / math.log(SKETCH_GAMMA)) + 2
+
+# Seconds between writes of locally recorded counts to the database
+SKETCH_PERSIST_INTERVAL = float(os.getenv("SKETCH_PERSIST_INTERVAL", "30"))
+
+# Footprints read per chunk by the rebuild job
+REBUILD_CHUNK_SIZE = 10000
+
+_buckets = FootprintSketchBucket.__table__
+
+_ADD_COUNT = (
+    update(_buckets)
+    .where(_buckets.c.category == bindparam("b_category", type_=String))
+    .where(_buckets.c.bucket == bindparam("b_bucket", type_=Integer))
+    .values(count=_buckets.c.count + bindparam("b_delta", type_=Integer))
+)
+
+
+def bucket_index(values):
+    """
+    Bucket of each value, as an integer array.
+    """
+    values = np.asarray(values, dtype=float)
+
+    # Also sends NaN to the underflow bucket
+    in_range = values >= SKETCH_MIN_VALUE
+    scaled = np.log(np.where(in_range, values, SKETCH_MIN_VALUE) / SKETCH_MIN_VALUE) / math.log(SKETCH_GAMMA)
+
+    index = np.floor(scaled).astype(np.int64) + 1
+    index[~in_range] = 0
+
+    return np.minimum(index, NUM_BUCKETS - 1)
+
+
+def _histogram(columns):
+    """
+    columns: {category: values}. Returns a (len(CATEGORIES), NUM_BUCKETS)
+    count matrix.
+    """
+    counts = np.zeros((len(CATEGORIES), NUM_BUCKETS), dtype=np.int64)
+
+    for row, category in enumerate(CATEGORIES):
+        counts[row] = np.bincount(bucket_index(columns[category]), minlength=NUM_BUCKETS)
+
+    return counts
+
+
+class PopulationSketch:
+    """
+    Fixed-bucket histograms of every stored footprint, per category and
+    for the total.
+
+    Each process counts the footprints it stores in memory and
+    periodically adds those counts to the footprint_sketch_buckets table,
+    then reloads the table so it also sees other workers' footprints.
+    Counts are only ever added, so workers never overwrite each other.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+
+        # persisted: last counts read from the database
+        # writing: counts being added to the database by persist()
+        # pending: counts recorded here and not yet written
+        self._persisted = np.zeros((len(CATEGORIES), NUM_BUCKETS), dtype=np.int64)
+        self._writing = np.zeros_like(self._persisted)
+        self._pending = np.zeros_like(self._persisted)
+        self._cumulative = None
+        self._loaded = False
+
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, columns):
+        """
+        Records stored footprints. columns: {category: values}.
+        """
+        counts = _histogram(columns)
+
+        with self._lock:
+            self._pending += counts
+            self._cumulative = None
+
+    def add_rows(self, rows):
+        """
+        Records stored footprints given as dictionaries.
+        """
+        self.add({category: [row[category] for row in rows] for category in CATEGORIES})
+
+    def _set_persisted(self, counts, written=False):
+        with self._lock:
+            self._persisted = counts
+
+            # The counts read back include what persist() just wrote
+            if written:
+                self._writing = np.zeros_like(counts)
+
+            self._cumulative = None
+            self._loaded = True
+
+    def _counts(self):
+        return self._persisted + self._writing + self._pending
+
+    def _read(self, db):
+        counts = np.zeros_like(self._persisted)
+        rows = {category: row for row, category in enumerate(CATEGORIES)}
+
+        for category, bucket, count in db.execute(
+            select(_buckets.c.category, _buckets.c.bucket, _buckets.c.count)
+        ):
+            if category in rows and 0 <= bucket < NUM_BUCKETS:
+                counts[rows[category], bucket] = count
+
+        return counts
+
+    def load(self, db):
+        """
+        Replaces the persisted counts with the database's.
+        """
+        self._set_persisted(self._read(db))
+
+    def ensure_loaded(self, db):
+        if self._loaded:
+            return
+
+        # Seeds an empty table from the stored footprints right away,
+        # instead of at the first periodic persist
+        if db.scalar(select(_buckets.c.category).limit(1)) is None:
+            self.persist()
+        else:
+            self.load(db)
+
+    def persist(self):
+        """
+        Adds the pending counts to the database and reloads the merged
+        counts. Pending counts are kept for the next attempt on failure.
+        """
+        with self._persist_lock:
+            with self._lock:
+                delta = self._writing = self._pending
+                self._pending = np.zeros_like(delta)
+
+            db = self._session_factory()
+            try:
+                # A table seeded from the footprints already counts the
+                # ones in delta, which were committed before it was read
+                if _seed_buckets(db):
+                    delta = np.zeros_like(delta)
+
+                params = [
+                    {"b_category": CATEGORIES[row], "b_bucket": int(bucket), "b_delta": int(delta[row, bucket])}
+                    for row, bucket in zip(*np.nonzero(delta))
+                ]
+
+                if params:
+                    db.execute(_ADD_COUNT, params)
+
+                db.commit()
+
+                self._set_persisted(self._read(db), written=True)
+
+            except Exception:
+                db.rollback()
+
+                with self._lock:
+                    self._pending += delta
+                    self._writing = np.zeros_like(delta)
+                    self._cumulative = None
+
+                raise
+
+            finally:
+                db.close()
+
+    def percentile(self, category, value):
+        """
+        Percentage of recorded footprints whose category value is below
+        value, counting half of the value's own bucket.
+
+        Returns (percentile, max_error): the true rank lies within
+        max_error percentage points, the share of footprints that fall in
+        the same bucket. None when nothing has been recorded.
+        """
+        row = CATEGORIES.index(category)
+        index = int(bucket_index([value])[0])
+
+        with self._lock:
+            if self._cumulative is None:
+                self._cumulative = np.cumsum(self._counts(), axis=1)
+            cumulative = self._cumulative
+
+        count = int(cumulative[row, -1])
+
+        if count == 0:
+            return None
+
+        upto = int(cumulative[row, index])
+        below = int(cumulative[row, index - 1]) if index else 0
+        in_bucket = upto - below
+
+        return (
+            100 * (below + in_bucket / 2) / count,
+            100 * (in_bucket / 2) / count
+        )
+
+    def count(self):
+        with self._lock:
+            return int(self._counts()[0].sum())
+
+    # ---------- PERIODIC PERSISTENCE ----------
+
+    def start(self, interval=SKETCH_PERSIST_INTERVAL):
+        """
+        Persists every interval seconds in a daemon thread.
+        """
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.persist()
+                except Exception:
+                    logger.exception("Could not persist footprint sketches")
+
+        self._thread = threading.Thread(target=run, name="sketch-persister", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stops the periodic thread and persists what is still pending.
+        """
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        with self._lock:
+            has_pending = bool(self._pending.any())
+
+        if has_pending:
+            self.persist()
+
+
+def _footprint_histogram(db):
+    """
+    Histograms of the stored footprints, streamed in chunks.
+    Returns (counts, number of footprints).
+    """
+    counts = np.zeros((len(CATEGORIES), NUM_BUCKETS), dtype=np.int64)
+    total = 0
+
+    result = db.execute(
+        select(*[getattr(Footprint, category) for category in CATEGORIES])
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+
+    for chunk in result.partitions():
+        values = np.array(chunk, dtype=float)
+        counts += _histogram({category: values[:, i] for i, category in enumerate(CATEGORIES)})
+        total += len(values)
+
+    return counts, total
+
+
+def _bucket_rows(counts):
+    return [
+        {"category": category, "bucket": bucket, "count": int(counts[row, bucket])}
+        for row, category in enumerate(CATEGORIES)
+        for bucket in range(NUM_BUCKETS)
+    ]
+
+
+def _seed_buckets(db):
+    """
+    Creates the rows the additive updates apply to, once, counting the
+    footprints stored before the sketches existed. Returns True if this
+    call seeded the table.
+
+    Footprints that other workers have counted but not yet persisted
+    when the table is seeded are counted twice; rebuild_sketches gives
+    exact counts.
+    """
+    existing = db.scalar(select(_buckets.c.category).limit(1))
+
+    if existing is not None:
+        return False
+
+    counts, _ = _footprint_histogram(db)
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(_buckets), _bucket_rows(counts))
+    except IntegrityError:
+        # Another worker seeded the table first
+        return False
+
+    return True
+
+
+population_sketch = PopulationSketch()
+
+
+def rebuild_sketches(db):
+    """
+    Recomputes the histograms from the footprints table, streaming it in
+    chunks. Returns the number of footprints counted.
+    """
+    counts, total = _footprint_histogram(db)
+
+    db.execute(delete(_buckets))
+    db.execute(insert(_buckets), _bucket_rows(counts))
+    db.commit()
+
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild footprint percentile sketches")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        counted = rebuild_sketches(db)
+    finally:
+        db.close()
+
+    print(f"Rebuilt sketches from {counted} footprints")
@@ -0,0 +1,20 @@
+from action_optimizer import optimize_action_portfolio
+
+user_input = {
+    "electricity_kwh": 300,
+    "transport_mode": "petrol",
+    "transport_km": 500,
+    "diet_type": "mixed",
+    "meals_per_month": 90,
+    "waste_kg": 20
+}
+
+result = optimize_action_portfolio(user_input, cost="effort", max_actions=2)
+
+print(f"Before: {result['before']:.2f} kg CO2")
+print("Pareto-optimal portfolios (max 2 actions):\n")
+
+for option in result["frontier"]:
+    print(f"Effort {option['effort']:.1f} -> Reduction: {option['reduction']:.2f} kg CO2")
+    for action in option["actions"]:
+        print(f"    {action}")
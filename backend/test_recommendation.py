@@ -1,4 +1,7 @@
+import pandas as pd
+
 from recommendation_engine import recommend_actions
+from ml.predict import encode_surveys, get_feature_columns
 
 user_input = {
     "electricity_kwh": 300,
@@ -9,9 +12,35 @@ user_input = {
     "waste_kg": 20
 }
 
-recommendations = recommend_actions(user_input)
+survey = {
+    "age": 24,
+    "gender": "Female",
+    "education_level": "Undergraduate",
+    "occupation": "Student",
+    "living_situation": "Shared apartment",
+    "electricity_kwh": 300,
+    "weekly_transport_km": 120,
+    "primary_transport_mode": "Two-wheeler",
+    "non_veg_meals_per_week": 4,
+    "food_order_frequency": "3–5",
+    "waste_kg_per_week": 5,
+    "reduce_electricity_habit": "Rarely",
+    "public_transport_habit": "Rarely",
+    "veg_preference_habit": "Sometimes",
+    "plastic_reduction_habit": "Rarely",
+    "waste_segregation": "No",
+    "climate_concern": "Moderately concerned",
+    "past_attempt": "No"
+}
+
+user_input_df = pd.DataFrame(encode_surveys([survey]), columns=get_feature_columns())
+
+recommendations = recommend_actions(user_input, user_input_df)
 
-print("Recommended Actions (ranked by reduction):\n")
+print("Recommended Actions (ranked by score):\n")
 
 for i, rec in enumerate(recommendations, start=1):
-    print(f"{i}. Action: {rec['action']} -> Reduction: {rec['reduction']:.2f} kg CO2")
+    print(
+        f"{i}. Action: {rec['action']} -> Reduction: {rec['reduction']:.2f} kg CO2, "
+        f"Adoption: {rec['adoption_probability']:.2f}"
+    )
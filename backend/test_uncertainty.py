@@ -0,0 +1,32 @@
+from carbon_calculator import load_factor_index
+from uncertainty import footprint_uncertainty
+
+original_input = {
+    "electricity_kwh": 300,
+    "transport_mode": "petrol",
+    "transport_km": 500,
+    "diet_type": "mixed",
+    "meals_per_month": 90,
+    "waste_kg": 20
+}
+
+actions = [
+    {"type": "reduce_electricity", "percent": 20},
+    {"type": "change_transport", "new_mode": "public_transport"},
+    {"type": "change_diet", "new_diet": "veg"}
+]
+
+# Example ranges of +/-20% around every factor
+ranges = {key: (value * 0.8, value, value * 1.2) for key, value in load_factor_index().items()}
+
+result = footprint_uncertainty(original_input, actions, samples=100000, seed=42, ranges=ranges)
+
+print(f"Monte Carlo Footprint ({result['samples']} samples):")
+
+for output in ("total", "after", "reduction"):
+    summary = result["outputs"][output]
+    p = summary["percentiles"]
+    print(
+        f"{output.capitalize()}: {summary['mean']:.2f} kg CO2 "
+        f"(90% interval {p['p5']:.2f} - {p['p95']:.2f})"
+    )
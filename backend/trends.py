@@ -0,0 +1,193 @@
+from datetime import date, datetime
+
+from sqlalchemy import extract, func, literal_column, select
+
+from models import Footprint
+
+BUCKETS = ("day", "week", "month")
+
+CATEGORIES = ("electricity", "transport", "food", "waste", "total")
+
+DEFAULT_WINDOW = 3
+MAX_WINDOW = 52
+
+
+def _bucket_start(dialect, bucket):
+    """
+    SQL expression truncating created_at to the start of its bucket.
+    Weeks start on Monday, as with PostgreSQL's date_trunc.
+    """
+    column = Footprint.created_at
+
+    if dialect == "sqlite":
+        if bucket == "day":
+            return func.date(column)
+        if bucket == "week":
+            return func.date(column, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", column)
+
+    # Inline the unit so the SELECT and GROUP BY expressions are identical
+    return func.date_trunc(literal_column(f"'{bucket}'"), column)
+
+
+def _days(dialect):
+    """
+    SQL expression for created_at as a number of days.
+    """
+    if dialect == "sqlite":
+        return func.julianday(Footprint.created_at)
+
+    return extract("epoch", Footprint.created_at) / 86400.0
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _slope(n, sum_x, sum_xx, sum_y, sum_xy):
+    """
+    Least-squares slope from aggregated sums, None when undefined.
+    """
+    if not n or n < 2:
+        return None
+
+    denominator = n * sum_xx - sum_x * sum_x
+
+    if abs(denominator) < 1e-12:
+        return None
+
+    return (n * sum_xy - sum_x * sum_y) / denominator
+
+
+def footprint_trends(db, user_id, bucket="month", start=None, end=None, window=DEFAULT_WINDOW):
+    """
+    Time-bucketed footprint analytics for one user, computed in the
+    database.
+
+    bucket: "day", "week" or "month"
+    start / end: optional created_at bounds (start inclusive, end exclusive)
+    window: number of buckets in the rolling average
+
+    Per bucket, returns the record count and the average and sum of every
+    category, plus the rolling average of the bucket averages over the
+    last window buckets (a window function over the grouped rows).
+    The trend slope is the least-squares slope of each category against
+    time in kg CO2 per day, fitted over the individual records from
+    aggregated sums, so only one row comes back for it.
+
+    Both queries read the user's rows through the (user_id, created_at)
+    index; no history is loaded into Python.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unsupported bucket: {bucket}")
+
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"window must be between 1 and {MAX_WINDOW}")
+
+    dialect = db.get_bind().dialect.name
+
+    filters = [Footprint.user_id == user_id]
+
+    if start is not None:
+        filters.append(Footprint.created_at >= start)
+
+    if end is not None:
+        filters.append(Footprint.created_at < end)
+
+    columns = {category: getattr(Footprint, category) for category in CATEGORIES}
+
+    # ---------- BUCKETED AGGREGATES ----------
+
+    bucket_start = _bucket_start(dialect, bucket).label("bucket_start")
+
+    grouped = (
+        select(
+            bucket_start,
+            func.count().label("records"),
+            *[func.avg(column).label(f"avg_{name}") for name, column in columns.items()],
+            *[func.sum(column).label(f"sum_{name}") for name, column in columns.items()]
+        )
+        .where(*filters)
+        .group_by(bucket_start)
+        .subquery()
+    )
+
+    rolling = [
+        func.avg(grouped.c[f"avg_{name}"])
+        .over(order_by=grouped.c.bucket_start, rows=(-(window - 1), 0))
+        .label(f"rolling_{name}")
+        for name in CATEGORIES
+    ]
+
+    rows = db.execute(
+        select(grouped, *rolling).order_by(grouped.c.bucket_start)
+    ).mappings().all()
+
+    buckets = [
+        {
+            "bucket_start": _as_date(row["bucket_start"]),
+            "records": row["records"],
+            "average": {name: round(row[f"avg_{name}"], 2) for name in CATEGORIES},
+            "sum": {name: round(row[f"sum_{name}"], 2) for name in CATEGORIES},
+            "rolling_average": {name: round(row[f"rolling_{name}"], 2) for name in CATEGORIES}
+        }
+        for row in rows
+    ]
+
+    # ---------- LEAST-SQUARES SLOPE ----------
+
+    # Days are measured from the first record in range to keep the sums small
+    days = _days(dialect)
+
+    points = (
+        select(
+            (days - func.min(days).over()).label("x"),
+            *[column.label(name) for name, column in columns.items()]
+        )
+        .where(*filters)
+        .subquery()
+    )
+
+    x = points.c.x
+
+    sums = db.execute(
+        select(
+            func.count().label("n"),
+            func.sum(x).label("sum_x"),
+            func.sum(x * x).label("sum_xx"),
+            *[func.sum(points.c[name]).label(f"sum_{name}") for name in CATEGORIES],
+            *[func.sum(x * points.c[name]).label(f"sum_x_{name}") for name in CATEGORIES]
+        )
+    ).mappings().one()
+
+    slopes = {
+        name: _slope(sums["n"], sums["sum_x"], sums["sum_xx"], sums[f"sum_{name}"], sums[f"sum_x_{name}"])
+        for name in CATEGORIES
+    }
+
+    total_slope = slopes["total"]
+
+    if total_slope is None:
+        trend = "insufficient data"
+    elif total_slope > 1e-9:
+        trend = "increasing"
+    elif total_slope < -1e-9:
+        trend = "decreasing"
+    else:
+        trend = "stable"
+
+    return {
+        "bucket": bucket,
+        "window": window,
+        "records": sums["n"],
+        "buckets": buckets,
+        "slope_per_day": {
+            name: round(slope, 6) if slope is not None else None
+            for name, slope in slopes.items()
+        },
+        "trend": trend
+    }
@@ -0,0 +1,364 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from carbon_calculator import BATCH_INPUT_COLUMNS, load_factor_ranges
+from metrics import timed
+from scenario_engine import CATEGORIES, apply_action
+
+DEFAULT_SAMPLES = 10000
+MAX_SAMPLES = 1000000
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Factors are drawn in fixed-size blocks, each from its own child seed,
+# so a seeded run gives the same samples whatever the worker count
+SAMPLE_BLOCK = 16384
+
+# Users x samples evaluated per task, bounding the memory of each worker
+CHUNK_ELEMENTS = 1000000
+
+# NumPy releases the GIL while drawing, multiplying and partitioning large
+# arrays, so threads run these passes on separate cores
+UNCERTAINTY_WORKERS = int(os.getenv("UNCERTAINTY_WORKERS", "0")) or os.cpu_count() or 1
+
+# category -> (quantity column, factor category, sub-category column,
+# fixed sub-category), as used by calculate_footprint_batch
+_CATEGORY_INPUTS = {
+    "electricity": ("electricity_kwh", "electricity", None, "grid"),
+    "transport": ("transport_km", "transport", "transport_mode", None),
+    "food": ("meals_per_month", "food", "diet_type", None),
+    "waste": ("waste_kg", "waste", None, "mixed")
+}
+
+
+# ---------- FACTOR SAMPLES ----------
+
+def _draw_block(ranges, keys, seeds, size):
+    block = np.empty((len(keys), size))
+
+    for row, key, seed in zip(block, keys, seeds):
+        low, mode, high = ranges[key]
+
+        if high > low:
+            row[:] = np.random.default_rng(seed).triangular(low, mode, high, size)
+        else:
+            row[:] = mode
+
+    return block
+
+
+def sample_factors(ranges, samples, seed=None, keys=None, pool=None):
+    """
+    Draws samples values of emission factors from a triangular
+    distribution over (low, mode, high). Factors without a range are
+    constant.
+
+    keys: the factors to draw, defaults to all. Every factor has its own
+    child seed, so its draws do not depend on which others are drawn.
+
+    Returns (keys, matrix, entropy): the drawn keys in sorted order, a
+    (factors, samples) matrix with one row per key, and the seed entropy
+    that reproduces the draw.
+    """
+    all_keys = sorted(ranges)
+    keys = sorted(ranges if keys is None else keys)
+    positions = [all_keys.index(key) for key in keys]
+
+    seed_sequence = np.random.SeedSequence(seed)
+
+    sizes = [SAMPLE_BLOCK] * (samples // SAMPLE_BLOCK)
+    if samples % SAMPLE_BLOCK:
+        sizes.append(samples % SAMPLE_BLOCK)
+
+    jobs = []
+
+    for block_seed, size in zip(seed_sequence.spawn(len(sizes)), sizes):
+        key_seeds = block_seed.spawn(len(all_keys))
+        jobs.append(([key_seeds[position] for position in positions], size))
+
+    def draw(job):
+        return _draw_block(ranges, keys, *job)
+
+    blocks = list(pool.map(draw, jobs)) if pool is not None else [draw(job) for job in jobs]
+
+    return keys, np.concatenate(blocks, axis=1), seed_sequence.entropy
+
+
+# ---------- INPUTS ----------
+
+def _compile(inputs, ranges, n):
+    """
+    Compiles user inputs into {category: (quantities, factor keys,
+    inverse)}, where factor_keys[inverse] is each user's factor.
+    """
+    compiled = {}
+
+    for category, (quantity_column, factor_category, sub_column, fixed) in _CATEGORY_INPUTS.items():
+        quantities = np.broadcast_to(np.asarray(inputs[quantity_column], dtype=float), (n,))
+
+        # Percentiles of a category are scaled factor percentiles
+        if (quantities < 0).any():
+            raise ValueError(f"{quantity_column} must not be negative")
+
+        if sub_column is None:
+            sub_categories = np.full(n, fixed, dtype=object)
+        else:
+            # Scenario actions set a single sub-category for every user
+            sub_categories = np.broadcast_to(
+                np.asarray(inputs[sub_column], dtype=object).astype(str), (n,)
+            )
+
+        values, inverse = np.unique(sub_categories, return_inverse=True)
+
+        factor_keys = [(factor_category, value) for value in values]
+
+        for key in factor_keys:
+            if key not in ranges:
+                raise ValueError(f"No emission factor found for {key[0]} - {key[1]}")
+
+        compiled[category] = (quantities, factor_keys, inverse.reshape(-1))
+
+    return compiled
+
+
+def _factor_rows(compiled, keys):
+    """
+    Replaces each category's factor keys with rows of the sample matrix.
+    """
+    key_rows = {key: row for row, key in enumerate(keys)}
+
+    return {
+        category: (quantities, np.array([key_rows[key] for key in factor_keys], dtype=np.intp)[inverse])
+        for category, (quantities, factor_keys, inverse) in compiled.items()
+    }
+
+
+def _apply_actions(inputs, actions):
+    # Arrays, so apply_action's arithmetic runs for every user at once
+    modified = {key: np.asarray(inputs[key]) for key in BATCH_INPUT_COLUMNS}
+
+    for action in actions:
+        modified = apply_action(modified, action)
+
+    return modified
+
+
+# ---------- SUMMARIES ----------
+
+def _summarize(values, percentiles):
+    """
+    Mean, standard deviation and percentiles of each row of values,
+    which is sorted in place.
+
+    Percentiles interpolate linearly between order statistics, like
+    np.percentile; one sort is several times faster than its multi-kth
+    partition for a handful of percentiles.
+    """
+    values.sort(axis=1)
+
+    positions = np.asarray(percentiles) / 100 * (values.shape[1] - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, values.shape[1] - 1)
+    weight = positions - lower
+
+    low_values = values[:, lower]
+
+    return (
+        values.mean(axis=1),
+        values.std(axis=1),
+        low_values + (values[:, upper] - low_values) * weight
+    )
+
+
+def _total(compiled, factors, start, stop):
+    total = 0.0
+
+    for category in CATEGORIES:
+        quantities, rows = compiled[category]
+        total = total + quantities[start:stop, None] * factors[rows[start:stop]]
+
+    return total
+
+
+def _total_samples(output, before, after, factors, start, stop):
+    """
+    Samples of a total for users start:stop, shape (users, samples).
+    """
+    if output == "total":
+        return _total(before, factors, start, stop)
+
+    if output == "after":
+        return _total(after, factors, start, stop)
+
+    # Before and after use the same factor draws, so the reduction only
+    # reflects uncertainty the actions actually change
+    return _total(before, factors, start, stop) - _total(after, factors, start, stop)
+
+
+@timed("footprint_uncertainty")
+def footprint_uncertainty_batch(
+    user_inputs,
+    samples=DEFAULT_SAMPLES,
+    seed=None,
+    percentiles=DEFAULT_PERCENTILES,
+    actions=None,
+    workers=None,
+    ranges=None
+):
+    """
+    Monte Carlo distribution of every user's footprint under the
+    emission factors' uncertainty ranges.
+
+    user_inputs: DataFrame or dictionary of arrays, as accepted by
+    calculate_footprint_batch (N users)
+    samples: draws per factor, shared by all users
+    seed: makes the draw reproducible; the seed actually used is returned
+    actions: optional simulate_scenario-style action list; adds the
+    distributions of the post-action total and of the reduction
+    workers: threads used for drawing and evaluation
+    ranges: factor ranges, defaults to load_factor_ranges()
+
+    Each factor is drawn once per sample and all categories of a sample
+    use the same draws, so the total keeps the factors' correlation.
+
+    Returns:
+    {
+        "samples": samples,
+        "seed": seed entropy,
+        "percentiles": [percentiles],
+        "outputs": {
+            output: {"mean": array (N,), "std": array (N,),
+                     "percentiles": array (N, P)}
+        }
+    }
+    where output is each category, "total", and with actions "after"
+    and "reduction".
+    """
+    if not 1 <= samples <= MAX_SAMPLES:
+        raise ValueError(f"samples must be between 1 and {MAX_SAMPLES}")
+
+    percentiles = [float(q) for q in percentiles]
+
+    if not percentiles or not all(0 <= q <= 100 for q in percentiles):
+        raise ValueError("percentiles must be between 0 and 100")
+
+    missing = [col for col in BATCH_INPUT_COLUMNS if col not in user_inputs]
+
+    if missing:
+        raise ValueError(f"Batch input is missing columns: {missing}")
+
+    if ranges is None:
+        ranges = load_factor_ranges()
+
+    n = len(user_inputs["electricity_kwh"])
+
+    outputs = list(CATEGORIES) + ["total"]
+
+    if actions:
+        outputs += ["after", "reduction"]
+
+    before = _compile(user_inputs, ranges, n)
+    after = _compile(_apply_actions(user_inputs, actions), ranges, n) if actions else None
+
+    needed = {
+        key
+        for compiled in (before, after) if compiled is not None
+        for _, factor_keys, _ in compiled.values()
+        for key in factor_keys
+    }
+
+    workers = workers or UNCERTAINTY_WORKERS
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    try:
+        keys, factors, entropy = sample_factors(ranges, samples, seed, needed, pool)
+
+        before = _factor_rows(before, keys)
+        after = _factor_rows(after, keys) if after is not None else None
+
+        # A category depends on one factor scaled by the user's quantity,
+        # so its summary is the factor's, scaled
+        factor_summary = _summarize(factors.copy(), percentiles)
+
+        # Totals mix factors and are summarized per user, in chunks
+        totals = outputs[len(CATEGORIES):]
+        chunk = max(1, CHUNK_ELEMENTS // samples)
+
+        tasks = [
+            (output, start, min(start + chunk, n))
+            for start in range(0, n, chunk)
+            for output in totals
+        ]
+
+        def evaluate(task):
+            values = _total_samples(task[0], before, after, factors, task[1], task[2])
+            return _summarize(values, percentiles)
+
+        summaries = list(pool.map(evaluate, tasks)) if pool is not None else [evaluate(task) for task in tasks]
+
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    result = {}
+
+    for category in CATEGORIES:
+        quantities, rows = before[category]
+
+        result[category] = {
+            "mean": quantities * factor_summary[0][rows],
+            "std": quantities * factor_summary[1][rows],
+            "percentiles": quantities[:, None] * factor_summary[2][rows]
+        }
+
+    for output in totals:
+        parts = [summary for task, summary in zip(tasks, summaries) if task[0] == output]
+
+        result[output] = {
+            "mean": np.concatenate([part[0] for part in parts]) if parts else np.empty(0),
+            "std": np.concatenate([part[1] for part in parts]) if parts else np.empty(0),
+            "percentiles": (
+                np.concatenate([part[2] for part in parts])
+                if parts else np.empty((0, len(percentiles)))
+            )
+        }
+
+    return {
+        "samples": samples,
+        "seed": entropy,
+        "percentiles": percentiles,
+        "outputs": result
+    }
+
+
+def footprint_uncertainty(user_input, actions=None, **kwargs):
+    """
+    Single-user version of footprint_uncertainty_batch.
+
+    user_input: dictionary as accepted by calculate_total_footprint
+
+    Returns {"samples", "seed", "outputs": {output: {"mean", "std",
+    "percentiles": {"p5": value, ...}}}}.
+    """
+    batch = footprint_uncertainty_batch(
+        {key: [value] for key, value in user_input.items()},
+        actions=actions,
+        **kwargs
+    )
+
+    labels = [f"p{q:g}" for q in batch["percentiles"]]
+
+    return {
+        "samples": batch["samples"],
+        "seed": batch["seed"],
+        "outputs": {
+            output: {
+                "mean": float(summary["mean"][0]),
+                "std": float(summary["std"][0]),
+                "percentiles": dict(zip(labels, summary["percentiles"][0].tolist()))
+            }
+            for output, summary in batch["outputs"].items()
+        }
+    }
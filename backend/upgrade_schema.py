@@ -0,0 +1,95 @@
+from sqlalchemy import inspect, text
+
+from database import engine
+from models import FOOTPRINT_INPUT_COLUMNS, Base, Footprint, UserFootprintRollup, UserRecommendation
+
+# Columns added to tables that existed before them. create_all creates
+# missing tables but never alters existing ones.
+ADDED_COLUMNS = {
+    Footprint.__table__: FOOTPRINT_INPUT_COLUMNS,
+    UserRecommendation.__table__: ("footprint_id",),
+    UserFootprintRollup.__table__: ("revision",)
+}
+
+# Indexes added to existing tables
+ADDED_INDEXES = tuple(Footprint.__table__.indexes)
+
+
+def missing_columns(bind=engine):
+    """
+    Returns the added columns the database lacks, as (table, column)
+    pairs. Tables that do not exist yet are skipped; create_all makes them
+    complete.
+    """
+    inspector = inspect(bind)
+    missing = []
+
+    for table, columns in ADDED_COLUMNS.items():
+        if not inspector.has_table(table.name):
+            continue
+
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+
+        missing.extend((table, name) for name in columns if name not in present)
+
+    return missing
+
+
+def check_schema(bind=engine):
+    """
+    Raises RuntimeError when the database predates columns the API reads.
+    """
+    missing = missing_columns(bind)
+
+    if missing:
+        names = ", ".join(f"{table.name}.{name}" for table, name in missing)
+        raise RuntimeError(
+            f"Database schema is out of date (missing {names}). "
+            "Run `python upgrade_schema.py` to upgrade it."
+        )
+
+
+def upgrade_schema(bind=engine):
+    """
+    Creates missing tables, adds missing columns and indexes. Safe to run
+    repeatedly. Returns the DDL statements it executed.
+    """
+    Base.metadata.create_all(bind=bind)
+
+    executed = []
+
+    with bind.begin() as connection:
+        for table, name in missing_columns(connection):
+            column = table.c[name]
+            ddl = (
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                f"{column.type.compile(dialect=connection.dialect)}"
+            )
+
+            # Existing rows take the default, so the column can be NOT NULL
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            connection.execute(text(ddl))
+            executed.append(ddl)
+
+        existing = {
+            index["name"]
+            for table in {index.table.name for index in ADDED_INDEXES}
+            for index in inspect(connection).get_indexes(table)
+        }
+
+        for index in ADDED_INDEXES:
+            if index.name not in existing:
+                index.create(connection)
+                executed.append(f"CREATE INDEX {index.name}")
+
+    return executed
+
+
+if __name__ == "__main__":
+    statements = upgrade_schema()
+
+    for statement in statements:
+        print(statement)
+
+    print(f"Schema is up to date ({len(statements)} changes applied)")
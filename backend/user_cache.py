@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect, select
+
+from metrics import timed
+from models import User
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+
+class UserIdCache:
+    """
+    Bounded, thread-safe LRU cache of email -> user id with a TTL.
+
+    Entries are per process, so the TTL bounds how long another worker's
+    change can go unnoticed.
+    """
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, email):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(email)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            user_id, expires_at = entry
+
+            if expires_at <= now:
+                del self._entries[email]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(email)
+            self.hits += 1
+
+            return user_id
+
+    def put(self, email, user_id):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[email] = (user_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(email)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+user_cache = UserIdCache()
+
+
+@timed("user_lookup")
+def resolve_user_id(db, email):
+    """
+    Returns the id of the user with this email, or None if there is none.
+    Only found users are cached.
+    """
+    user_id = user_cache.get(email)
+
+    if user_id is None:
+        user_id = db.scalar(select(User.id).where(User.email == email))
+
+        if user_id is not None:
+            user_cache.put(email, user_id)
+
+    return user_id
+
+
+@timed("user_lookup")
+def resolve_user_ids(db, emails):
+    """
+    Batch version of resolve_user_id: {email: user_id} for the emails that
+    exist, querying only the cache misses in one IN query.
+    """
+    user_ids = {}
+    missing = []
+
+    for email in emails:
+        user_id = user_cache.get(email)
+
+        if user_id is None:
+            missing.append(email)
+        else:
+            user_ids[email] = user_id
+
+    if missing:
+        for user_id, email in db.execute(
+            select(User.id, User.email).where(User.email.in_(missing))
+        ):
+            user_cache.put(email, user_id)
+            user_ids[email] = user_id
+
+    return user_ids
+
+
+# ---------- INVALIDATION ----------
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.email)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_updated_user(mapper, connection, target):
+    # Drop the old address too when the email itself changed
+    for email in inspect(target).attrs.email.history.deleted:
+        user_cache.invalidate(email)
+
+    user_cache.invalidate(target.email)
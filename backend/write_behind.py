@@ -0,0 +1,425 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from database import SessionLocal, _env_flag
+from metrics import time_stage
+from models import FOOTPRINT_INPUT_COLUMNS, Footprint
+from response_cache import response_cache
+from rollups import record_footprints
+from sketches import population_sketch
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- CONFIGURATION ----------
+
+# Queue /calculate footprints and insert them in groups
+WRITE_BEHIND = _env_flag("WRITE_BEHIND")
+
+# A group is flushed after this many milliseconds, or as soon as it
+# holds this many rows
+WRITE_BEHIND_MAX_WAIT_MS = float(os.getenv("WRITE_BEHIND_MAX_WAIT_MS", "50"))
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "500"))
+
+# Durability bound: at most this many computed footprints can be waiting
+# for a commit. Further requests are rejected until the queue drains.
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+# "queued":    respond once the footprint is queued (up to MAX_PENDING rows
+#              can be lost if the process dies)
+# "committed": respond once the group holding the footprint is committed
+DURABILITY_MODES = ("queued", "committed")
+WRITE_BEHIND_DURABILITY = os.getenv("WRITE_BEHIND_DURABILITY", "queued")
+
+# Failed flushes are retried with exponential backoff, then written in
+# halves so only the rows that still fail on their own are dropped
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_RETRY_BACKOFF_MS = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF_MS", "100"))
+
+# Dropped rows are appended here as JSON lines, for replay. In "queued"
+# mode the API has already acknowledged them, so this file is their only
+# copy; set it to an empty string to only log them.
+WRITE_BEHIND_SPILL_PATH = os.getenv(
+    "WRITE_BEHIND_SPILL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "write_behind_spill.jsonl")
+)
+
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """
+    Raised when WRITE_BEHIND_MAX_PENDING footprints are already waiting.
+    """
+
+
+class WriteQueueClosed(Exception):
+    """
+    Raised when a footprint is submitted after close().
+    """
+
+
+class PendingWrite:
+
+    def __init__(self, row, on_commit=None):
+        self.row = row
+        self.on_commit = on_commit
+        self.footprint_id = None
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the footprint is committed. Raises the flush error
+        if it was dropped.
+        """
+        if not self.done.wait(timeout):
+            raise TimeoutError("Footprint was not committed in time")
+
+        if self.error is not None:
+            raise self.error
+
+
+class FootprintWriteQueue:
+    """
+    Write-behind queue for computed footprints.
+
+    Callers submit() a footprint row and return immediately. A single
+    daemon worker thread gathers rows for up to max_wait_ms (or until
+    max_rows rows are queued) and writes each group with one multi-row
+    insert, one rollup update and one commit, instead of one commit per
+    request.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_wait_ms=WRITE_BEHIND_MAX_WAIT_MS,
+        max_rows=WRITE_BEHIND_MAX_ROWS,
+        max_pending=WRITE_BEHIND_MAX_PENDING,
+        max_retries=WRITE_BEHIND_MAX_RETRIES,
+        retry_backoff_ms=WRITE_BEHIND_RETRY_BACKOFF_MS,
+        spill_path=WRITE_BEHIND_SPILL_PATH
+    ):
+        self._session_factory = session_factory
+        self.max_wait = max_wait_ms / 1000
+        self.max_rows = max_rows
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.spill_path = spill_path
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self._submitted = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._rows_written = 0
+        self._retries = 0
+        self._rows_dropped = 0
+        self._split_flushes = 0
+        self._largest_flush = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._closed:
+                raise WriteQueueClosed("Footprint write queue is closed")
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="footprint-writer",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, user_id, result, record=None, on_commit=None):
+        """
+        Queues a footprint computed by calculate_total_footprint.
+
+        record: the request inputs and factor version stored with it
+        (FOOTPRINT_INPUT_COLUMNS); missing ones are stored as null.
+
+        The row is timestamped now, not when it is flushed. Returns a
+        PendingWrite that can be waited on for the commit. on_commit,
+        if given, is called from the worker with the new footprint id
+        once the row is committed.
+        """
+        pending = PendingWrite({
+            "user_id": user_id,
+            "electricity": result["electricity"],
+            "transport": result["transport"],
+            "food": result["food"],
+            "waste": result["waste"],
+            "total": result["total"],
+            **{key: (record or {}).get(key) for key in FOOTPRINT_INPUT_COLUMNS},
+            "created_at": datetime.now(timezone.utc)
+        }, on_commit)
+
+        self._ensure_started()
+
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise WriteQueueFull("Too many footprints waiting to be written")
+
+        with self._lock:
+            self._submitted += 1
+
+        return pending
+
+    def _run(self):
+        stopping = False
+
+        while not stopping:
+            first = self._queue.get()
+
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    pending = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if pending is _STOP:
+                    stopping = True
+                    break
+
+                batch.append(pending)
+
+            self._flush(batch)
+
+        # Drain whatever was queued ahead of the stop marker
+        batch = []
+
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if pending is not _STOP:
+                batch.append(pending)
+
+            if len(batch) >= self.max_rows:
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+    def _write(self, rows):
+        """
+        Inserts and commits one group. Returns the new footprint ids in
+        row order.
+        """
+        totals_by_user = {}
+        for row in rows:
+            totals_by_user.setdefault(row["user_id"], []).append(row["total"])
+
+        db = self._session_factory()
+        try:
+            with time_stage("write_behind_flush"):
+                footprint_ids = db.scalars(
+                    insert(Footprint).returning(Footprint.id, sort_by_parameter_order=True),
+                    rows
+                ).all()
+                record_footprints(db, totals_by_user)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for user_id in totals_by_user:
+            response_cache.invalidate_user(user_id)
+
+        population_sketch.add_rows(rows)
+
+        return footprint_ids
+
+    def _flush(self, batch):
+        rows = [pending.row for pending in batch]
+        error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    self._retries += 1
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+            try:
+                footprint_ids = self._write(rows)
+                error = None
+                break
+            except Exception as exc:
+                error = exc
+                logger.warning(
+                    "Footprint flush of %d rows failed (attempt %d of %d)",
+                    len(rows), attempt + 1, self.max_retries + 1,
+                    exc_info=True
+                )
+
+        with self._lock:
+            self._flushes += 1
+
+        if error is None:
+            self._committed(batch, footprint_ids)
+
+        elif len(batch) > 1:
+            # Usually one bad row (e.g. a deleted user) fails the group
+            logger.warning("Writing the %d footprints of the failed flush in parts", len(batch))
+
+            with self._lock:
+                self._split_flushes += 1
+
+            self._flush_parts(batch)
+
+        else:
+            self._drop(batch[0], error)
+
+        for pending in batch:
+            pending.done.set()
+
+    def _flush_parts(self, batch):
+        """
+        Writes batch in halves, recursively, without retries; rows that
+        fail on their own are dropped.
+        """
+        middle = len(batch) // 2
+
+        for part in (batch[:middle], batch[middle:]):
+            try:
+                footprint_ids = self._write([pending.row for pending in part])
+            except Exception as exc:
+                if len(part) > 1:
+                    self._flush_parts(part)
+                else:
+                    self._drop(part[0], exc)
+                continue
+
+            self._committed(part, footprint_ids)
+
+    def _committed(self, batch, footprint_ids):
+        with self._lock:
+            self._rows_written += len(batch)
+            self._largest_flush = max(self._largest_flush, len(batch))
+
+        for pending, footprint_id in zip(batch, footprint_ids):
+            pending.footprint_id = footprint_id
+
+            if pending.on_commit is None:
+                continue
+
+            try:
+                pending.on_commit(footprint_id)
+            except Exception:
+                logger.exception("Footprint commit callback failed")
+
+    def _drop(self, pending, error):
+        pending.error = error
+
+        with self._lock:
+            self._rows_dropped += 1
+
+        line = json.dumps({"row": pending.row, "error": str(error)}, default=str)
+
+        logger.error("Dropped footprint after failed writes: %s", line)
+
+        if not self.spill_path:
+            return
+
+        try:
+            with self._lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            logger.exception("Could not spill dropped footprint to %s", self.spill_path)
+
+    def metrics(self):
+        """
+        Returns queue-depth, flush and retry counters.
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "flushes": self._flushes,
+                "rows_written": self._rows_written,
+                "average_flush_rows": self._rows_written / self._flushes if self._flushes else 0.0,
+                "largest_flush_rows": self._largest_flush,
+                "retries": self._retries,
+                "split_flushes": self._split_flushes,
+                "rows_dropped": self._rows_dropped
+            }
+
+    def close(self):
+        """
+        Stops accepting footprints and flushes everything already queued.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            # Blocks while the queue is full; the worker is draining it
+            self._queue.put(_STOP)
+            thread.join()
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """
+    Returns the process-wide write queue, creating it on first use, or
+    None when write-behind is disabled.
+    """
+    global _write_queue
+
+    if not WRITE_BEHIND:
+        return None
+
+    if WRITE_BEHIND_DURABILITY not in DURABILITY_MODES:
+        raise ValueError(f"Unsupported write-behind durability: {WRITE_BEHIND_DURABILITY}")
+
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = FootprintWriteQueue()
+
+    return _write_queue
+
+
+def close_write_queue():
+    """
+    Flushes and stops the process-wide write queue, if it was started.
+    """
+    with _write_queue_lock:
+        write_queue = _write_queue
+
+    if write_queue is not None:
+        write_queue.close()
@@ -4,9 +4,15 @@ import API from "./api";
 export const calculateFootprint = (data) =>
   API.post("/calculate", data);
 
-// get user history
-export const getHistory = (email) =>
-  API.get(`/users/${email}/footprints`);
+// get one page of user history, newest first; pass the returned
+// nextCursor as after to load the next (older) page
+export const getHistory = async (email, after) => {
+  const res = await API.get(`/users/${email}/footprints`, {
+    params: { after }
+  });
+
+  return { data: res.data, nextCursor: res.headers["x-next-cursor"] };
+};
 
 // get analytics
 export const getAnalytics = (email) =>
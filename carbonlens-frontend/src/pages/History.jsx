@@ -6,11 +6,19 @@ export default function History(){
 const user = JSON.parse(localStorage.getItem("user"))
 
 const [data,setData]=useState([])
+const [nextCursor,setNextCursor]=useState()
+
+const loadPage=(after)=>{
+getHistory(user.email,after).then(res=>{
+setData(prev=>after ? [...prev,...res.data] : res.data)
+setNextCursor(res.nextCursor)
+})
+}
 
 useEffect(()=>{
 
 if(user){
-getHistory(user.email).then(res=>setData(res.data))
+loadPage()
 }
 
 },[])
@@ -33,6 +41,17 @@ Total footprint: {d.total}
 
 ))}
 
+{nextCursor && (
+
+<button
+onClick={()=>loadPage(nextCursor)}
+className="bg-green-600 text-white px-4 py-2 rounded"
+>
+Load more
+</button>
+
+)}
+
 </div>
 
 )